@@ -0,0 +1,419 @@
+import datetime
+import hashlib
+import textwrap
+import tkinter.font as tkfont
+
+from record_cache import LRUCache
+
+# Print previews of the OPD card, IPD bed head ticket and EPD card. Each card
+# is laid out once into a list of canvas items (text, lines, boxes) and drawn
+# on a single Canvas, instead of building dozens of Labels, and forcing a
+# geometry pass for every dotted line, each time a preview opens. Layouts are
+# cached by (card type, registration number, record version), where the
+# version is a digest of the record, so an edited patient gets a new layout
+# and reopening or reprinting an unchanged one is instant.
+
+CARD_CACHE_SIZE = 64
+
+A4_WIDTH, A4_HEIGHT = 794, 1123  # pixels at ~96 dpi
+
+# tk.Label adds about this much around its text (border + padding).
+_LABEL_PADX = 3
+_LABEL_PADY = 2
+_DOTTED_COLOUR = "#333"
+_SEPARATOR_COLOUR = "#a0a0a0"
+
+_layouts = LRUCache(CARD_CACHE_SIZE, name="card-layouts")
+_fonts = {}
+
+
+def _font(spec):
+    font = _fonts.get(spec)
+    if font is None:
+        font = _fonts[spec] = tkfont.Font(font=spec)
+    return font
+
+
+def text_size(font, text):
+    """
+    Returns the (width, height) in pixels of possibly multi-line text.
+    """
+    f = _font(font)
+    lines = str(text).split("\n")
+    return max(f.measure(line) for line in lines), f.metrics("linespace") * len(lines)
+
+
+def record_version(data):
+    """
+    Returns a short digest of a patient record; it changes whenever any
+    field does.
+    """
+    canonical = repr(sorted((str(k), str(v)) for k, v in data.items()))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+class CardLayout:
+    """
+    A card drawn as canvas items, plus the record it was drawn from (used
+    for printing) and where the preview's Print button goes.
+    """
+
+    def __init__(self, width, height, data):
+        self.width = width
+        self.height = height
+        self.data = data
+        self.items = []  # (canvas create_* suffix, coords, options)
+        self.button_at = (width / 2, height - 60)
+
+    def text(self, x, y, text, font, anchor="nw", **options):
+        """
+        Adds text and returns its (width, height).
+        """
+        self.items.append(("text", (x, y), {"text": str(text), "font": font, "anchor": anchor, "justify": "left", **options}))
+        return text_size(font, text)
+
+    def line(self, x1, y1, x2, y2, **options):
+        self.items.append(("line", (x1, y1, x2, y2), options))
+
+    def box(self, x1, y1, x2, y2, **options):
+        self.items.append(("rectangle", (x1, y1, x2, y2), options))
+
+    def separator(self, x1, x2, y):
+        self.line(x1, y, x2, y, fill=_SEPARATOR_COLOUR)
+
+    def dotted(self, x1, x2, y, min_length=60):
+        self.line(x1, y, x1 + max(x2 - x1, min_length), y, fill=_DOTTED_COLOUR, dash=(6, 4))
+
+    def label(self, x, y, text, font):
+        """
+        Adds text where a tk.Label placed at (x, y) would show it and returns
+        the label's (width, height).
+        """
+        width, height = self.text(x + _LABEL_PADX, y + _LABEL_PADY, text, font)
+        return width + 2 * _LABEL_PADX, height + 2 * _LABEL_PADY
+
+    def grid(self, x, y, cells):
+        """
+        Lays out label cells like Tk's grid: dicts with row, col, text, font
+        and optional padx/pady (before, after) and sticky ("w" or "nw").
+        Returns the grid's height.
+        """
+        sizes = [text_size(c["font"], c["text"]) for c in cells]
+        widths, heights = {}, {}
+        for cell, (w, h) in zip(cells, sizes):
+            padx, pady = cell.get("padx", (0, 0)), cell.get("pady", (0, 0))
+            widths[cell["col"]] = max(widths.get(cell["col"], 0), w + 2 * _LABEL_PADX + sum(padx))
+            heights[cell["row"]] = max(heights.get(cell["row"], 0), h + 2 * _LABEL_PADY + sum(pady))
+        col_x, row_y = {}, {}
+        offset = x
+        for col in range(max(widths) + 1):
+            col_x[col] = offset
+            offset += widths.get(col, 0)
+        offset = y
+        for row in range(max(heights) + 1):
+            row_y[row] = offset
+            offset += heights.get(row, 0)
+        for cell, (w, h) in zip(cells, sizes):
+            padx, pady = cell.get("padx", (0, 0)), cell.get("pady", (0, 0))
+            top = row_y[cell["row"]] + pady[0]
+            if cell.get("sticky", "w") != "nw":
+                top += (heights[cell["row"]] - sum(pady) - h - 2 * _LABEL_PADY) / 2
+            self.text(col_x[cell["col"]] + padx[0] + _LABEL_PADX, top + _LABEL_PADY, cell["text"], cell["font"])
+        return offset - y
+
+    def draw(self, canvas):
+        """
+        Draws the card on a Canvas at least width x height in size.
+        """
+        for kind, coords, options in self.items:
+            getattr(canvas, f"create_{kind}")(*coords, **options)
+
+
+def _cached(card_type, data, build):
+    key = (card_type, str(data.get("registration_number")), record_version(data))
+    return _layouts.get_or_load(key, lambda: build(dict(data)))
+
+
+def opd_card(data):
+    """
+    Returns the layout of an OPD patient card (top third of an A4 page).
+    """
+    return _cached("opd", data, _opd_card)
+
+
+def ipd_bed_head_ticket(data):
+    """
+    Returns the layout of an IPD bed head ticket (A4).
+    """
+    return _cached("ipd", data, _ipd_bed_head_ticket)
+
+
+def epd_card(data):
+    """
+    Returns the layout of an EPD patient card (A4).
+    """
+    return _cached("epd", data, _epd_card)
+
+
+def layout_cache_stats():
+    """
+    Returns hit/miss counters of the card layout cache.
+    """
+    return _layouts.stats()
+
+
+def _opd_card(data):
+    def safe(key, default=""):
+        v = data.get(key, default)
+        return v if v is not None else default
+
+    width, height = A4_WIDTH - 1, A4_HEIGHT - 1
+    card_height = int(height / 3)
+    layout = CardLayout(width, height, data)
+    centre = width / 2
+
+    # --- Header Section ---
+    y = 12
+    y += layout.text(centre, y, "अनुसूची • 6 धर्म संख्या • 10", ("Arial Unicode MS", 10), anchor="n")[1]
+    y += layout.text(centre, y, "श्री राम जानकी मेडिकल कॉलेज एवं अस्पताल समस्तीपुर", ("Arial", 16, "bold"), anchor="n")[1]
+    y += 7
+    y += layout.text(centre, y, "(OPD PATIENT CARD)", ("Arial", 13, "bold"), anchor="n")[1]
+    y += 8
+    layout.separator(10, width - 10, y)
+    y += 2 + 10
+
+    # --- Patient Info Section ---
+    label, value = ("Arial", 11), ("Arial", 11, "bold")
+    cells = [
+        {"row": 0, "col": 0, "text": "Registration No.", "font": label},
+        {"row": 0, "col": 1, "text": safe("registration_number"), "font": value, "padx": (0, 18)},
+        {"row": 0, "col": 2, "text": "Abha No.", "font": label},
+        {"row": 0, "col": 3, "text": safe("abha_number"), "font": value, "padx": (0, 18)},
+        {"row": 0, "col": 4, "text": "Date", "font": label},
+        {"row": 0, "col": 5, "text": safe("registration_date"), "font": value},
+        {"row": 1, "col": 0, "text": "Patient Name:-", "font": label, "pady": (7, 0)},
+        {"row": 1, "col": 1, "text": f"{safe('first_name')} {safe('last_name')}", "font": value,
+         "pady": (7, 0), "padx": (0, 18)},
+        {"row": 1, "col": 2, "text": "Age: ", "font": label},
+        {"row": 1, "col": 3, "text": f"{safe('age')} M/Yrs", "font": value, "pady": (7, 0)},
+    ]
+    row = 2
+    guardian_lines = textwrap.wrap(str(safe("father_name")), 35)
+    cells.append({"row": row, "col": 0, "text": "Father's/Guardian/\nHusband Name: ", "font": label,
+                  "pady": (7, 0), "sticky": "nw"})
+    for idx, line in enumerate(guardian_lines):
+        cells.append({"row": row + idx, "col": 1, "text": line, "font": value, "sticky": "nw",
+                      "pady": (7, 0) if idx == 0 else (0, 0), "padx": (0, 18)})
+    cells.append({"row": row, "col": 2, "text": "Gender: ", "font": label})
+    cells.append({"row": row, "col": 3, "text": safe("gender"), "font": value, "pady": (7, 0)})
+    row += max(1, len(guardian_lines))
+
+    address_lines = textwrap.wrap(" ".join(str(safe(k)) for k in ("address", "town", "state")), 45)
+    cells.append({"row": row, "col": 0, "text": "Address: ", "font": label, "pady": (7, 0), "sticky": "nw"})
+    for idx, line in enumerate(address_lines):
+        cells.append({"row": row + idx, "col": 1, "text": line, "font": value, "sticky": "nw",
+                      "pady": (7, 0) if idx == 0 else (0, 0), "padx": (0, 18)})
+    row += len(address_lines)
+
+    # Mobile and fee always follow the last address line.
+    cells += [
+        {"row": row, "col": 3, "text": "Mobile No: ", "font": label, "padx": (0, 8), "pady": (7, 0)},
+        {"row": row, "col": 4, "text": safe("mobile_number"), "font": value, "pady": (7, 0)},
+        {"row": row + 1, "col": 3, "text": "निबंधन शुल्क: ", "font": label, "padx": (0, 8)},
+        {"row": row + 1, "col": 4, "text": f"₹ {safe('registration_fee', '5.00')}", "font": value},
+    ]
+    y += layout.grid(16, y, cells) + 4
+
+    # --- Weight, BP, PR, Room No. under a thin line ---
+    y += 8
+    layout.separator(10, width - 10, y)
+    y += 2 + 4
+    for text in ("Weight :", "BP :", "PR :", "Room No. :"):
+        if y >= card_height:
+            break
+        y += layout.label(10, y, text, ("Arial", 9))[1]
+
+    # --- Footer Note (always at the bottom) ---
+    note_height = text_size(("Arial", 12, "bold"), "नोट•")[1] + 2 * _LABEL_PADY
+    footer_y = height - 5 - note_height
+    layout.separator(0, width, footer_y - 1)
+    note_width = layout.label(5, footer_y, "नोट•", ("Arial", 12, "bold"))[0]
+    layout.label(5 + note_width + 6, footer_y, "कृपया इस टिकट को हमेशा साथ लावें अन्यथा दवा नहीं मिलेगी ।",
+                 ("Arial Unicode MS", 10))
+    layout.button_at = (centre, (card_height + footer_y) / 2 - 20)
+    return layout
+
+
+def _ipd_bed_head_ticket(data):
+    def val(key, default=""):
+        v = data.get(key, default)
+        return str(v) if v is not None else default
+
+    margin = 36  # about 0.5 inch
+    layout = CardLayout(A4_WIDTH, A4_HEIGHT, data)
+    inner_width = A4_WIDTH - 2 * margin
+    layout.box(margin, margin, A4_WIDTH - margin, A4_HEIGHT - margin, width=2)
+    centre = margin + inner_width / 2
+
+    # Title
+    layout.text(centre, margin + 32, "SRI RAM JANKI MEDICAL COLLEGE & HOSPITAL", ("Helvetica", 18, "bold"), anchor="n")
+    layout.text(centre, margin + 62, "SAMASTIPUR", ("Helvetica", 15, "bold"), anchor="n")
+    layout.text(centre, margin + 87, "BED HEAD TICKET", ("Helvetica", 15, "bold"), anchor="n")
+    layout.line(centre - 150, margin + 112, centre + 150, margin + 112, width=2)
+
+    x_left, x_right, mid = 30, 765, 410
+    font = ("Helvetica", 11)
+    inner_margin = 16
+    right_edge = inner_width
+
+    def field(x, y, text):
+        # Positions are relative to the bordered area, as in the old Label layout.
+        w, h = layout.label(margin + x, margin + y, text, font)
+        return x, w, h
+
+    def dotted(x1, x2, y, h):
+        x2 = min(max(x2, x1 + 60), right_edge)
+        layout.dotted(margin + x1, margin + x2, margin + y + h + 4, min_length=0)
+
+    rows = [
+        # (label, label x, value key or text, value x) per column, then dotted spans
+        ([("Ward:", 0, val("ward"), 60), ("Side:", mid - 10 - x_left, val("side"), mid + 50 - x_left)],
+         lambda v: [(v[0][0] + 90, mid - inner_margin), (v[1][0], v[1][0] + v[1][1] + 230)]),
+        ([("Year: ", 0, val("admission_date")[:4], 45), ("Reg. No.: ", 105, val("registration_number"), 205),
+          ("Bed No.: ", mid - x_left, val("bed_number"), mid + 80 - x_left)],
+         lambda v: [(v[0][0] + 70, x_left + 95 - inner_margin), (v[1][0] - 30, mid - inner_margin),
+                    (v[2][0], v[2][0] + v[2][1] + 180)]),
+        ([("Name: ", 0, f"{val('first_name')} {val('last_name')}", 52), ("Age: ", 250, val("age"), 280),
+          ("Sex: ", 345, val("gender"), 380), ("Religion: ", 450, val("religion"), 530)],
+         lambda v: [(v[0][0] + 90, x_left + 250 - inner_margin), (v[1][0], x_left + 240 - inner_margin),
+                    (v[2][0], x_left + 350 - inner_margin), (v[3][0], v[3][0] + v[3][1] + 130)]),
+        ([("Father’s / Husband’s Name: ", 0, val("father_name"), 200)],
+         lambda v: [(v[0][0] + 220, v[0][0] + v[0][1] + 700)]),
+        ([("Mother’s Name: ", 0, val("mother_name"), 120)],
+         lambda v: [(v[0][0] + 140, v[0][0] + v[0][1] + 700)]),
+        ([("Village/Mohalla: ", 0, val("address"), 135), ("P.O.: ", 280, val("post_office"), 325)],
+         lambda v: [(v[0][0] + 140, x_left + 280 - inner_margin), (v[1][0], v[1][0] + v[1][1] + 300)]),
+        ([("P.S.: ", 0, val("ps"), 50), ("Distt.: ", 200, val("town"), 245)],
+         lambda v: [(v[0][0] + 80, x_left + 200 - inner_margin), (v[1][0], v[1][0] + v[1][1] + 350)]),
+        ([("Date & Time of Admission: ", 0, val("admission_date"), 200),
+          ("Date & Time of Discharge: ", mid - x_left, val("discharge_date"), mid + 190 - x_left)],
+         lambda v: [(v[0][0] + 230, mid - inner_margin), (v[1][0], v[1][0] + v[1][1] + 20)]),
+        ([("Result & Advice: ", 0, val("notes"), 120)],
+         lambda v: [(v[0][0] + 150, v[0][0] + v[0][1] + 700)]),
+    ]
+    y = 130
+    for columns, spans in rows:
+        values = []
+        for label_text, label_x, value_text, value_x in columns:
+            field(x_left + label_x, y, label_text)
+            values.append(field(x_left + value_x, y, value_text))
+        height = max(h for _, _, h in values)
+        for x1, x2 in spans(values):
+            dotted(x1, x2, y, height)
+        y += 22 + 8 + 14
+    y += 24 - 14
+
+    diag_font = ("Helvetica", 11, "bold")
+    for label_text, label_x, key in (
+        ("Diagnosis (a) Provisional", 0, "diagnosis_provisional"),
+        ("(b) Final", 60, "diagnosis_final"),
+        ("(c) ICD X", 60, "diagnosis_icdx"),
+    ):
+        layout.label(margin + x_left + label_x, margin + y, label_text, diag_font)
+        layout.label(margin + x_left + 180, margin + y, val(key), font)
+        y += 18
+    y += 30 - 18
+
+    # --- Clinical Notes Box ---
+    left, top = margin + x_left, margin + y
+    table_width = x_right - x_left - 4 * inner_margin
+    table_height = 230
+    col_notes, col_advice = 130, 420
+    layout.box(left, top, left + table_width, top + table_height, width=2)
+    layout.line(left, top + 32, left + table_width, top + 32, width=2)
+    layout.line(left + col_notes, top, left + col_notes, top + table_height, width=2)
+    layout.line(left + col_advice, top, left + col_advice, top + table_height, width=2)
+    table_font = ("Helvetica", 12, "bold")
+    layout.text(left + 8, top + 16, "Date", table_font, anchor="w")
+    layout.text(left + col_notes + 8, top + 16, "Clinical Notes", table_font, anchor="w")
+    layout.text(left + col_advice + 8, top + 16, "Advice", table_font, anchor="w")
+    layout.button_at = (centre, top + table_height + 20)
+    return layout
+
+
+def _epd_card(data):
+    def safe(key):
+        val = data.get(key)
+        return "" if val is None or str(val).strip().lower() in ("", "none", "null", "n/a") else str(val)
+
+    def safe_date(key):
+        val = data.get(key)
+        if hasattr(val, "strftime"):
+            return val.strftime("%d/%m/%Y")
+        val = str(val or "")
+        if len(val) >= 10 and "-" in val and "/" not in val:
+            try:
+                return datetime.datetime.strptime(val[:10], "%Y-%m-%d").strftime("%d/%m/%Y")
+            except ValueError:
+                return val
+        return val
+
+    width, height = A4_WIDTH - 1, A4_HEIGHT - 1
+    pad = 32
+    layout = CardLayout(width, height, data)
+    centre = width / 2
+
+    # --- Header ---
+    y = pad + 10
+    y += layout.text(centre, y, "SRI RAM JANKI MEDICAL COLLEGE & HOSPITAL", ("Arial", 22, "bold"), anchor="n")[1]
+    y += layout.text(centre, y, "MUZAFFARPUR", ("Arial", 16, "bold"), anchor="n")[1] + 4
+    y += layout.text(centre, y, "EPD PATIENT CARD", ("Arial", 16, "bold", "underline"), anchor="n")[1] + 18
+
+    # --- Patient Info Section ---
+    left = [
+        ("Reg. No.:", safe("registration_number")),
+        ("Name:", f"{safe('first_name')} {safe('last_name')}".strip()),
+        ("Father's/Husband's Name:", safe("father_name")),
+        ("Address:", safe("address")),
+        ("Town:", safe("town")),
+        ("Date:", safe_date("date")),
+    ]
+    right = [
+        ("Age:", safe("age")),
+        ("Gender:", safe("gender")),
+        ("Mobile:", safe("mobile_number")),
+        ("Department:", safe("medical_department")),
+        ("State:", safe("state")),
+        ("Attending Doctor:", safe("attending_doctor")),
+    ]
+    bold, plain = ("Arial", 12, "bold"), ("Arial", 12)
+    cells = []
+    for i, ((l_label, l_value), (r_label, r_value)) in enumerate(zip(left, right)):
+        cells += [
+            {"row": i, "col": 0, "text": l_label, "font": bold, "padx": (2, 2), "pady": (3, 3)},
+            {"row": i, "col": 1, "text": l_value, "font": plain, "padx": (2, 2), "pady": (3, 3)},
+            {"row": i, "col": 2, "text": r_label, "font": bold, "padx": (16, 16), "pady": (3, 3)},
+            {"row": i, "col": 3, "text": r_value, "font": plain, "padx": (2, 2), "pady": (3, 3)},
+        ]
+    y += layout.grid(pad + 22, y, cells) + 12
+
+    # --- Table for Clinical Notes: a header and 7 empty rows ---
+    y += 18
+    x1, x2 = pad + 2, width - pad - 2
+    char_width = _font(plain).measure("0")
+    natural = [chars * char_width + 2 * _LABEL_PADX for chars in (20, 54, 22)]
+    extra = max(0, (x2 - x1) - sum(natural)) / 3
+    row_height = text_size(bold, "Ag")[1] + 2 * _LABEL_PADY
+    col_x = [x1]
+    for w in natural:
+        col_x.append(col_x[-1] + w + extra)
+    for row in range(8):
+        top = y + row * row_height
+        for col in range(3):
+            layout.box(col_x[col], top, col_x[col + 1], top + row_height)
+    for col, text in enumerate(("Date/Time", "Clinical Notes", "Advice")):
+        layout.text((col_x[col] + col_x[col + 1]) / 2, y + row_height / 2, text, bold, anchor="center")
+    y += 8 * row_height + 18
+
+    layout.button_at = (centre, y + 24)
+    return layout
@@ -0,0 +1,387 @@
+import collections
+import contextlib
+import logging
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionUnavailableError(Exception):
+    """
+    Raised when no database connection can be created or checked out in time.
+    """
+
+
+class _Slot:
+    __slots__ = ("conn", "created_at", "last_used", "checked_out_at", "owner", "stack", "leak_reported",
+                 "statements")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+        self.checked_out_at = None
+        self.owner = None
+        self.stack = None
+        self.leak_reported = False
+        self.statements = collections.OrderedDict()  # SQL text -> prepared cursor
+
+
+class PreparedCursor:
+    """
+    Cursor handed out by lease(prepared=True). Each distinct SQL text runs on
+    its own prepared cursor cached on the connection, so repeated lookups skip
+    the parse/plan step. Results are read eagerly, which keeps cached cursors
+    free of unread rows between calls.
+    """
+
+    def __init__(self, pool, slot, dictionary=False):
+        self._pool = pool
+        self._slot = slot
+        self._dictionary = dictionary
+        self._rows = collections.deque()
+        self.rowcount = -1
+        self.lastrowid = None
+        self.column_names = ()
+
+    def execute(self, sql, params=()):
+        cursor = self._pool._statement(self._slot, sql)
+        cursor.execute(sql, tuple(params or ()))
+        self.rowcount = cursor.rowcount
+        self.lastrowid = getattr(cursor, "lastrowid", None)
+        self._rows.clear()
+        if cursor.description:
+            self.column_names = tuple(cursor.column_names)
+            rows = cursor.fetchall()
+            if self._dictionary:
+                rows = [dict(zip(self.column_names, row)) for row in rows]
+            self._rows.extend(rows)
+        else:
+            self.column_names = ()
+        return self
+
+    def fetchone(self):
+        return self._rows.popleft() if self._rows else None
+
+    def fetchmany(self, size=1):
+        return [self._rows.popleft() for _ in range(min(size, len(self._rows)))]
+
+    def fetchall(self):
+        rows = list(self._rows)
+        self._rows.clear()
+        return rows
+
+    def __iter__(self):
+        while self._rows:
+            yield self._rows.popleft()
+
+    def close(self):
+        # The underlying prepared cursors stay cached on the connection.
+        self._rows.clear()
+
+
+class PooledConnection:
+    """
+    Proxy handed out by ConnectionPool.acquire(). Behaves like the underlying
+    connection, except close() returns it to the pool.
+    """
+
+    def __init__(self, pool, slot):
+        self._pool = pool
+        self._slot = slot
+
+    def __getattr__(self, name):
+        slot = self.__dict__.get("_slot")
+        if slot is None:
+            raise AttributeError(f"connection already returned to pool ({name})")
+        return getattr(slot.conn, name)
+
+    def close(self):
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            self._pool._release(slot)
+
+    def discard(self):
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            self._pool._release(slot, discard=True)
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of DB-API connections.
+
+    - Per-thread affinity: a thread gets back the connection it used last when
+      that connection is idle, keeping its session and page cache warm.
+    - Pre-ping: connections idle longer than ping_after seconds are checked
+      before being handed out and silently replaced if dead.
+    - Stats: checkout latency (avg/p95/max), waits, timeouts, affinity hits.
+    - Leak detector: leases held longer than leak_after seconds are logged
+      once with the stack that checked them out.
+    - Statement cache: lease(prepared=True) keeps up to statement_cache_size
+      prepared cursors per connection, keyed by SQL text (LRU).
+    """
+
+    def __init__(self, factory, max_size=8, timeout=5.0, ping_after=30.0, leak_after=30.0, name="db",
+                 statement_cache_size=64):
+        self._factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.leak_after = leak_after
+        self.name = name
+        self.statement_cache_size = statement_cache_size
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []
+        self._in_use = set()
+        self._size = 0
+        self._local = threading.local()
+        self._latencies = collections.deque(maxlen=1000)
+        self._closed = False
+        self._counters = collections.Counter()
+
+    # -- checkout / return -------------------------------------------------
+
+    def acquire(self):
+        """
+        Checks out a connection, waiting up to `timeout` seconds.
+        Raises ConnectionUnavailableError on failure.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        slot = None
+        create = False
+        with self._cond:
+            if self._closed:
+                raise ConnectionUnavailableError(f"pool '{self.name}' is closed")
+            waited = False
+            while True:
+                slot = self._take_idle()
+                if slot is not None:
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise ConnectionUnavailableError(
+                        f"pool '{self.name}' exhausted ({self.max_size} connections in use)"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+            if waited:
+                self._counters["waits"] += 1
+
+        if create:
+            slot = self._create_slot()
+        elif time.monotonic() - slot.last_used > self.ping_after and not self._ping(slot):
+            self._drop(slot)
+            self._reserve()
+            slot = self._create_slot()
+
+        slot.checked_out_at = time.monotonic()
+        slot.owner = threading.current_thread().name
+        slot.stack = traceback.extract_stack(limit=8)[:-2]
+        slot.leak_reported = False
+        with self._cond:
+            self._in_use.add(slot)
+            self._counters["checkouts"] += 1
+            self._latencies.append(slot.checked_out_at - started)
+        self._local.slot = slot
+        self._check_leaks()
+        return PooledConnection(self, slot)
+
+    def _take_idle(self):
+        preferred = getattr(self._local, "slot", None)
+        if preferred is not None and preferred in self._idle:
+            self._idle.remove(preferred)
+            self._counters["affinity_hits"] += 1
+            return preferred
+        if self._idle:
+            return self._idle.pop()
+        return None
+
+    def _reserve(self):
+        with self._cond:
+            self._size += 1
+
+    def _create_slot(self):
+        try:
+            conn = self._factory()
+        except Exception as e:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise ConnectionUnavailableError(f"could not open database connection: {e}") from e
+        with self._cond:
+            self._counters["created"] += 1
+        return _Slot(conn)
+
+    def _ping(self, slot):
+        try:
+            slot.conn.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logger.warning(f"Pool '{self.name}': dropping dead connection ({e})")
+            with self._cond:
+                self._counters["ping_failures"] += 1
+            return False
+
+    def _statement(self, slot, sql):
+        cache = slot.statements
+        cursor = cache.get(sql)
+        if cursor is not None:
+            cache.move_to_end(sql)
+            with self._cond:
+                self._counters["statement_cache_hits"] += 1
+            return cursor
+        cursor = slot.conn.cursor(prepared=True)
+        cache[sql] = cursor
+        evicted = cache.popitem(last=False)[1] if len(cache) > self.statement_cache_size else None
+        with self._cond:
+            self._counters["statement_cache_misses"] += 1
+            if evicted is not None:
+                self._counters["statement_cache_evictions"] += 1
+        if evicted is not None:
+            evicted.close()
+        return cursor
+
+    def _close_statements(self, slot):
+        statements, slot.statements = slot.statements, collections.OrderedDict()
+        for cursor in statements.values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+    def _drop(self, slot):
+        self._close_statements(slot)
+        try:
+            slot.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._counters["discarded"] += 1
+            self._cond.notify()
+
+    def _release(self, slot, discard=False):
+        held = time.monotonic() - (slot.checked_out_at or time.monotonic())
+        if held > self.leak_after and not slot.leak_reported:
+            logger.warning(
+                f"Pool '{self.name}': connection held {held:.1f}s by {slot.owner}, checked out at:\n"
+                + "".join(traceback.format_list(slot.stack or []))
+            )
+            with self._cond:
+                self._counters["leaks_reported"] += 1
+        slot.checked_out_at = None
+        slot.stack = None
+        slot.last_used = time.monotonic()
+        with self._cond:
+            self._in_use.discard(slot)
+            keep = not (discard or self._closed)
+            if keep:
+                self._idle.append(slot)
+                self._cond.notify()
+        if not keep:
+            self._drop(slot)
+
+    # -- lease API ---------------------------------------------------------
+
+    @contextlib.contextmanager
+    def lease(self, dictionary=False, prepared=False, wrap=None):
+        """
+        `with pool.lease() as cur:` checks out a connection and yields a cursor.
+        Commits on success, rolls back on error, and always returns the
+        connection to the pool. With prepared=True the cursor reuses the
+        connection's cached prepared statements; wrap(cursor), if given,
+        returns the object actually yielded (e.g. an instrumented cursor).
+        """
+        pooled = self.acquire()
+        cursor = None
+        try:
+            if prepared:
+                cursor = PreparedCursor(self, pooled._slot, dictionary=dictionary)
+            else:
+                cursor = pooled.cursor(dictionary=dictionary)
+            if wrap is not None:
+                cursor = wrap(cursor)
+            yield cursor
+            pooled.commit()
+        except BaseException:
+            try:
+                pooled.rollback()
+            except Exception:
+                if cursor is not None:
+                    cursor.close()
+                    cursor = None
+                pooled.discard()
+                raise
+            raise
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+            pooled.close()
+
+    # -- diagnostics -------------------------------------------------------
+
+    def _check_leaks(self):
+        now = time.monotonic()
+        with self._cond:
+            suspects = [
+                s for s in self._in_use
+                if s.checked_out_at and not s.leak_reported and now - s.checked_out_at > self.leak_after
+            ]
+            for s in suspects:
+                s.leak_reported = True
+            self._counters["leaks_reported"] += len(suspects)
+        for s in suspects:
+            logger.warning(
+                f"Pool '{self.name}': possible connection leak, held {now - s.checked_out_at:.1f}s "
+                f"by {s.owner}, checked out at:\n" + "".join(traceback.format_list(s.stack or []))
+            )
+
+    def stats(self):
+        """
+        Returns pool counters and checkout latency in milliseconds.
+        """
+        with self._cond:
+            latencies = sorted(self._latencies)
+            stats = dict(self._counters)
+            stats.update(size=self._size, idle=len(self._idle), in_use=len(self._in_use), max_size=self.max_size)
+        for key in ("checkouts", "created", "waits", "timeouts", "affinity_hits",
+                    "ping_failures", "discarded", "leaks_reported", "statement_cache_hits",
+                    "statement_cache_misses", "statement_cache_evictions"):
+            stats.setdefault(key, 0)
+        lookups = stats["statement_cache_hits"] + stats["statement_cache_misses"]
+        if lookups:
+            stats["statement_cache_hit_rate"] = stats["statement_cache_hits"] / lookups
+        if latencies:
+            stats["checkout_avg_ms"] = 1000 * sum(latencies) / len(latencies)
+            stats["checkout_p95_ms"] = 1000 * latencies[int(0.95 * (len(latencies) - 1))]
+            stats["checkout_max_ms"] = 1000 * latencies[-1]
+        return stats
+
+    def close(self):
+        """
+        Closes idle connections; leased ones are closed when returned.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for slot in idle:
+            self._close_statements(slot)
+            try:
+                slot.conn.close()
+            except Exception:
+                pass
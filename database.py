@@ -1 +1,1821 @@
+import os
+import re
+import json
+import zlib
+import base64
+import contextlib
+import concurrent.futures
+import datetime
+import logging
+import queue
+import threading
+import time
 
+import utils as ut
+import sqlite_backend
+import migrations
+import name_index
+import patient_directory
+
+from connection_pool import ConnectionPool, ConnectionUnavailableError
+from record_cache import LRUCache
+from query_stats import QueryStats, InstrumentedCursor, call_site_tag
+
+try:
+    import mysql.connector
+    from mysql.connector.constants import ClientFlag
+except ImportError:
+    mysql = None  # only the SQLite backend is available
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass  # fall back to plain environment variables
+
+logging.basicConfig(filename="patient_app.log", level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "mysql" (hospital server) or "sqlite" (standalone satellite clinic / laptop)
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").strip().lower()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", "3306")),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASS", ""),
+    "database": os.getenv("DB_NAME", "new_db"),
+}
+# Sized for the UI thread plus background search, listing, import and report work.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))
+DB_LEASE_WARN_AFTER = float(os.getenv("DB_LEASE_WARN_AFTER", "30"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "64"))
+SQLITE_PATH = os.getenv("SQLITE_PATH", "hms.sqlite3")
+SESSION_TIMEOUT = int(os.getenv("SESSION_TIMEOUT", "1800"))
+# EXPLAIN the busiest queries at shutdown and log full table scans.
+QUERY_PLAN_CHECK = os.getenv("QUERY_PLAN_CHECK", "0") == "1"
+
+# Optional read replica for search, listing, report and medicine-table reads:
+# DB_READ_HOST (MySQL) or SQLITE_READ_PATH (SQLite). Unset DB_READ_* values
+# fall back to the primary's. Reads stay on the primary for
+# DB_READ_YOUR_WRITES seconds after this workstation writes, and for
+# DB_READ_RETRY_AFTER seconds after the replica could not be reached.
+DB_READ_CONFIG = {
+    "host": os.getenv("DB_READ_HOST") or DB_CONFIG["host"],
+    "port": int(os.getenv("DB_READ_PORT") or DB_CONFIG["port"]),
+    "user": os.getenv("DB_READ_USER") or DB_CONFIG["user"],
+    "password": os.getenv("DB_READ_PASS") or DB_CONFIG["password"],
+    "database": os.getenv("DB_READ_NAME") or DB_CONFIG["database"],
+}
+SQLITE_READ_PATH = os.getenv("SQLITE_READ_PATH", "")
+READ_REPLICA_ENABLED = bool(SQLITE_READ_PATH if DB_BACKEND == "sqlite" else os.getenv("DB_READ_HOST"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", str(DB_POOL_SIZE)))
+DB_READ_YOUR_WRITES = float(os.getenv("DB_READ_YOUR_WRITES", "5"))
+DB_READ_RETRY_AFTER = float(os.getenv("DB_READ_RETRY_AFTER", "30"))
+
+# Full patient rows keyed by (patient type, registration number). The TTL
+# bounds staleness from edits made on other workstations.
+PATIENT_CACHE_SIZE = int(os.getenv("PATIENT_CACHE_SIZE", "1000"))
+PATIENT_CACHE_TTL = float(os.getenv("PATIENT_CACHE_TTL", "300"))
+
+# Fuzzy (trigram) name matching: minimum similarity 0-1, and how many best
+# matches per patient type a fuzzy search keeps after the other filters.
+FUZZY_NAME_THRESHOLD = float(os.getenv("FUZZY_NAME_THRESHOLD", "0.3"))
+FUZZY_NAME_CANDIDATES = int(os.getenv("FUZZY_NAME_CANDIDATES", "500"))
+# Trigrams in more index rows than this ("kum", "mar") are left out of the
+# candidate scan where the similarity threshold allows.
+FUZZY_GRAM_MAX_ROWS = int(os.getenv("FUZZY_GRAM_MAX_ROWS", "20000"))
+
+# SQLite has no row estimates to read, so estimated counts count through
+# the indexes and stop here; larger results report this many.
+COUNT_ESTIMATE_CAP = int(os.getenv("COUNT_ESTIMATE_CAP", "100000"))
+
+# Streaming searches over a date range spanning several years query each
+# yearly partition on its own connection, this many at a time (1 = off).
+PARTITION_FANOUT_WORKERS = int(os.getenv("PARTITION_FANOUT_WORKERS", "4"))
+# Of those, how many one search may use, so a broad search leaves room for others.
+PARTITION_FANOUT_PER_SEARCH = int(os.getenv("PARTITION_FANOUT_PER_SEARCH", "2"))
+
+# Rows per executemany batch in the add_*_patients_bulk imports.
+BULK_INSERT_BATCH_SIZE = int(os.getenv("BULK_INSERT_BATCH_SIZE", "500"))
+
+# First year that gets its own partition when the tables are created.
+FIRST_PARTITION_YEAR = 2020
+
+PATIENT_TABLES = {"opd": "OPD_Patients", "ipd": "IPD_Patients", "epd": "EPD_Patients"}
+PATIENT_DATE_COLUMNS = sqlite_backend.PARTITIONED_TABLES
+
+OPD_COLUMNS = (
+    "registration_number", "first_name", "last_name", "father_name", "abha_number",
+    "age", "gender", "mobile_number", "email", "address", "post_office", "town",
+    "state", "registration_fee", "payment_status", "registration_date",
+    "medical_department", "created_by",
+)
+IPD_COLUMNS = (
+    "registration_number", "first_name", "last_name", "father_name", "abha_number",
+    "age", "gender", "mobile_number", "email", "address", "post_office", "town",
+    "state", "medical_department", "police_case", "bed_number", "room_number",
+    "admission_date", "discharge_date", "notes", "created_by",
+)
+EPD_COLUMNS = (
+    "registration_number", "first_name", "last_name", "father_name", "abha_number",
+    "age", "gender", "mobile_number", "email", "address", "post_office", "town",
+    "state", "medical_department", "police_case", "emergency_type", "arrival_mode",
+    "arrival_datetime", "triage_level", "attending_doctor", "discharge_datetime",
+    "outcome", "notes", "date", "created_by",
+)
+
+_pool = None
+_read_pool = None
+_pool_lock = threading.Lock()
+_primary_reads_until = 0.0  # time.monotonic() deadlines
+_replica_down_until = 0.0
+_sqlite_ready = False
+_patient_cache = LRUCache(PATIENT_CACHE_SIZE, ttl=PATIENT_CACHE_TTL, name="patients")
+_patient_changes = 0  # patient writes from this workstation; see patient_change_count()
+_patient_changes_lock = threading.Lock()
+_query_stats = QueryStats()
+_fuzzy_cache = LRUCache(64, ttl=30, name="fuzzy-names")  # one search's chunks reuse its matches
+_gram_cache = LRUCache(4096, ttl=600, name="name-grams")  # trigram -> index rows
+_NAME_COLUMNS = {"first_name", "last_name", "father_name"}
+_fanout_executor = None
+_partition_cache = LRUCache(8, ttl=300, name="partitions")
+
+
+def _partition_years():
+    return range(FIRST_PARTITION_YEAR, datetime.date.today().year + 2)
+
+
+def _connect_mysql():
+    if mysql is None:
+        raise RuntimeError("mysql-connector-python is not installed")
+    # FOUND_ROWS makes an UPDATE's rowcount the rows matched, as on SQLite,
+    # so an update that leaves a row unchanged still counts it.
+    return mysql.connector.connect(**DB_CONFIG, client_flags=[ClientFlag.FOUND_ROWS])
+
+
+def _connect_sqlite():
+    global _sqlite_ready
+    conn = sqlite_backend.connect(SQLITE_PATH)
+    if not _sqlite_ready:
+        with _pool_lock:
+            if not _sqlite_ready:
+                sqlite_backend.enable_wal(conn)
+                migrations.migrate(conn, "sqlite", _partition_years())
+                _sqlite_ready = True
+    return conn
+
+
+def _connect_mysql_read():
+    if mysql is None:
+        raise RuntimeError("mysql-connector-python is not installed")
+    conn = mysql.connector.connect(**DB_READ_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute("SET SESSION TRANSACTION READ ONLY")
+    cursor.close()
+    return conn
+
+
+def _connect_sqlite_read():
+    conn = sqlite_backend.connect(SQLITE_READ_PATH)
+    conn.raw.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def get_pool():
+    """
+    Returns the process-wide connection pool for the configured backend.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _connect_sqlite if DB_BACKEND == "sqlite" else _connect_mysql,
+                    max_size=DB_POOL_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    ping_after=DB_POOL_PING_AFTER,
+                    leak_after=DB_LEASE_WARN_AFTER,
+                    name=DB_BACKEND,
+                    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                )
+    return _pool
+
+
+def get_read_pool():
+    """
+    Returns the read replica pool, or None when no replica is configured.
+    """
+    global _read_pool
+    if not READ_REPLICA_ENABLED:
+        return None
+    if _read_pool is None:
+        with _pool_lock:
+            if _read_pool is None:
+                _read_pool = ConnectionPool(
+                    _connect_sqlite_read if DB_BACKEND == "sqlite" else _connect_mysql_read,
+                    max_size=DB_READ_POOL_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    ping_after=DB_POOL_PING_AFTER,
+                    leak_after=DB_LEASE_WARN_AFTER,
+                    name=f"{DB_BACKEND}-read",
+                    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                )
+    return _read_pool
+
+
+def read_from_primary(seconds=None):
+    """
+    Sends readonly leases to the primary for the next `seconds` (default
+    DB_READ_YOUR_WRITES), so a screen refreshed right after a save sees it
+    even if the replica lags. Writes through lease() call this automatically.
+    """
+    global _primary_reads_until
+    if seconds is None:
+        seconds = DB_READ_YOUR_WRITES
+    _primary_reads_until = max(_primary_reads_until, time.monotonic() + seconds)
+
+
+def _pool_for(readonly):
+    now = time.monotonic()
+    if readonly and READ_REPLICA_ENABLED and now >= _primary_reads_until and now >= _replica_down_until:
+        return get_read_pool()
+    return get_pool()
+
+
+@contextlib.contextmanager
+def lease(dictionary=False, prepared=False, tag=None, readonly=False):
+    """
+    `with lease() as cur:` borrows a pooled connection and yields a cursor.
+    Commits when the block exits normally, rolls back on an exception and
+    always returns the connection. Raises ConnectionUnavailableError when no
+    connection can be obtained.
+
+    prepared=True reuses the connection's cached prepared statements; use it
+    for small, hot lookups that run the same SQL text over and over.
+
+    Every statement is timed and counted under `tag`, which defaults to the
+    calling feature (e.g. "ReportingFrame._query_report"); see query_stats().
+
+    readonly=True marks a lease that only reads and may tolerate a few
+    seconds of lag; it goes to the read replica when one is configured.
+    """
+    global _replica_down_until
+    tag = tag or call_site_tag()
+    pool = _pool_for(readonly)
+    options = dict(
+        dictionary=dictionary, prepared=prepared,
+        wrap=lambda cursor: InstrumentedCursor(cursor, _query_stats, tag),
+    )
+    with contextlib.ExitStack() as stack:
+        try:
+            cursor = stack.enter_context(pool.lease(**options))
+        except ConnectionUnavailableError as e:
+            if pool is get_pool():
+                raise
+            logger.warning(f"Read replica unavailable, reading from primary for {DB_READ_RETRY_AFTER:.0f}s: {e}")
+            _replica_down_until = time.monotonic() + DB_READ_RETRY_AFTER
+            pool = get_pool()
+            cursor = stack.enter_context(pool.lease(**options))
+        yield cursor
+        if cursor.wrote and pool is get_pool():
+            read_from_primary()
+
+
+def get_db_connection():
+    """
+    Returns a pooled connection, or None on failure. Callers must close() it,
+    which returns it to the pool. Prefer lease() in new code.
+    """
+    try:
+        return get_pool().acquire()
+    except Exception as e:
+        logger.error(f"Error getting database connection: {e}")
+        return None
+
+
+def pool_stats(read=False):
+    """
+    Returns connection pool counters, checkout latency (ms) and prepared
+    statement cache hits/misses; read=True reports the replica pool ({} when
+    none is configured).
+    """
+    if read:
+        pool = get_read_pool()
+        return pool.stats() if pool is not None else {}
+    return get_pool().stats()
+
+
+def query_stats():
+    """
+    Returns per call-site statement counts, latency (avg/max ms), rows and
+    latency histograms. Slow statements are also written to SLOW_QUERY_LOG.
+    """
+    return _query_stats.snapshot()
+
+
+_TABLE_ALIAS_RE = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!WHERE|JOIN|LEFT|INNER|ON|GROUP|ORDER|LIMIT|UNION)(\w+))?", re.I)
+_CTE_NAME_RE = re.compile(r"(?:\bWITH(?:\s+RECURSIVE)?|,)\s*(\w+)\s+AS\s*\(", re.I)
+# Tables small enough that scanning them is expected.
+_SCAN_OK_TABLES = {"users", "medicines", "registration_counters", "schema_migrations"}
+
+
+def _full_scans(cursor, sql, params):
+    """
+    EXPLAINs one statement and returns [(table, plan detail)] for every
+    full table or index scan (a scan of all partitions on MySQL). Unfiltered
+    "newest N" listings that walk an index and stop at LIMIT are not scans.
+    """
+    top_n = re.search(r"\bLIMIT\b", sql, re.I) and not re.search(r"\bWHERE\b", sql, re.I)
+    scans = []
+    if DB_BACKEND == "sqlite":
+        aliases = {}
+        for table, alias in _TABLE_ALIAS_RE.findall(sql):
+            aliases[table.lower()] = table
+            if alias:
+                aliases[alias.lower()] = table
+        for name in _CTE_NAME_RE.findall(sql):
+            aliases.pop(name.lower(), None)
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        for row in cursor.fetchall():
+            detail = row["detail"]
+            if top_n and "USING" in detail:
+                continue
+            if not detail.startswith("SCAN "):
+                continue
+            # Derived tables (the LIMITed "page_N" subqueries), CTEs,
+            # "(subquery-N)" and CONSTANT ROW are not stored tables.
+            table = aliases.get(detail.split()[1].lower())
+            if table is not None:
+                scans.append((table, detail))
+    else:
+        cursor.execute("EXPLAIN " + sql, params)
+        for row in cursor.fetchall():
+            if row.get("type") == "ALL" or (row.get("type") == "index" and not top_n):
+                detail = f"type={row['type']} key={row.get('key')} rows={row.get('rows')} partitions={row.get('partitions')}"
+                scans.append((row.get("table"), detail))
+    return [(table, detail) for table, detail in scans if str(table).lower() not in _SCAN_OK_TABLES]
+
+
+def check_query_plans(limit=10):
+    """
+    EXPLAINs the SELECTs run at the `limit` busiest call sites this session
+    and logs each one that scans a whole patient or medicine table. Returns
+    a list of {tag, table, plan, sql} dicts.
+    """
+    findings = []
+    for tag, sql, params in _query_stats.hot_statements(limit):
+        try:
+            with lease(dictionary=True, tag="database.check_query_plans") as cursor:
+                scans = _full_scans(cursor, sql, params)
+        except Exception as e:
+            logger.warning(f"Could not EXPLAIN query from {tag}: {e}")
+            continue
+        statement = " ".join(sql.split())
+        for table, plan in scans:
+            logger.warning(f"Full scan of {table} by {tag}: {plan} | {statement}")
+            findings.append({"tag": tag, "table": table, "plan": plan, "sql": statement})
+    return findings
+
+
+def close_pool():
+    """
+    Closes idle pooled connections; call on application exit.
+    """
+    global _pool, _read_pool
+    if QUERY_PLAN_CHECK and _pool is not None:
+        check_query_plans()
+    with _pool_lock:
+        pool, _pool = _pool, None
+        read_pool, _read_pool = _read_pool, None
+    if read_pool is not None:
+        logger.info(f"Read replica pool stats at shutdown: {read_pool.stats()}")
+        read_pool.close()
+    if pool is not None:
+        logger.info(f"Connection pool stats at shutdown: {pool.stats()}")
+        _query_stats.log_summary()
+        pool.close()
+
+
+def _to_db_date(value):
+    """
+    Normalises DD/MM/YYYY strings and date objects to YYYY-MM-DD.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%Y-%m-%d")
+    value = str(value).strip()
+    if "/" in value:
+        return ut.convert_to_db_date_format(value)
+    return value
+
+
+def _execute_write(sql, params):
+    try:
+        with lease() as cursor:
+            cursor.execute(sql, params)
+        return True
+    except Exception as e:
+        logger.error(f"Database write failed: {e}")
+        return False
+
+
+def _fetch_one(sql, params=(), dictionary=True, prepared=False, readonly=False):
+    try:
+        with lease(dictionary=dictionary, prepared=prepared, readonly=readonly) as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()
+    except Exception as e:
+        logger.error(f"Database read failed: {e}")
+        return None
+
+
+def _fetch_all(sql, params=(), dictionary=True, prepared=False, readonly=False):
+    try:
+        with lease(dictionary=dictionary, prepared=prepared, readonly=readonly) as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+    except Exception as e:
+        logger.error(f"Database read failed: {e}")
+        return []
+
+
+# ---------------------------------------------------------------------------
+# Schema
+# ---------------------------------------------------------------------------
+
+def create_tables():
+    """
+    Applies pending schema migrations (see migrations.py) and creates the
+    default admin account.
+    """
+    if DB_BACKEND != "sqlite":  # SQLite files are migrated on first connect
+        conn = get_db_connection()
+        if not conn:
+            return False
+        try:
+            migrations.migrate(conn, DB_BACKEND, _partition_years())
+        except Exception as e:
+            logger.error(f"Error migrating schema: {e}")
+            return False
+        finally:
+            conn.close()
+        # Tables stop at the partitions they were created with; keep this
+        # and next year's rows out of pmax so date searches can prune.
+        this_year = datetime.date.today().year
+        for year in (this_year, this_year + 1):
+            add_year_partition(year)
+    if not get_user_by_username("admin"):
+        add_user("admin", "admin123", "admin")
+    return True
+
+
+def schema_version():
+    """
+    Returns the highest applied schema migration, or None on failure.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        return max(migrations.applied_versions(conn), default=0)
+    except Exception as e:
+        logger.error(f"Error reading schema version: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def add_year_partition(year):
+    """
+    Splits the yearly partition for `year` out of the pmax catch-all of
+    every patient table that does not have it yet (see partition.mdb).
+    SQLite tables are not partitioned; nothing to do.
+    """
+    if DB_BACKEND == "sqlite":
+        return True
+    conn = get_db_connection()
+    if not conn:
+        return False
+    year = int(year)
+    try:
+        cursor = conn.cursor()
+        try:
+            for table in PATIENT_DATE_COLUMNS:
+                if f"p{year}" in migrations.partition_names(cursor, table):
+                    continue
+                cursor.execute(
+                    f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO "
+                    f"(PARTITION p{year} VALUES LESS THAN ({year + 1}), {migrations.CATCHALL_PARTITION})"
+                )
+        finally:
+            cursor.close()
+        _partition_cache.clear()
+        return True
+    except Exception as e:
+        logger.error(f"Error adding partition {year}: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Users and sessions
+# ---------------------------------------------------------------------------
+
+def _hash_password(password):
+    import bcrypt
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+
+def add_user(username, password, role="user"):
+    """
+    Creates a user. Returns (success, message).
+    """
+    if get_user_by_username(username):
+        return False, f"User '{username}' already exists."
+    if not _execute_write(
+        "INSERT INTO users (username, password_hash, plain_password, role) VALUES (%s, %s, %s, %s)",
+        (username, _hash_password(password), password, role),
+    ):
+        return False, "Failed to add user. Check database connection."
+    logger.info(f"Added user {username} ({role})")
+    return True, "User added successfully."
+
+
+def delete_user(username):
+    """
+    Deletes a user (the built-in admin cannot be deleted). Returns (success, message).
+    """
+    if username == "admin":
+        return False, "The default admin account cannot be deleted."
+    if not get_user_by_username(username):
+        return False, f"User '{username}' not found."
+    if not _execute_write("DELETE FROM users WHERE username = %s", (username,)):
+        return False, "Failed to delete user. Check database connection."
+    return True, "User deleted successfully."
+
+
+def get_all_users():
+    """
+    Returns all users as dicts (username, role, created_at, sections_allowed).
+    """
+    return _fetch_all(
+        "SELECT username, role, created_at, sections_allowed FROM users ORDER BY username"
+    )
+
+
+def get_user_by_username(username):
+    """
+    Returns the full user row as a dict, or None.
+    """
+    return _fetch_one("SELECT * FROM users WHERE username = %s", (username,), prepared=True)
+
+
+def update_user_sections(username, sections):
+    """
+    Stores the tabs a user may open as a comma-separated list.
+    """
+    return _execute_write(
+        "UPDATE users SET sections_allowed = %s WHERE username = %s",
+        (",".join(sections), username),
+    )
+
+
+def authenticate_user(username, password):
+    """
+    Verifies credentials and claims the single login session.
+    Returns True, False, or "already_logged_in".
+    """
+    import bcrypt
+    user = get_user_by_username(username)
+    if not user:
+        return False
+    try:
+        if not bcrypt.checkpw(password.encode("utf-8"), user["password_hash"].encode("utf-8")):
+            return False
+    except ValueError:
+        return False
+
+    now = datetime.datetime.now()
+    expired_before = now - datetime.timedelta(seconds=SESSION_TIMEOUT)
+    try:
+        with lease() as cursor:
+            # Atomic claim: only succeeds if no live session holds the account.
+            cursor.execute(
+                "UPDATE users SET is_logged_in = 1, last_login = %s "
+                "WHERE username = %s AND (is_logged_in = 0 OR last_login IS NULL OR last_login < %s)",
+                (now, username, expired_before),
+            )
+            claimed = cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"Error during login for {username}: {e}")
+        return False
+    return True if claimed else "already_logged_in"
+
+
+def logout_user(username):
+    """
+    Releases the user's login session. Returns False if the user does not exist.
+    """
+    if not get_user_by_username(username):
+        return False
+    return _execute_write("UPDATE users SET is_logged_in = 0 WHERE username = %s", (username,))
+
+
+def save_cash_in_hand(username, amount, date=None):
+    """
+    Records the user's cash in hand; only the first entry per day is kept.
+    """
+    date = _to_db_date(date) or datetime.date.today().strftime("%Y-%m-%d")
+    existing = _fetch_one(
+        "SELECT id FROM user_cash_log WHERE username = %s AND date = %s", (username, date)
+    )
+    if existing:
+        return False
+    return _execute_write(
+        "INSERT INTO user_cash_log (username, date, cash_in_hand) VALUES (%s, %s, %s)",
+        (username, date, amount),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Patients
+# ---------------------------------------------------------------------------
+
+def _reserve_registration_numbers(patient_type, count):
+    """
+    Allocates `count` consecutive registration numbers for 'opd', 'ipd' or
+    'epd' with a single counter update. Returns a list, or None on failure.
+    """
+    year = datetime.date.today().year
+    for _attempt in range(3):
+        try:
+            with lease() as cursor:
+                cursor.execute(
+                    "UPDATE registration_counters SET last_value = last_value + %s "
+                    "WHERE patient_type = %s AND year = %s",
+                    (count, patient_type, year),
+                )
+                if cursor.rowcount == 0:
+                    cursor.execute(
+                        "INSERT INTO registration_counters (patient_type, year, last_value) VALUES (%s, %s, %s)",
+                        (patient_type, year, count),
+                    )
+                cursor.execute(
+                    "SELECT last_value FROM registration_counters WHERE patient_type = %s AND year = %s",
+                    (patient_type, year),
+                )
+                last = cursor.fetchone()[0]
+            return [f"{patient_type.upper()}{year}{value:06d}" for value in range(last - count + 1, last + 1)]
+        except ConnectionUnavailableError as e:
+            logger.error(f"Error allocating registration number: {e}")
+            return None
+        except Exception as e:
+            # Another desk created this year's counter first; retry the update.
+            logger.warning(f"Retrying registration number allocation: {e}")
+    return None
+
+
+def get_next_registration_number(patient_type):
+    """
+    Allocates the next registration number for 'opd', 'ipd' or 'epd',
+    e.g. OPD2025000042. Returns None on failure.
+    """
+    patient_type = patient_type.lower()
+    if patient_type not in PATIENT_TABLES:
+        return None
+    numbers = _reserve_registration_numbers(patient_type, 1)
+    return numbers[0] if numbers else None
+
+
+def _patient_type_of(table):
+    return next(t for t, name in PATIENT_TABLES.items() if name == table)
+
+
+# Defaults the add_*_patient signatures apply, for rows passed to the bulk variants.
+_PATIENT_DEFAULTS = {
+    "opd": {"registration_fee": 5.0, "payment_status": "Paid"},
+    "ipd": {"police_case": "No"},
+    "epd": {"police_case": "No"},
+}
+_PATIENT_COLUMNS = {"opd": OPD_COLUMNS, "ipd": IPD_COLUMNS, "epd": EPD_COLUMNS}
+
+
+def _patient_values(patient_type, values):
+    """
+    Returns a copy of values with the date columns normalised to YYYY-MM-DD;
+    a missing visit date defaults to today.
+    """
+    values = dict(values)
+    today = datetime.date.today().strftime("%Y-%m-%d")
+    date_column = PATIENT_DATE_COLUMNS[PATIENT_TABLES[patient_type]]
+    values[date_column] = _to_db_date(values.get(date_column)) or today
+    if patient_type == "ipd":
+        values["discharge_date"] = _to_db_date(values.get("discharge_date"))
+    return values
+
+
+def _name_index_entry(patient_type, values):
+    return (
+        patient_type, values["registration_number"],
+        values.get("first_name"), values.get("last_name"), values.get("father_name"),
+    )
+
+
+def _directory_row(patient_type, values):
+    return patient_directory.row(patient_type, values, PATIENT_DATE_COLUMNS[PATIENT_TABLES[patient_type]])
+
+
+def index_patient(cursor, patient_type, values):
+    """
+    Adds a patient to the directory and the fuzzy/phonetic name indexes.
+    Call it inside the lease that inserts the row when writing a patient
+    table directly; values is a dict of the row's columns.
+    """
+    patient_type = patient_type.lower()
+    date_column = PATIENT_DATE_COLUMNS[PATIENT_TABLES[patient_type]]
+    values = dict(values, **{date_column: _to_db_date(values.get(date_column))})
+    cursor.execute(patient_directory.INSERT_SQL, _directory_row(patient_type, values))
+    name_index.add_names(cursor, [_name_index_entry(patient_type, values)])
+
+
+def _insert_patient(table, columns, values):
+    placeholders = ", ".join(["%s"] * len(columns))
+    patient_type = _patient_type_of(table)
+    try:
+        with lease() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                tuple(values[c] for c in columns),
+            )
+            cursor.execute(patient_directory.INSERT_SQL, _directory_row(patient_type, values))
+            name_index.add_names(cursor, [_name_index_entry(patient_type, values)])
+    except Exception as e:
+        logger.error(f"Database write failed: {e}")
+        return None
+    _patient_changed(patient_type, values["registration_number"], names=True)
+    logger.info(f"Added {table} patient {values['registration_number']}")
+    return values["registration_number"]
+
+
+def add_opd_patient(registration_number, first_name, last_name, father_name, abha_number,
+                    age, gender, mobile_number, email, address, post_office, town, state,
+                    registration_fee=5.0, payment_status="Paid", registration_date=None,
+                    medical_department=None, created_by=None):
+    """
+    Inserts an OPD patient. Returns the registration number, or None.
+    """
+    return _insert_patient("OPD_Patients", OPD_COLUMNS, _patient_values("opd", locals()))
+
+
+def add_ipd_patient(registration_number, first_name, last_name, father_name, abha_number,
+                    age, gender, mobile_number, email, address, post_office, town, state,
+                    medical_department, police_case="No", bed_number=None, room_number=None,
+                    admission_date=None, discharge_date=None, notes=None, created_by=None):
+    """
+    Inserts an IPD patient. Returns the registration number, or None.
+    """
+    return _insert_patient("IPD_Patients", IPD_COLUMNS, _patient_values("ipd", locals()))
+
+
+def add_epd_patient(registration_number, first_name, last_name, father_name, abha_number,
+                    age, gender, mobile_number, email, address, post_office, town, state,
+                    medical_department, police_case="No", emergency_type=None, arrival_mode=None,
+                    arrival_datetime=None, triage_level=None, attending_doctor=None,
+                    discharge_datetime=None, outcome=None, notes=None, date=None, created_by=None):
+    """
+    Inserts an EPD (emergency) patient. Returns the registration number, or None.
+    """
+    return _insert_patient("EPD_Patients", EPD_COLUMNS, _patient_values("epd", locals()))
+
+
+def _insert_patients_bulk(patient_type, rows, batch_size):
+    table = PATIENT_TABLES[patient_type]
+    columns = _PATIENT_COLUMNS[patient_type]
+    defaults = _PATIENT_DEFAULTS[patient_type]
+    values = []
+    for row in rows:
+        row = {c: row.get(c) for c in columns}
+        for column, default in defaults.items():
+            if row[column] is None:
+                row[column] = default
+        values.append(_patient_values(patient_type, row))
+
+    outcomes = [None] * len(values)
+    unnumbered = [v for v in values if not v["registration_number"]]
+    if unnumbered:
+        numbers = _reserve_registration_numbers(patient_type, len(unnumbered)) or [None] * len(unnumbered)
+        for v, number in zip(unnumbered, numbers):
+            v["registration_number"] = number
+
+    pending = []
+    seen = set()
+    for i, v in enumerate(values):
+        number = v["registration_number"]
+        if number is None:
+            outcomes[i] = (None, "Could not allocate a registration number")
+        elif number in seen:
+            outcomes[i] = (number, f"Duplicate registration_number {number} in import")
+        else:
+            seen.add(number)
+            pending.append(i)
+
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    try:
+        with lease() as cursor:
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+                numbers = [values[i]["registration_number"] for i in batch]
+                cursor.execute(
+                    f"SELECT registration_number FROM {table} "
+                    f"WHERE registration_number IN ({', '.join(['%s'] * len(numbers))})",
+                    numbers,
+                )
+                existing = {row[0] for row in cursor.fetchall()}
+                fresh = []
+                for i in batch:
+                    number = values[i]["registration_number"]
+                    if number in existing:
+                        outcomes[i] = (number, f"Duplicate registration_number {number}")
+                    else:
+                        fresh.append(i)
+                if not fresh:
+                    continue
+                # Savepoints keep everything in one transaction; a failed batch
+                # is replayed row by row so only the offending rows are rejected.
+                cursor.execute("SAVEPOINT bulk_batch")
+                try:
+                    cursor.executemany(sql, [tuple(values[i][c] for c in columns) for i in fresh])
+                    cursor.executemany(
+                        patient_directory.INSERT_SQL, [_directory_row(patient_type, values[i]) for i in fresh]
+                    )
+                    name_index.add_names(cursor, [_name_index_entry(patient_type, values[i]) for i in fresh])
+                    for i in fresh:
+                        outcomes[i] = (values[i]["registration_number"], None)
+                    continue
+                except Exception as e:
+                    logger.warning(f"Bulk insert into {table} failed, retrying row by row: {e}")
+                    cursor.execute("ROLLBACK TO SAVEPOINT bulk_batch")
+                for i in fresh:
+                    number = values[i]["registration_number"]
+                    cursor.execute("SAVEPOINT bulk_row")
+                    try:
+                        cursor.execute(sql, tuple(values[i][c] for c in columns))
+                        cursor.execute(patient_directory.INSERT_SQL, _directory_row(patient_type, values[i]))
+                        name_index.add_names(cursor, [_name_index_entry(patient_type, values[i])])
+                        outcomes[i] = (number, None)
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO SAVEPOINT bulk_row")
+                        outcomes[i] = (number, str(e))
+    except Exception as e:
+        logger.error(f"Bulk insert into {table} rolled back: {e}")
+        outcomes = [
+            (v["registration_number"], str(e)) if outcome is None or outcome[1] is None else outcome
+            for v, outcome in zip(values, outcomes)
+        ]
+
+    for number, error in outcomes:
+        if error is None:
+            _patient_changed(patient_type, number, names=True)
+    added = sum(1 for outcome in outcomes if outcome[1] is None)
+    logger.info(f"Bulk added {added} of {len(outcomes)} {table} patients")
+    return outcomes
+
+
+def add_opd_patients_bulk(rows, batch_size=BULK_INSERT_BATCH_SIZE):
+    """
+    Inserts many OPD patients in one transaction, batch_size rows per
+    executemany. Each row is a dict of add_opd_patient's arguments; rows
+    without a registration number get one allocated. Returns one
+    (registration_number, error) tuple per row, error None when inserted.
+    """
+    return _insert_patients_bulk("opd", rows, batch_size)
+
+
+def add_ipd_patients_bulk(rows, batch_size=BULK_INSERT_BATCH_SIZE):
+    """
+    IPD counterpart of add_opd_patients_bulk.
+    """
+    return _insert_patients_bulk("ipd", rows, batch_size)
+
+
+def add_epd_patients_bulk(rows, batch_size=BULK_INSERT_BATCH_SIZE):
+    """
+    EPD counterpart of add_opd_patients_bulk.
+    """
+    return _insert_patients_bulk("epd", rows, batch_size)
+
+
+def _update_patient_row(table, allowed_columns, registration_number, fields, date_column=None, date_value=None):
+    updates = {k: v for k, v in fields.items() if k in allowed_columns and k != "registration_number"}
+    if not updates:
+        return False
+    sql = f"UPDATE {table} SET {', '.join(f'{k} = %s' for k in updates)} WHERE registration_number = %s"
+    params = list(updates.values()) + [registration_number]
+    if date_column and date_value:
+        # Include the partition key so MySQL prunes to a single partition.
+        sql += f" AND {date_column} = %s"
+        params.append(date_value)
+    patient_type = _patient_type_of(table)
+    source_columns = patient_directory.source_columns(PATIENT_DATE_COLUMNS[table])
+    try:
+        with lease() as cursor:
+            cursor.execute(sql, params)
+            if cursor.rowcount == 0:
+                logger.warning(f"No {table} patient {registration_number} to update")
+                return False
+            if updates.keys() & set(source_columns):
+                # Copy the row as stored into the directory and name indexes.
+                cursor.execute(
+                    f"SELECT {', '.join(source_columns)} FROM {table} WHERE registration_number = %s",
+                    (registration_number,),
+                )
+                row = cursor.fetchone()
+                if row:
+                    values = dict(zip(source_columns, row))
+                    cursor.execute(
+                        patient_directory.UPDATE_SQL,
+                        patient_directory.update_params(patient_type, values, PATIENT_DATE_COLUMNS[table]),
+                    )
+                    if updates.keys() & _NAME_COLUMNS:
+                        name_index.index_names(
+                            cursor, *_name_index_entry(patient_type, values), replace=True
+                        )
+    except Exception as e:
+        logger.error(f"Database write failed: {e}")
+        return False
+    _patient_changed(patient_type, registration_number, names=bool(updates.keys() & _NAME_COLUMNS))
+    return True
+
+
+def update_patient(registration_number, registration_date, **fields):
+    """
+    Updates an OPD patient. registration_date (YYYY-MM-DD) is the partition
+    key and is not changed.
+    """
+    fields.pop("registration_date", None)
+    return _update_patient_row(
+        "OPD_Patients", OPD_COLUMNS, registration_number, fields,
+        "registration_date", _to_db_date(registration_date),
+    )
+
+
+def update_ipd_patient(registration_number, **fields):
+    """
+    Updates an IPD patient by registration number.
+    """
+    for key in ("admission_date", "discharge_date"):
+        if key in fields:
+            fields[key] = _to_db_date(fields[key])
+    return _update_patient_row("IPD_Patients", IPD_COLUMNS, registration_number, fields)
+
+
+def update_epd_patient(registration_number, **fields):
+    """
+    Updates an EPD patient by registration number.
+    """
+    if "date" in fields:
+        fields["date"] = _to_db_date(fields["date"])
+    return _update_patient_row("EPD_Patients", EPD_COLUMNS, registration_number, fields)
+
+
+def get_patient(patient_type, registration_number):
+    """
+    Returns the full 'opd', 'ipd' or 'epd' patient row as a dict, or None.
+    Rows are served from an LRU cache that the add/update functions invalidate.
+    """
+    patient_type = (patient_type or "").lower()
+    table = PATIENT_TABLES.get(patient_type)
+    if table is None or not registration_number:
+        return None
+    row = _patient_cache.get_or_load(
+        (patient_type, registration_number),
+        lambda: _fetch_one(
+            f"SELECT * FROM {table} WHERE registration_number = %s", (registration_number,), prepared=True
+        ),
+    )
+    return dict(row) if row else None
+
+
+def get_patient_by_reg_number(registration_number):
+    """
+    Returns the OPD patient row as a dict, or None.
+    """
+    return get_patient("opd", registration_number)
+
+
+def _patient_changed(patient_type, registration_number, names=False):
+    global _patient_changes
+    _patient_cache.invalidate((patient_type, registration_number))
+    if names:
+        # A new or renamed patient must show up in the next fuzzy search.
+        _fuzzy_cache.clear()
+    with _patient_changes_lock:
+        _patient_changes += 1
+
+
+def invalidate_patient(patient_type, registration_number):
+    """
+    Drops a cached patient row and cached fuzzy name matches; call after
+    writing patient tables directly.
+    """
+    _patient_changed((patient_type or "").lower(), registration_number, names=True)
+
+
+def patient_change_count():
+    """
+    Returns a counter that goes up whenever this workstation writes a
+    patient, so a screen can tell whether the rows it shows may be stale.
+    """
+    return _patient_changes
+
+
+def patient_cache_stats():
+    """
+    Returns hit/miss counters and hit rate of the patient record cache.
+    """
+    return _patient_cache.stats()
+
+
+_LIST_COLUMNS = "registration_number, first_name, last_name, mobile_number, gender, age"
+
+
+def _patient_select(patient_type):
+    table = PATIENT_TABLES[patient_type.lower()]
+    date_col = PATIENT_DATE_COLUMNS[table]
+    return (
+        f"SELECT {_LIST_COLUMNS}, {date_col} AS date, '{patient_type.upper()}' AS patient_type FROM {table}",
+        date_col,
+    )
+
+
+def get_all_patients(page=1, page_size=100, estimate=False):
+    """
+    Returns one page of OPD, IPD and EPD patients, newest first.
+    Prefer get_all_patients_page(), which does not slow down on deep pages.
+    With estimate=True returns (patients, estimate_patient_count()).
+    """
+    page = max(int(page or 1), 1)
+    sql = patient_directory.LIST_SELECT + " ORDER BY date DESC, registration_number DESC LIMIT %s OFFSET %s"
+    results = _fetch_all(sql, (page_size, (page - 1) * page_size), readonly=True)
+    return (results, estimate_patient_count()) if estimate else results
+
+
+def _gram_counts(cursor, field, grams):
+    counts = {}
+    missing = []
+    for gram in grams:
+        rows = _gram_cache.get((field, gram))
+        if rows is None:
+            missing.append(gram)
+        else:
+            counts[gram] = rows
+    for gram, rows in name_index.gram_rows(cursor, field, missing).items():
+        _gram_cache.put((field, gram), rows)
+        counts[gram] = rows
+    return counts
+
+
+def _fuzzy_matches(name, father_name, types, threshold=None):
+    """
+    Returns [((patient_type, registration_number), score)] best first for
+    the name and/or father's name, scored with the trigram index. Callers
+    filter and cut the list; it holds every match above the threshold.
+    """
+    threshold = FUZZY_NAME_THRESHOLD if threshold is None else threshold
+    key = (name, father_name, tuple(types), threshold)
+
+    def load():
+        with lease(readonly=True) as cursor:
+            scores = None
+            for field, text in ((name_index.FIELD_NAME, name), (name_index.FIELD_FATHER, father_name)):
+                if not text:
+                    continue
+                found = name_index.match(
+                    cursor, field, text, types, threshold,
+                    gram_counts=lambda grams: _gram_counts(cursor, field, grams),
+                    max_gram_rows=FUZZY_GRAM_MAX_ROWS,
+                )
+                scores = found if scores is None else {
+                    k: (scores[k] + found[k]) / 2 for k in scores.keys() & found.keys()
+                }
+        return sorted((scores or {}).items(), key=lambda item: (-item[1], item[0]))
+
+    return _fuzzy_cache.get_or_load(key, load)
+
+
+def _fuzzy_candidates(patient_type, numbers, where, args):
+    """
+    Returns the first FUZZY_NAME_CANDIDATES of `numbers` (one type's fuzzy
+    matches, best first) that also pass the search's other `where` filters.
+    """
+    if not where:
+        return numbers[:FUZZY_NAME_CANDIDATES]
+    table = PATIENT_TABLES[patient_type]
+    kept = []
+    for start in range(0, len(numbers), FUZZY_NAME_CANDIDATES):
+        batch = numbers[start:start + FUZZY_NAME_CANDIDATES]
+        rows = _fetch_all(
+            f"SELECT registration_number FROM {table} "
+            f"WHERE registration_number IN ({', '.join(['%s'] * len(batch))}) AND {' AND '.join(where)}",
+            [*batch, *args], dictionary=False, readonly=True,
+        )
+        passed = {row[0] for row in rows}
+        kept += [number for number in batch if number in passed]
+        if len(kept) >= FUZZY_NAME_CANDIDATES:
+            break
+    return kept[:FUZZY_NAME_CANDIDATES]
+
+
+def fuzzy_name_search(name="", father_name="", patient_type="All", threshold=None, limit=50):
+    """
+    Ranked fuzzy lookup by name and/or father's name across OPD/IPD/EPD,
+    tolerant of typos and spelling variants. Returns patient list rows
+    (registration_number, first_name, ..., patient_type) with a "score"
+    (0-1), best match first.
+    """
+    types = ["opd", "ipd", "epd"] if not patient_type or patient_type == "All" else [patient_type.lower()]
+    types = [t for t in types if t in PATIENT_TABLES]
+    if not types or not (name or father_name):
+        return []
+    try:
+        matches = _fuzzy_matches(name, father_name, types, threshold)[:limit]
+    except Exception as e:
+        logger.error(f"Fuzzy name search failed: {e}")
+        return []
+    by_type = {}
+    for (t, registration_number), _score in matches:
+        by_type.setdefault(t, []).append(registration_number)
+    rows = {}
+    for t, numbers in by_type.items():
+        select, _date_col = _patient_select(t)
+        for row in _fetch_all(
+            f"{select} WHERE registration_number IN ({', '.join(['%s'] * len(numbers))})", numbers, readonly=True
+        ):
+            rows[(t, row["registration_number"])] = row
+    return [dict(rows[key], score=score) for key, score in matches if key in rows]
+
+
+def _prefix_clause(column, prefix):
+    # SQLite only uses a plain (binary) index for GLOB prefixes, MySQL for LIKE.
+    if DB_BACKEND == "sqlite":
+        return f"{column} GLOB %s", [f"{prefix}*"]
+    return f"{column} LIKE %s", [f"{prefix}%"]
+
+
+def _phone_clause(patient_type, phone, phone_match):
+    """
+    Returns (where clause, args) matching mobile numbers containing `phone`,
+    or equal to, starting with or ending with it (phone_match "exact",
+    "prefix", "suffix"). patient_type None means the patient_directory.
+    """
+    digits = re.sub(r"\D", "", phone)
+    if phone_match == "exact":
+        return "mobile_number = %s", [phone]
+    if phone_match == "prefix" and digits:
+        return _prefix_clause("mobile_number", re.sub(r"[^\d+]", "", phone))
+    if phone_match == "suffix" and digits:
+        # Ends with 1234 = the reversed digits start with 4321.
+        clause, args = _prefix_clause("mobile_reversed", digits[::-1])
+        if patient_type is None:
+            types = ", ".join(f"'{t.upper()}'" for t in PATIENT_TABLES)
+            return f"patient_type IN ({types}) AND {clause}", args
+        return (
+            "registration_number IN (SELECT registration_number FROM patient_directory "
+            f"WHERE patient_type = %s AND {clause})",
+            [patient_type.upper(), *args],
+        )
+    return "mobile_number LIKE %s", [f"%{phone}%"]
+
+
+def _search_branches(registration_number="", name="", father_name="", phone="", department="",
+                     town="", state="", gender="", age="", from_date="", to_date="", patient_type="All",
+                     name_match="contains", phone_match="contains", partition_year=None):
+    """
+    Returns ([(select, date column, where clauses, args)] per patient table,
+    error message or None) for the search filters. name_match="fuzzy"
+    matches name/father's name through the trigram index instead of LIKE;
+    name_match="phonetic" ("sounds like") through their phonetic keys.
+    phone_match picks contains/exact/prefix/suffix mobile number matching.
+    partition_year reads only that yearly partition (MySQL); the date
+    filters must already fall inside it.
+    """
+    types = ["opd", "ipd", "epd"] if not patient_type or patient_type == "All" else [patient_type.lower()]
+    types = [t for t in types if t in PATIENT_TABLES]
+    from_db = _to_db_date(from_date)
+    to_db = _to_db_date(to_date)
+    if age:
+        try:
+            age = int(age)
+        except ValueError:
+            return [], "Age must be a number."
+
+    fuzzy = None
+    if name_match == "fuzzy" and (name or father_name):
+        fuzzy = {}
+        for (t, number), _score in _fuzzy_matches(name, father_name, types):
+            fuzzy.setdefault(t, []).append(number)
+
+    # Searches over all three types that only filter directory columns read
+    # patient_directory, a single indexed table, instead of a UNION of three.
+    if len(types) == len(PATIENT_TABLES) and name_match == "contains" and not (town or state):
+        targets = [(None, patient_directory.LIST_SELECT, "date")]
+    else:
+        targets = [(t, *_patient_select(t)) for t in types]
+        if partition_year and DB_BACKEND != "sqlite":
+            partition = f" PARTITION (p{int(partition_year)})"
+            targets = [(t, select + partition, date_col) for t, select, date_col in targets]
+
+    branches = []
+    for t, select, date_col in targets:
+        where, args = [], []
+        if registration_number:
+            where.append("registration_number LIKE %s")
+            args.append(f"{registration_number}%")
+        # Fuzzy matches are added last, narrowed by the other filters.
+        if fuzzy is None and name_match == "phonetic":
+            for field, text in ((name_index.FIELD_NAME, name), (name_index.FIELD_FATHER, father_name)):
+                clause, clause_args = name_index.sounds_like_clause(field, text, t)
+                if clause:
+                    where.append(clause)
+                    args += clause_args
+        elif fuzzy is None:
+            if name:
+                where.append("(first_name LIKE %s OR last_name LIKE %s)")
+                args += [f"%{name}%", f"%{name}%"]
+            if father_name:
+                where.append("father_name LIKE %s")
+                args.append(f"%{father_name}%")
+        if phone:
+            clause, phone_args = _phone_clause(t, phone, phone_match)
+            where.append(clause)
+            args += phone_args
+        if department:
+            where.append("medical_department = %s")
+            args.append(department)
+        if town:
+            where.append("town LIKE %s")
+            args.append(f"%{town}%")
+        if state:
+            where.append("state LIKE %s")
+            args.append(f"%{state}%")
+        if gender:
+            where.append("gender = %s")
+            args.append(gender)
+        if age != "" and age is not None:
+            where.append("age = %s")
+            args.append(age)
+        if from_db:
+            where.append(f"{date_col} >= %s")
+            args.append(from_db)
+        if to_db:
+            where.append(f"{date_col} <= %s")
+            args.append(to_db)
+        if fuzzy is not None:
+            numbers = _fuzzy_candidates(t, fuzzy.get(t, []), where, args)
+            if not numbers:
+                continue
+            where.insert(0, f"registration_number IN ({', '.join(['%s'] * len(numbers))})")
+            args = [*numbers, *args]
+        branches.append((select, date_col, where, args))
+    if not branches and fuzzy is None:
+        return [], "Unknown patient type."
+    return branches, None
+
+
+def search_patients(registration_number="", name="", father_name="", phone="", department="",
+                    town="", state="", gender="", age="", from_date="", to_date="",
+                    patient_type="All", page=1, page_size=100, name_match="contains", phone_match="contains",
+                    estimate=False):
+    """
+    Searches patients across the selected patient type(s).
+    Dates are DD/MM/YYYY. Returns (results, info_msg), or with
+    estimate=True (results, info_msg, estimate_patient_count(...)).
+    """
+    criteria = dict(
+        registration_number=registration_number, name=name, father_name=father_name, phone=phone,
+        department=department, town=town, state=state, gender=gender, age=age,
+        from_date=from_date, to_date=to_date, patient_type=patient_type, name_match=name_match,
+        phone_match=phone_match,
+    )
+    branches, error = _search_branches(**criteria)
+    if error or not branches:
+        results, info_msg = [], error or "No patients found matching the given criteria."
+    else:
+        parts, params = [], []
+        for select, _date_col, where, args in branches:
+            parts.append(select + (" WHERE " + " AND ".join(where) if where else ""))
+            params += args
+        page = max(int(page or 1), 1)
+        sql = " UNION ALL ".join(parts) + " ORDER BY date DESC, registration_number DESC LIMIT %s OFFSET %s"
+        params += [page_size, (page - 1) * page_size]
+        results = _fetch_all(sql, params, readonly=True)
+        info_msg = None if results else "No patients found matching the given criteria."
+    if estimate:
+        return results, info_msg, estimate_patient_count(**criteria)
+    return results, info_msg
+
+
+def _criteria_fingerprint(criteria):
+    return zlib.crc32(repr(sorted((k, str(v)) for k, v in criteria.items() if v not in ("", None))).encode())
+
+
+def _encode_page_token(row, criteria):
+    key = [str(row["date"])[:10], row["registration_number"], _criteria_fingerprint(criteria)]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def _decode_page_token(token, criteria):
+    try:
+        date, registration_number, fingerprint = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except Exception:
+        raise ValueError("Invalid page token")
+    if fingerprint != _criteria_fingerprint(criteria):
+        raise ValueError("Page token belongs to a different search")
+    return date, registration_number
+
+
+def search_patients_page(page_token=None, page_size=100, **criteria):
+    """
+    Keyset-paginated search_patients(): returns (results, info_msg,
+    next_token). Pass next_token back to get the following page; it is None
+    on the last page. Each page reads only page_size rows per patient table
+    from the (date, registration number) index, however deep it is.
+    Raises ValueError for a token from a different search.
+    """
+    branches, error = _search_branches(**criteria)
+    if error:
+        return [], error, None
+    if not branches:
+        return [], "No patients found matching the given criteria.", None
+    after = _decode_page_token(page_token, criteria) if page_token else None
+    parts, params = [], []
+    for i, (select, date_col, where, args) in enumerate(branches):
+        where, args = list(where), list(args)
+        if after:
+            # The leading date bound lets the index seek instead of walking
+            # from the newest row; the OR then only breaks ties on the date.
+            where.append(f"{date_col} <= %s AND ({date_col} < %s OR registration_number < %s)")
+            args += [after[0], after[0], after[1]]
+        branch = select + (" WHERE " + " AND ".join(where) if where else "")
+        branch += f" ORDER BY {date_col} DESC, registration_number DESC LIMIT %s"
+        parts.append(f"SELECT * FROM ({branch}) AS page_{i}")
+        params += args + [page_size + 1]
+    sql = " UNION ALL ".join(parts) + " ORDER BY date DESC, registration_number DESC LIMIT %s"
+    params.append(page_size + 1)
+    results = _fetch_all(sql, params, readonly=True)
+    next_token = None
+    if len(results) > page_size:
+        results = results[:page_size]
+        next_token = _encode_page_token(results[-1], criteria)
+    info_msg = None if results or after else "No patients found matching the given criteria."
+    return results, info_msg, next_token
+
+
+def iter_search_patients(first_chunk=100, chunk_size=1000, **criteria):
+    """
+    Streams search_patients() results newest first as lists of rows: a small
+    first chunk so the first screenful shows at once, then chunk_size rows
+    at a time. Each chunk is one keyset page, so no connection is held
+    while the caller renders. A date range spanning several years reads
+    the yearly partitions in parallel (PARTITION_FANOUT_WORKERS). Raises
+    ValueError for invalid filters.
+    """
+    _branches, error = _search_branches(**criteria)
+    if error:
+        raise ValueError(error)
+    patient_type = criteria.get("patient_type")
+    types = ["opd", "ipd", "epd"] if not patient_type or patient_type == "All" else [patient_type.lower()]
+    slices = _year_slices(
+        criteria.get("from_date"), criteria.get("to_date"),
+        _existing_partitions([PATIENT_TABLES[t] for t in types if t in PATIENT_TABLES]),
+    )
+    if PARTITION_FANOUT_WORKERS > 1 and len(slices) > 1:
+        yield from _iter_partitions(slices, first_chunk, chunk_size, criteria)
+        return
+    token, size = None, first_chunk
+    while True:
+        rows, _info, token = search_patients_page(token, size, **criteria)
+        if rows:
+            yield rows
+        if not token:
+            return
+        size = chunk_size
+
+
+def _existing_partitions(tables):
+    """
+    Returns the years that have a pYYYY partition in every one of `tables`,
+    as read from information_schema.PARTITIONS (cached for a few minutes);
+    an empty set on SQLite or when the tables are not partitioned.
+    """
+    if DB_BACKEND == "sqlite" or not tables:
+        return frozenset()
+
+    def load():
+        with lease(dictionary=True, readonly=True) as cursor:
+            cursor.execute(
+                "SELECT TABLE_NAME AS table_name, PARTITION_NAME AS name, PARTITION_DESCRIPTION AS bound "
+                "FROM information_schema.PARTITIONS WHERE table_schema = DATABASE() "
+                f"AND TABLE_NAME IN ({', '.join(['%s'] * len(tables))}) AND PARTITION_NAME IS NOT NULL",
+                list(tables),
+            )
+            rows = cursor.fetchall()
+        years = {}
+        for row in rows:
+            # Only "pYYYY VALUES LESS THAN (YYYY + 1)" holds exactly one year.
+            match = re.fullmatch(r"p(\d{4})", str(row["name"]))
+            if match and str(row["bound"]) == str(int(match.group(1)) + 1):
+                years.setdefault(row["table_name"].lower(), set()).add(int(match.group(1)))
+        per_table = [years.get(table.lower(), set()) for table in tables]
+        return frozenset(set.intersection(*per_table))
+
+    return _partition_cache.get_or_load(tuple(sorted(tables)), load)
+
+
+def _year_slices(from_date, to_date, partitions=frozenset()):
+    """
+    Splits a search's date range into [(partition year or None, from, to)]
+    per calendar year, newest first; [] without a from date. Years in
+    `partitions` read only their pYYYY partition, the oldest of which also
+    holds all older dates; other years are read without a PARTITION clause.
+    """
+    from_db = _to_db_date(from_date)
+    if not from_db:
+        return []
+    to_db = _to_db_date(to_date) or datetime.date.today().strftime("%Y-%m-%d")
+    oldest = min(partitions) if partitions else FIRST_PARTITION_YEAR
+    slices = []
+    for year in range(int(to_db[:4]), max(int(from_db[:4]), oldest) - 1, -1):
+        low = max(from_db, f"{year}-01-01") if year > oldest else from_db
+        high = min(to_db, f"{year}-12-31")
+        slices.append((year if year in partitions else None, low, high))
+    return slices
+
+
+def _fanout():
+    global _fanout_executor
+    with _pool_lock:
+        if _fanout_executor is None:
+            _fanout_executor = concurrent.futures.ThreadPoolExecutor(
+                PARTITION_FANOUT_WORKERS, thread_name_prefix="db-partition"
+            )
+        return _fanout_executor
+
+
+_SLICE_DONE = object()
+
+
+def _iter_partitions(slices, first_chunk, chunk_size, criteria):
+    """
+    iter_search_patients() over several yearly partitions at once. Each
+    year is paged on its own pooled connection into a small queue; the
+    years are drained newest first, so chunks come out in order while the
+    older years are already being read, at most PARTITION_FANOUT_PER_SEARCH
+    at a time. Closing the generator stops them.
+    """
+    stop = threading.Event()
+    pending = list(enumerate(slices))
+    pending_lock = threading.Lock()
+
+    def put(buffer, item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+    def submit_next():
+        with pending_lock:
+            if stop.is_set() or not pending:
+                return
+            i, (year, low, high) = pending.pop(0)
+        _fanout().submit(read_year, buffers[i], year, low, high, first_chunk if i == 0 else chunk_size)
+
+    def read_year(buffer, year, low, high, size):
+        try:
+            year_criteria = dict(criteria, from_date=low, to_date=high, partition_year=year)
+            token = None
+            while not stop.is_set():
+                rows, _info, token = search_patients_page(token, size, **year_criteria)
+                if rows:
+                    put(buffer, rows)
+                if not token:
+                    break
+                size = chunk_size
+            put(buffer, _SLICE_DONE)
+        except Exception as e:
+            put(buffer, e)
+        finally:
+            submit_next()
+
+    # Years are started newest first as earlier ones finish, so the year
+    # being drained is always running or done.
+    buffers = [queue.Queue(maxsize=4) for _slice in slices]
+    for _slot in range(max(1, min(PARTITION_FANOUT_PER_SEARCH, PARTITION_FANOUT_WORKERS))):
+        submit_next()
+    try:
+        for buffer in buffers:
+            while True:
+                item = buffer.get()
+                if item is _SLICE_DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        stop.set()
+
+
+def get_all_patients_page(page_token=None, page_size=100, estimate=False):
+    """
+    Returns (patients, next_token) for one keyset page of all patients,
+    newest first; see search_patients_page(). With estimate=True returns
+    (patients, next_token, estimate_patient_count()).
+    """
+    results, _info, next_token = search_patients_page(page_token, page_size)
+    if estimate:
+        return results, next_token, estimate_patient_count()
+    return results, next_token
+
+
+_SEARCH_TEXT_FILTERS = ("registration_number", "name", "father_name", "phone", "department",
+                        "town", "state", "gender", "age")
+
+
+def _mysql_count_estimate(cursor, branches, criteria):
+    if not any(criteria.get(k) for k in _SEARCH_TEXT_FILTERS):
+        # Unfiltered, or only a date range: sum the table statistics of the
+        # yearly partitions the range touches.
+        dated = criteria.get("from_date") or criteria.get("to_date")
+        if branches[0][0] == patient_directory.LIST_SELECT and not dated:
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE table_schema = DATABASE() AND table_name = 'patient_directory'"
+            )
+            row = cursor.fetchone()
+            return int(row["TABLE_ROWS"] or 0) if row else None
+        types = [t for t in ("opd", "ipd", "epd")
+                 if not criteria.get("patient_type") or criteria["patient_type"] in ("All", t.upper(), t)]
+        years = list(_partition_years())
+        from_db, to_db = _to_db_date(criteria.get("from_date")), _to_db_date(criteria.get("to_date"))
+        years = [y for y in years if (not from_db or y >= int(from_db[:4])) and (not to_db or y <= int(to_db[:4]))]
+        if not years:
+            return 0
+        cursor.execute(
+            "SELECT COALESCE(SUM(TABLE_ROWS), 0) AS n FROM information_schema.PARTITIONS "
+            f"WHERE table_schema = DATABASE() AND table_name IN ({', '.join(['%s'] * len(types))}) "
+            f"AND PARTITION_NAME IN ({', '.join(['%s'] * len(years))})",
+            [PATIENT_TABLES[t] for t in types] + [f"p{y}" for y in years],
+        )
+        return int(cursor.fetchone()["n"])
+    # Filtered: the optimizer's row estimate for each branch, from index dives.
+    total = 0
+    for select, _date_col, where, args in branches:
+        table = select.rsplit(" FROM ", 1)[1].lower()
+        cursor.execute("EXPLAIN " + select + (" WHERE " + " AND ".join(where) if where else ""), args)
+        for row in cursor.fetchall():
+            if str(row.get("table") or "").lower() == table:
+                total += int(row.get("rows") or 0) * float(row.get("filtered") or 100) / 100
+                break
+    return int(round(total))
+
+
+def estimate_patient_count(**criteria):
+    """
+    Returns roughly how many patients match the search_patients() criteria
+    (all patients when none are given), cheaply enough to show "Page 3 of
+    ~120" next to every page, or None when it cannot be worked out. MySQL
+    reads partition statistics and EXPLAIN row estimates without counting;
+    SQLite counts through the indexes up to COUNT_ESTIMATE_CAP.
+    """
+    branches, error = _search_branches(**criteria)
+    if error:
+        return None
+    if not branches:
+        return 0
+    try:
+        with lease(dictionary=True, readonly=True) as cursor:
+            if DB_BACKEND != "sqlite":
+                return _mysql_count_estimate(cursor, branches, criteria)
+            total = 0
+            for select, _date_col, where, args in branches:
+                cursor.execute(
+                    f"SELECT COUNT(*) AS n FROM ({select}"
+                    + (" WHERE " + " AND ".join(where) if where else "")
+                    + " LIMIT %s) AS matches",
+                    [*args, COUNT_ESTIMATE_CAP - total],
+                )
+                total += cursor.fetchone()["n"]
+                if total >= COUNT_ESTIMATE_CAP:
+                    break
+            return total
+    except Exception as e:
+        logger.warning(f"Could not estimate patient count: {e}")
+        return None
+
+
+def record_ipd_transfer(cursor, source_type, source_registration_number, ipd_registration_number):
+    """
+    Links an OPD/EPD patient to the IPD record they were admitted as, so
+    they drop out of get_transfer_candidates(). Call it inside the lease
+    that inserts the IPD patient.
+    """
+    cursor.execute(
+        "INSERT INTO ipd_transfers (source_type, source_registration_number, ipd_registration_number) "
+        "VALUES (%s, %s, %s)",
+        (source_type.lower(), source_registration_number, ipd_registration_number),
+    )
+
+
+def _not_transferred(numbers, source_type):
+    if not numbers:
+        return set()
+    rows = _fetch_all(
+        "SELECT source_registration_number FROM ipd_transfers WHERE source_type = %s "
+        f"AND source_registration_number IN ({', '.join(['%s'] * len(numbers))})",
+        [source_type, *numbers], dictionary=False, readonly=True,
+    )
+    return set(numbers) - {row[0] for row in rows}
+
+
+def get_transfer_candidates(source_type, search="", page_token=None, page_size=200):
+    """
+    Returns (patients, next_token) for the OPD or EPD patients not yet
+    admitted to IPD, page_size at a time; pass next_token back for more.
+    Most recent visit first, or for a search term without digits a fuzzy
+    name search, best match first. A term with digits matches the
+    registration number or names.
+    """
+    source_type = source_type.lower()
+    table = PATIENT_TABLES[source_type]
+    date_col = PATIENT_DATE_COLUMNS[table]
+    select = f"SELECT p.registration_number, p.first_name, p.last_name, p.gender, p.age, p.{date_col} AS date FROM {table} p"
+    search = (search or "").strip()
+    if search and not any(ch.isdigit() for ch in search):
+        return _fuzzy_transfer_candidates(source_type, select, search, page_token, page_size)
+    criteria = {"transfer": source_type, "search": search}
+    # Walks the (date, registration number) index newest first and probes
+    # ipd_transfers by primary key, so a page costs the same at any history size.
+    where = [
+        "NOT EXISTS (SELECT 1 FROM ipd_transfers t WHERE t.source_type = %s "
+        "AND t.source_registration_number = p.registration_number)"
+    ]
+    args = [source_type]
+    if search:
+        like = f"%{search}%"
+        where.append("(p.first_name LIKE %s OR p.last_name LIKE %s OR p.registration_number LIKE %s)")
+        args += [like, like, like]
+    if page_token:
+        after = _decode_page_token(page_token, criteria)
+        where.append(f"p.{date_col} <= %s AND (p.{date_col} < %s OR p.registration_number < %s)")
+        args += [after[0], after[0], after[1]]
+    rows = _fetch_all(
+        f"{select} WHERE {' AND '.join(where)} "
+        f"ORDER BY p.{date_col} DESC, p.registration_number DESC LIMIT %s",
+        [*args, page_size + 1], readonly=True,
+    )
+    next_token = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_token = _encode_page_token(rows[-1], criteria)
+    return rows, next_token
+
+
+def _fuzzy_transfer_candidates(source_type, select, search, page_token, page_size):
+    # Drops transferred patients from the ranked matches before cutting a
+    # page, so common names still fill it; the token resumes after the
+    # last patient shown.
+    criteria = {"transfer": source_type, "fuzzy": search}
+    ranked = [number for (_t, number), _score in _fuzzy_matches(search, "", [source_type])]
+    if page_token:
+        _date, last = _decode_page_token(page_token, criteria)
+        ranked = ranked[ranked.index(last) + 1:] if last in ranked else []
+    numbers = []
+    for start in range(0, len(ranked), page_size + 1):
+        batch = ranked[start:start + page_size + 1]
+        open_numbers = _not_transferred(batch, source_type)
+        numbers += [number for number in batch if number in open_numbers]
+        if len(numbers) > page_size:
+            break
+    page = numbers[:page_size]
+    if not page:
+        return [], None
+    rows = {
+        row["registration_number"]: row
+        for row in _fetch_all(
+            f"{select} WHERE p.registration_number IN ({', '.join(['%s'] * len(page))})", page, readonly=True
+        )
+    }
+    rows = [rows[number] for number in page if number in rows]
+    next_token = _encode_page_token(rows[-1], criteria) if rows and len(numbers) > page_size else None
+    return rows, next_token
+
+
+# ---------------------------------------------------------------------------
+# Medicines
+# ---------------------------------------------------------------------------
+
+def _get_medicine_id(cursor, name):
+    cursor.execute("SELECT id FROM medicines WHERE LOWER(name) = LOWER(%s)", (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def add_medicine(name):
+    """
+    Returns the id of the named medicine, creating it if needed.
+    """
+    try:
+        with lease() as cursor:
+            med_id = _get_medicine_id(cursor, name)
+            if med_id is None:
+                cursor.execute("INSERT INTO medicines (name) VALUES (%s)", (name,))
+                med_id = cursor.lastrowid
+        return med_id
+    except Exception as e:
+        logger.error(f"Error adding medicine {name}: {e}")
+        return None
+
+
+def add_medicine_purchase(medicine_name, supplier, quantity, purchase_date, expiry_date,
+                          unit_price=None, batch_number=None):
+    """
+    Records a purchased batch of a medicine. Returns True on success.
+    """
+    med_id = add_medicine(medicine_name)
+    if med_id is None:
+        return False
+    return _execute_write(
+        "INSERT INTO medicine_purchases (medicine_id, supplier, quantity, purchase_date, expiry_date, unit_price, batch_number) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+        (med_id, supplier, quantity, _to_db_date(purchase_date), _to_db_date(expiry_date), unit_price, batch_number),
+    )
+
+
+def add_medicine_supply(medicine_name, supply_date, quantity, department, purchase_id=None):
+    """
+    Records medicine supplied to a department, optionally from a batch.
+    """
+    try:
+        with lease() as cursor:
+            med_id = _get_medicine_id(cursor, medicine_name)
+            if med_id is None:
+                return False
+            cursor.execute(
+                "INSERT INTO medicine_supplies (medicine_id, purchase_id, quantity, supply_date, department) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                (med_id, purchase_id, quantity, _to_db_date(supply_date), department),
+            )
+        return True
+    except Exception as e:
+        logger.error(f"Error recording supply of {medicine_name}: {e}")
+        return False
+
+
+def get_current_stock(medicine_name):
+    """
+    Returns purchased minus supplied units, or None if the medicine is unknown.
+    """
+    row = _fetch_one(
+        """
+        SELECT m.id,
+               (SELECT COALESCE(SUM(quantity), 0) FROM medicine_purchases WHERE medicine_id = m.id),
+               (SELECT COALESCE(SUM(quantity), 0) FROM medicine_supplies WHERE medicine_id = m.id)
+        FROM medicines m WHERE LOWER(m.name) = LOWER(%s)
+        """,
+        (medicine_name,), dictionary=False,
+    )
+    if not row:
+        return None
+    return int(row[1]) - int(row[2])
+
+
+def get_batchwise_stock(medicine_name):
+    """
+    Returns batches with stock left as tuples
+    (batch_id, supplier, expiry_date, purchased_qty, supplied_qty, stock_left),
+    earliest expiry first.
+    """
+    rows = _fetch_all(
+        """
+        SELECT p.id, p.supplier, p.expiry_date, p.quantity,
+               COALESCE((SELECT SUM(s.quantity) FROM medicine_supplies s WHERE s.purchase_id = p.id), 0)
+        FROM medicine_purchases p
+        JOIN medicines m ON p.medicine_id = m.id
+        WHERE LOWER(m.name) = LOWER(%s)
+        ORDER BY p.expiry_date ASC, p.id ASC
+        """,
+        (medicine_name,), dictionary=False,
+    )
+    batches = []
+    for batch_id, supplier, expiry, purchased, supplied in rows:
+        stock_left = int(purchased) - int(supplied)
+        if stock_left > 0:
+            batches.append((batch_id, supplier, expiry, int(purchased), int(supplied), stock_left))
+    return batches
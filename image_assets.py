@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import struct
+
+from PIL import Image, ImageTk
+
+logger = logging.getLogger(__name__)
+
+# Icons for the role selection and login screens. Each file is decoded once
+# and each size asked for is scaled once and kept as a PhotoImage, so going
+# back or logging out shows the same images again without touching PIL.
+# With ASSET_CACHE_PATH set, the scaled pixels are also packed into one file
+# that later starts read instead of decoding and resizing the PNGs.
+ASSET_CACHE_PATH = os.getenv("ASSET_CACHE_PATH", "")
+
+_PACK_MAGIC = b"HMSICON1"
+
+_sources = {}   # path -> (stamp, decoded PIL image)
+_photos = {}    # (path, (w, h)) -> (stamp, PhotoImage)
+_packed = None  # "path|WxH" -> {"stamp", "mode", "data"}, from ASSET_CACHE_PATH
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def icon(path, size):
+    """
+    Returns a PhotoImage of the image file at `path` scaled to size (w, h),
+    or None when the file is missing or cannot be read. A changed file is
+    picked up on the next call.
+    """
+    size = tuple(size)
+    try:
+        stamp = _stamp(path)
+    except OSError:
+        return None
+    cached = _photos.get((path, size))
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        photo = ImageTk.PhotoImage(_scaled(path, size, stamp))
+    except Exception as e:
+        logger.error(f"Could not load image {path}: {e}")
+        return None
+    _photos[(path, size)] = (stamp, photo)
+    return photo
+
+
+def _scaled(path, size, stamp):
+    key = f"{path}|{size[0]}x{size[1]}"
+    packed = _load_packed().get(key)
+    if packed is not None and packed["stamp"] == stamp:
+        return Image.frombytes(packed["mode"], size, packed["data"])
+    source = _sources.get(path)
+    if source is None or source[0] != stamp:
+        image = Image.open(path)
+        image.load()
+        source = _sources[path] = (stamp, image)
+    scaled = source[1].convert("RGBA").resize(size)
+    if ASSET_CACHE_PATH:
+        _packed[key] = {"stamp": stamp, "mode": scaled.mode, "data": scaled.tobytes()}
+        _save_packed()
+    return scaled
+
+
+def _load_packed():
+    global _packed
+    if _packed is not None:
+        return _packed
+    _packed = {}
+    if not ASSET_CACHE_PATH or not os.path.exists(ASSET_CACHE_PATH):
+        return _packed
+    try:
+        with open(ASSET_CACHE_PATH, "rb") as f:
+            if f.read(len(_PACK_MAGIC)) != _PACK_MAGIC:
+                raise ValueError("not an icon cache file")
+            (header_length,) = struct.unpack(">I", f.read(4))
+            header = json.loads(f.read(header_length).decode("utf-8"))
+            blob = f.read()
+        for key, entry in header.items():
+            start = entry.pop("offset")
+            entry["data"] = blob[start:start + entry.pop("length")]
+            _packed[key] = entry
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        logger.warning(f"Ignoring icon cache {ASSET_CACHE_PATH}: {e}")
+        _packed = {}
+    return _packed
+
+
+def _save_packed():
+    header, chunks, offset = {}, [], 0
+    for key, entry in _packed.items():
+        header[key] = {"stamp": entry["stamp"], "mode": entry["mode"], "offset": offset, "length": len(entry["data"])}
+        chunks.append(entry["data"])
+        offset += len(entry["data"])
+    encoded = json.dumps(header).encode("utf-8")
+    temp_path = f"{ASSET_CACHE_PATH}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(_PACK_MAGIC + struct.pack(">I", len(encoded)) + encoded)
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(temp_path, ASSET_CACHE_PATH)
+    except OSError as e:
+        logger.warning(f"Could not write icon cache {ASSET_CACHE_PATH}: {e}")
@@ -21,8 +21,10 @@ if win32event:
 
 import tkinter as tk
 from ui import PatientRegistrationApp
+from database import create_tables
 
 def main():
+    create_tables()
     root = tk.Tk()
     app = PatientRegistrationApp(root)
     root.protocol("WM_DELETE_WINDOW", app.close_app)
@@ -0,0 +1,494 @@
+import logging
+import re
+import sys
+
+import name_index
+import patient_directory
+import sqlite_backend
+
+logger = logging.getLogger(__name__)
+
+# Schema changes are applied in version order and recorded in
+# schema_migrations, so every workstation and the hospital server converge on
+# the same tables and indexes. Append new versions; never edit applied ones.
+
+# Rows dated after the last yearly partition land here until
+# database.add_year_partition() splits their year out of it.
+CATCHALL_PARTITION = "PARTITION pmax VALUES LESS THAN MAXVALUE"
+
+
+def _mysql_partition_clause(year_expr, years):
+    parts = ",\n".join(
+        f"        PARTITION p{year} VALUES LESS THAN ({year + 1})" for year in years
+    )
+    return f"PARTITION BY RANGE ({year_expr}) (\n{parts}\n    )"
+
+
+def _mysql_tables(years):
+    return (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(100) NOT NULL UNIQUE,
+            password_hash VARCHAR(255) NOT NULL,
+            plain_password VARCHAR(255),
+            role VARCHAR(20) NOT NULL DEFAULT 'user',
+            sections_allowed VARCHAR(255),
+            is_logged_in TINYINT(1) NOT NULL DEFAULT 0,
+            last_login DATETIME,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_cash_log (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(100) NOT NULL,
+            date DATE NOT NULL,
+            cash_in_hand DECIMAL(10,2) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY uq_user_date (username, date)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS registration_counters (
+            patient_type VARCHAR(10) NOT NULL,
+            year INT NOT NULL,
+            last_value INT NOT NULL,
+            PRIMARY KEY (patient_type, year)
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS OPD_Patients (
+            id INT AUTO_INCREMENT,
+            registration_number VARCHAR(30) NOT NULL,
+            first_name VARCHAR(100) NOT NULL,
+            last_name VARCHAR(100),
+            father_name VARCHAR(100),
+            abha_number VARCHAR(50),
+            age INT,
+            gender VARCHAR(10),
+            mobile_number VARCHAR(15),
+            email VARCHAR(100),
+            address VARCHAR(255),
+            post_office VARCHAR(100),
+            town VARCHAR(100),
+            state VARCHAR(100),
+            registration_fee DECIMAL(10,2) DEFAULT 5.00,
+            payment_status VARCHAR(10) DEFAULT 'Paid',
+            registration_date DATE NOT NULL,
+            medical_department VARCHAR(50),
+            created_by VARCHAR(100),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, registration_date),
+            KEY idx_opd_reg_no (registration_number),
+            KEY idx_opd_date (registration_date, registration_number)
+        )
+        {_mysql_partition_clause("YEAR(registration_date)", years)}
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS IPD_Patients (
+            id INT AUTO_INCREMENT,
+            registration_number VARCHAR(30) NOT NULL,
+            first_name VARCHAR(100) NOT NULL,
+            last_name VARCHAR(100),
+            father_name VARCHAR(100),
+            abha_number VARCHAR(50),
+            age INT,
+            gender VARCHAR(10),
+            mobile_number VARCHAR(15),
+            email VARCHAR(100),
+            address VARCHAR(255),
+            post_office VARCHAR(100),
+            town VARCHAR(100),
+            state VARCHAR(100),
+            medical_department VARCHAR(50),
+            police_case VARCHAR(5) DEFAULT 'No',
+            bed_number VARCHAR(20),
+            room_number VARCHAR(20),
+            admission_date DATE NOT NULL,
+            discharge_date DATE,
+            notes TEXT,
+            created_by VARCHAR(100),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, admission_date),
+            KEY idx_ipd_reg_no (registration_number),
+            KEY idx_ipd_date (admission_date, registration_number)
+        )
+        {_mysql_partition_clause("YEAR(admission_date)", years)}
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS EPD_Patients (
+            id INT AUTO_INCREMENT,
+            registration_number VARCHAR(30) NOT NULL,
+            first_name VARCHAR(100) NOT NULL,
+            last_name VARCHAR(100),
+            father_name VARCHAR(100),
+            abha_number VARCHAR(50),
+            age INT,
+            gender VARCHAR(10),
+            mobile_number VARCHAR(15),
+            email VARCHAR(100),
+            address VARCHAR(255),
+            post_office VARCHAR(100),
+            town VARCHAR(100),
+            state VARCHAR(100),
+            medical_department VARCHAR(50),
+            police_case VARCHAR(5) DEFAULT 'No',
+            emergency_type VARCHAR(50),
+            arrival_mode VARCHAR(50),
+            arrival_datetime DATETIME,
+            triage_level VARCHAR(20),
+            attending_doctor VARCHAR(100),
+            discharge_datetime DATETIME,
+            outcome VARCHAR(100),
+            notes TEXT,
+            date DATE NOT NULL,
+            created_by VARCHAR(100),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, date),
+            KEY idx_epd_reg_no (registration_number),
+            KEY idx_epd_date (date, registration_number)
+        )
+        {_mysql_partition_clause("YEAR(date)", years)}
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS medicines (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(150) NOT NULL UNIQUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS medicine_purchases (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            medicine_id INT NOT NULL,
+            supplier VARCHAR(150),
+            quantity INT NOT NULL,
+            purchase_date DATE NOT NULL,
+            expiry_date DATE,
+            unit_price DECIMAL(10,2),
+            batch_number VARCHAR(50),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_purchases_medicine (medicine_id, expiry_date),
+            FOREIGN KEY (medicine_id) REFERENCES medicines(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS medicine_supplies (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            medicine_id INT NOT NULL,
+            purchase_id INT,
+            quantity INT NOT NULL,
+            supply_date DATE NOT NULL,
+            department VARCHAR(50),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_supplies_medicine (medicine_id),
+            KEY idx_supplies_purchase (purchase_id),
+            FOREIGN KEY (medicine_id) REFERENCES medicines(id),
+            FOREIGN KEY (purchase_id) REFERENCES medicine_purchases(id)
+        )
+        """,
+    )
+
+
+# Version 2: indexes for the predicates the app actually runs.
+# (table, index name, columns, case-insensitive prefix search on SQLite)
+INDEXES = (
+    # ReportingFrame: date range + created_by + department, grouped on all three.
+    # The OPD index also covers the per-row paid count/fee total.
+    ("OPD_Patients", "idx_opd_report",
+     ("registration_date", "created_by", "medical_department", "payment_status", "registration_fee"), False),
+    ("IPD_Patients", "idx_ipd_report", ("admission_date", "created_by", "medical_department"), False),
+    ("EPD_Patients", "idx_epd_report", ("date", "created_by", "medical_department"), False),
+    # Search: phone and first/last name prefixes.
+    ("OPD_Patients", "idx_opd_mobile", ("mobile_number",), False),
+    ("IPD_Patients", "idx_ipd_mobile", ("mobile_number",), False),
+    ("EPD_Patients", "idx_epd_mobile", ("mobile_number",), False),
+    ("OPD_Patients", "idx_opd_first_name", ("first_name",), True),
+    ("IPD_Patients", "idx_ipd_first_name", ("first_name",), True),
+    ("EPD_Patients", "idx_epd_first_name", ("first_name",), True),
+    ("OPD_Patients", "idx_opd_last_name", ("last_name",), True),
+    ("IPD_Patients", "idx_ipd_last_name", ("last_name",), True),
+    ("EPD_Patients", "idx_epd_last_name", ("last_name",), True),
+    # Medicine tables: stock sums per medicine (covering), expiry list, newest first.
+    ("medicine_purchases", "idx_purchases_stock", ("medicine_id", "quantity"), False),
+    ("medicine_purchases", "idx_purchases_expiry", ("expiry_date", "medicine_id"), False),
+    ("medicine_purchases", "idx_purchases_date", ("purchase_date",), False),
+    ("medicine_supplies", "idx_supplies_stock", ("medicine_id", "quantity"), False),
+    ("medicine_supplies", "idx_supplies_date", ("supply_date", "id"), False),
+)
+
+
+def _index_sql(backend, table, name, columns, nocase=False):
+    if backend == "sqlite":
+        cols = ", ".join(f"{c} COLLATE NOCASE" if nocase else c for c in columns)
+        return f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({cols})"
+    return f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"
+
+
+def _index_exists(cursor, backend, table, name):
+    if backend == "sqlite":
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = %s", (name,))
+    else:
+        cursor.execute(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+            (table, name),
+        )
+    return cursor.fetchone() is not None
+
+
+def _v1_tables(conn, backend, years):
+    if backend == "sqlite":
+        sqlite_backend.create_schema(conn)
+        return
+    cursor = conn.cursor()
+    try:
+        for statement in _mysql_tables(years):
+            cursor.execute(statement)
+    finally:
+        cursor.close()
+
+
+def _column_exists(cursor, backend, table, column):
+    if backend == "sqlite":
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row[1] == column for row in cursor.fetchall())
+    cursor.execute(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s LIMIT 1",
+        (table, column),
+    )
+    return cursor.fetchone() is not None
+
+
+def partition_names(cursor, table):
+    """
+    Returns the names of `table`'s MySQL partitions.
+    """
+    cursor.execute(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND PARTITION_NAME IS NOT NULL",
+        (table,),
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _v2_indexes(conn, backend, years):
+    cursor = conn.cursor()
+    try:
+        for table, name, columns, nocase in INDEXES:
+            # MySQL has no CREATE INDEX IF NOT EXISTS; check first so a
+            # half-applied migration can simply be re-run.
+            if not _index_exists(cursor, backend, table, name):
+                cursor.execute(_index_sql(backend, table, name, columns, nocase))
+    finally:
+        cursor.close()
+
+
+def _v3_name_trigrams(conn, backend, years):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(name_index.TABLE_SQL)
+        if not _index_exists(cursor, backend, "name_trigrams", "idx_name_trigrams_patient"):
+            cursor.execute(_index_sql(
+                backend, "name_trigrams", "idx_name_trigrams_patient", ("patient_type", "registration_number")
+            ))
+    finally:
+        cursor.close()
+    conn.commit()
+    name_index.rebuild(
+        conn, {table: table[:3].lower() for table in sqlite_backend.PARTITIONED_TABLES}, phonetic=False
+    )
+
+
+def _v4_name_phonetics(conn, backend, years):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(name_index.PHONETIC_TABLE_SQL)
+        if not _index_exists(cursor, backend, "name_phonetics", "idx_name_phonetics_patient"):
+            cursor.execute(_index_sql(
+                backend, "name_phonetics", "idx_name_phonetics_patient", ("patient_type", "registration_number")
+            ))
+    finally:
+        cursor.close()
+    conn.commit()
+    name_index.rebuild(
+        conn, {table: table[:3].lower() for table in sqlite_backend.PARTITIONED_TABLES}, trigram=False
+    )
+
+
+def _v5_patient_directory(conn, backend, years):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(patient_directory.TABLE_SQL)
+        for name, columns, nocase in patient_directory.INDEXES:
+            if not _index_exists(cursor, backend, "patient_directory", name):
+                cursor.execute(_index_sql(backend, "patient_directory", name, columns, nocase))
+        cursor.execute("DELETE FROM patient_directory")
+        for table, date_column in sqlite_backend.PARTITIONED_TABLES.items():
+            cursor.execute(patient_directory.backfill_sql(table, table[:3], date_column))
+    finally:
+        cursor.close()
+
+
+def _v6_mobile_suffix(conn, backend, years):
+    cursor = conn.cursor()
+    try:
+        # MySQL commits the ALTER at once; a v6 interrupted before it was
+        # recorded runs again with the column already there.
+        if not _column_exists(cursor, backend, "patient_directory", "mobile_reversed"):
+            cursor.execute(f"ALTER TABLE patient_directory ADD COLUMN {patient_directory.MOBILE_REVERSED_COLUMN}")
+        cursor.execute(
+            "SELECT patient_type, registration_number, mobile_number FROM patient_directory "
+            "WHERE mobile_reversed IS NULL AND mobile_number IS NOT NULL"
+        )
+        updates = [
+            (patient_directory.reversed_digits(mobile), patient_type, registration_number)
+            for patient_type, registration_number, mobile in cursor.fetchall()
+        ]
+        for start in range(0, len(updates), 5000):
+            cursor.executemany(
+                "UPDATE patient_directory SET mobile_reversed = %s WHERE patient_type = %s AND registration_number = %s",
+                updates[start:start + 5000],
+            )
+        name, columns, nocase = patient_directory.MOBILE_SUFFIX_INDEX
+        if not _index_exists(cursor, backend, "patient_directory", name):
+            cursor.execute(_index_sql(backend, "patient_directory", name, columns, nocase))
+    finally:
+        cursor.close()
+
+
+# OPD/EPD patients admitted to IPD (the IPD record gets its own number).
+IPD_TRANSFERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS ipd_transfers (
+        source_type VARCHAR(3) NOT NULL,
+        source_registration_number VARCHAR(30) NOT NULL,
+        ipd_registration_number VARCHAR(30) NOT NULL,
+        transferred_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (source_type, source_registration_number)
+    )
+"""
+
+
+def _v7_ipd_transfers(conn, backend, years):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(IPD_TRANSFERS_TABLE)
+        if not _index_exists(cursor, backend, "ipd_transfers", "idx_ipd_transfers_ipd"):
+            cursor.execute(_index_sql(backend, "ipd_transfers", "idx_ipd_transfers_ipd", ("ipd_registration_number",)))
+    finally:
+        cursor.close()
+
+
+def _v8_partition_catchall(conn, backend, years):
+    if backend == "sqlite":  # not partitioned
+        return
+    cursor = conn.cursor()
+    try:
+        for table in sqlite_backend.PARTITIONED_TABLES:
+            if "pmax" not in partition_names(cursor, table):
+                cursor.execute(f"ALTER TABLE {table} ADD PARTITION ({CATCHALL_PARTITION})")
+    finally:
+        cursor.close()
+
+
+MIGRATIONS = (
+    (1, "tables and yearly partitions", _v1_tables),
+    (2, "report, search and medicine indexes", _v2_indexes),
+    (3, "fuzzy name trigram index", _v3_name_trigrams),
+    (4, "phonetic name keys", _v4_name_phonetics),
+    (5, "patient directory", _v5_patient_directory),
+    (6, "mobile number suffix index", _v6_mobile_suffix),
+    (7, "ipd transfer links", _v7_ipd_transfers),
+    (8, "catch-all partitions for future years", _v8_partition_catchall),
+)
+
+_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(200) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def applied_versions(conn):
+    """
+    Returns the set of migration versions recorded in schema_migrations.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(_MIGRATIONS_TABLE)
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def migrate(conn, backend, years):
+    """
+    Applies pending migrations on `conn` ("mysql" or "sqlite" backend),
+    committing after each. `years` are the yearly partitions the tables start
+    with. Returns the versions applied.
+    """
+    applied = applied_versions(conn)
+    conn.commit()
+    ran = []
+    for version, name, apply in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info(f"Applying schema migration {version}: {name}")
+        apply(conn, backend, years)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        finally:
+            cursor.close()
+        conn.commit()
+        ran.append(version)
+    return ran
+
+
+def schema_sql(years):
+    """
+    Returns the MySQL DDL of the latest schema version, as kept in schema.sql.
+    """
+    statements = [re.sub(r"(?m)^ {8}", "", s.strip("\n")).strip() for s in _mysql_tables(years)]
+    statements += [_index_sql("mysql", *index) for index in INDEXES]
+    statements.append(re.sub(r"(?m)^ {4}", "", name_index.TABLE_SQL.strip("\n")).strip())
+    statements.append(_index_sql(
+        "mysql", "name_trigrams", "idx_name_trigrams_patient", ("patient_type", "registration_number")
+    ))
+    statements.append(re.sub(r"(?m)^ {4}", "", name_index.PHONETIC_TABLE_SQL.strip("\n")).strip())
+    statements.append(_index_sql(
+        "mysql", "name_phonetics", "idx_name_phonetics_patient", ("patient_type", "registration_number")
+    ))
+    statements.append(re.sub(r"(?m)^ {4}", "", patient_directory.TABLE_SQL.strip("\n")).strip())
+    statements.append(f"ALTER TABLE patient_directory ADD COLUMN {patient_directory.MOBILE_REVERSED_COLUMN}")
+    statements += [
+        _index_sql("mysql", "patient_directory", name, columns)
+        for name, columns, _nocase in (*patient_directory.INDEXES, patient_directory.MOBILE_SUFFIX_INDEX)
+    ]
+    statements.append(re.sub(r"(?m)^ {4}", "", IPD_TRANSFERS_TABLE.strip("\n")).strip())
+    statements.append(_index_sql("mysql", "ipd_transfers", "idx_ipd_transfers_ipd", ("ipd_registration_number",)))
+    statements += [
+        f"ALTER TABLE {table} ADD PARTITION ({CATCHALL_PARTITION})" for table in sqlite_backend.PARTITIONED_TABLES
+    ]
+    statements.append(re.sub(r"(?m)^ {4}", "", _MIGRATIONS_TABLE.strip("\n")).strip())
+    statements += [
+        f"INSERT INTO schema_migrations (version, name) VALUES ({version}, '{name}')"
+        for version, name, _apply in MIGRATIONS
+    ]
+    return ";\n\n".join(statements) + ";\n"
+
+
+if __name__ == "__main__":
+    # python migrations.py         -> bring the configured database up to date
+    # python migrations.py --sql   -> print the MySQL schema (schema.sql)
+    import database
+
+    if "--sql" in sys.argv:
+        print(schema_sql(database._partition_years()), end="")
+    else:
+        ok = database.create_tables()
+        print(f"Schema version: {database.schema_version()}" if ok else "Migration failed, see patient_app.log")
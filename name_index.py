@@ -0,0 +1,298 @@
+import math
+import re
+import unicodedata
+
+# Trigram index over patient names for fuzzy lookups. Each word of a name
+# is padded ("  ravi ") and split into 3-character grams; two words are
+# similar when they share many grams (Jaccard similarity), which tolerates
+# typos and common spelling variants (Ravi/Rabi, Kumar/Kumaar).
+#
+# Alongside it, each word gets a phonetic key tuned for transliterated
+# Hindi/Urdu names (Mohd/Mohammad/Muhammed -> "mhmd"), so a "sounds like"
+# search is a single lookup on name_phonetics.
+
+FIELD_NAME = "n"    # first_name + last_name
+FIELD_FATHER = "f"  # father_name
+MAX_WORDS = 4
+
+TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS name_trigrams (
+        field CHAR(1) NOT NULL,
+        trigram VARCHAR(3) NOT NULL,
+        patient_type VARCHAR(3) NOT NULL,
+        registration_number VARCHAR(30) NOT NULL,
+        word_no SMALLINT NOT NULL,
+        word_trigrams SMALLINT NOT NULL,
+        PRIMARY KEY (field, trigram, patient_type, registration_number, word_no)
+    )
+"""
+INSERT_SQL = (
+    "INSERT INTO name_trigrams (field, trigram, patient_type, registration_number, word_no, word_trigrams) "
+    "VALUES (%s, %s, %s, %s, %s, %s)"
+)
+
+PHONETIC_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS name_phonetics (
+        field CHAR(1) NOT NULL,
+        phonetic_key VARCHAR(30) NOT NULL,
+        patient_type VARCHAR(3) NOT NULL,
+        registration_number VARCHAR(30) NOT NULL,
+        word_no SMALLINT NOT NULL,
+        PRIMARY KEY (field, phonetic_key, patient_type, registration_number, word_no)
+    )
+"""
+PHONETIC_INSERT_SQL = (
+    "INSERT INTO name_phonetics (field, phonetic_key, patient_type, registration_number, word_no) "
+    "VALUES (%s, %s, %s, %s, %s)"
+)
+
+# Abbreviations written at the counter, expanded before keying.
+_PHONETIC_ALIASES = {
+    "md": "mohammad", "mohd": "mohammad", "mohmd": "mohammad",
+    "kr": "kumar", "km": "kumari", "pd": "prasad", "sk": "shaikh",
+}
+# Applied in order: diphthongs, foreign letters, then aspirated consonants
+# collapse onto the plain one (bh -> b, kh -> k, sh -> s, ...).
+_PHONETIC_SUBS = (
+    ("aw", "o"), ("ow", "o"), ("ou", "o"),
+    ("x", "ks"), ("q", "k"), ("z", "j"), ("ph", "f"), ("w", "v"),
+    ("chh", "C"), ("ch", "C"), ("ck", "k"), ("c", "k"), ("C", "c"),
+    ("kh", "k"), ("gh", "g"), ("jh", "j"), ("th", "t"), ("dh", "d"), ("bh", "b"), ("sh", "s"),
+)
+_VOWELS = set("aeiouy")
+
+_NON_WORD_RE = re.compile(r"[^\w]+|_")
+_DOUBLED_RE = re.compile(r"(.)\1+")
+
+
+def words(text):
+    """
+    Returns the distinct lowercase words of a name, accents removed.
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    seen = []
+    for word in _NON_WORD_RE.sub(" ", text).split():
+        if word not in seen:
+            seen.append(word)
+    return seen[:MAX_WORDS]
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def phonetic_key(word):
+    """
+    Returns the phonetic key of one word from words(): aspirates and
+    spelling variants folded, vowels after the first letter and h outside
+    vowels dropped, doubled letters single ("muhammed", "mohammad" -> "mhmd").
+    """
+    word = _PHONETIC_ALIASES.get(word, word)
+    for old, new in _PHONETIC_SUBS:
+        word = word.replace(old, new)
+    word = _DOUBLED_RE.sub(r"\1", "".join(ch for ch in word if "a" <= ch <= "z"))
+    if not word:
+        return ""
+    key = ["a" if word[0] in _VOWELS else word[0]]
+    for i in range(1, len(word)):
+        ch = word[i]
+        if ch in _VOWELS:
+            continue
+        if ch == "h" and not (word[i - 1] in _VOWELS and i + 1 < len(word) and word[i + 1] in _VOWELS):
+            continue
+        key.append(ch)
+    return "".join(key)[:30]
+
+
+def _name_texts(first_name, last_name, father_name):
+    return ((FIELD_NAME, f"{first_name or ''} {last_name or ''}"), (FIELD_FATHER, father_name))
+
+
+def index_rows(patient_type, registration_number, first_name, last_name, father_name):
+    """
+    Returns the name_trigrams rows for one patient.
+    """
+    rows = []
+    for field, text in _name_texts(first_name, last_name, father_name):
+        for word_no, word in enumerate(words(text)):
+            grams = trigrams(word)
+            rows += [(field, g, patient_type, registration_number, word_no, len(grams)) for g in grams]
+    return rows
+
+
+def phonetic_rows(patient_type, registration_number, first_name, last_name, father_name):
+    """
+    Returns the name_phonetics rows for one patient.
+    """
+    rows = []
+    for field, text in _name_texts(first_name, last_name, father_name):
+        for word_no, word in enumerate(words(text)):
+            key = phonetic_key(word)
+            if key:
+                rows.append((field, key, patient_type, registration_number, word_no))
+    return rows
+
+
+def add_names(cursor, patients, trigram=True, phonetic=True):
+    """
+    Indexes (patient_type, registration_number, first_name, last_name,
+    father_name) tuples with one executemany per index table.
+    """
+    patients = list(patients)
+    if trigram:
+        rows = [row for p in patients for row in index_rows(*p)]
+        if rows:
+            cursor.executemany(INSERT_SQL, rows)
+    if phonetic:
+        rows = [row for p in patients for row in phonetic_rows(*p)]
+        if rows:
+            cursor.executemany(PHONETIC_INSERT_SQL, rows)
+
+
+def index_names(cursor, patient_type, registration_number, first_name, last_name, father_name, replace=False):
+    """
+    Writes one patient's trigrams and phonetic keys; replace=True drops the
+    old ones first.
+    """
+    if replace:
+        for table in ("name_trigrams", "name_phonetics"):
+            cursor.execute(
+                f"DELETE FROM {table} WHERE patient_type = %s AND registration_number = %s",
+                (patient_type, registration_number),
+            )
+    add_names(cursor, [(patient_type, registration_number, first_name, last_name, father_name)])
+
+
+def gram_rows(cursor, field, grams):
+    """
+    Returns {trigram: index rows} for `grams` in `field`, the cost of
+    scanning each gram.
+    """
+    if not grams:
+        return {}
+    cursor.execute(
+        f"SELECT trigram, COUNT(*) FROM name_trigrams WHERE field = %s AND trigram IN ({', '.join(['%s'] * len(grams))}) "
+        "GROUP BY trigram",
+        [field, *grams],
+    )
+    counts = {gram: 0 for gram in grams}
+    counts.update({gram: rows for gram, rows in cursor.fetchall()})
+    return counts
+
+
+def _scan_grams(grams, need, rows, max_rows):
+    # A word sharing `need` grams shares at least one of any len - need + 1
+    # of them, so up to need - 1 of the most frequent grams can be left out
+    # of the candidate scan without losing matches.
+    if not rows or not max_rows:
+        return grams
+    frequent = sorted((g for g in grams if rows.get(g, 0) > max_rows), key=lambda g: rows[g], reverse=True)
+    skip = set(frequent[:need - 1])
+    return [g for g in grams if g not in skip]
+
+
+def _shared_grams(cursor, field, grams, patient_types, need, numbers, batch=500):
+    # Exact shared-gram counts for candidates found through fewer grams.
+    type_marks = ", ".join(["%s"] * len(patient_types))
+    rows = []
+    for start in range(0, len(numbers), batch):
+        chunk = numbers[start:start + batch]
+        cursor.execute(
+            "SELECT patient_type, registration_number, COUNT(*), MAX(word_trigrams) FROM name_trigrams "
+            f"WHERE field = %s AND trigram IN ({', '.join(['%s'] * len(grams))}) "
+            f"AND patient_type IN ({type_marks}) AND registration_number IN ({', '.join(['%s'] * len(chunk))}) "
+            "GROUP BY patient_type, registration_number, word_no HAVING COUNT(*) >= %s",
+            [field, *grams, *patient_types, *chunk, need],
+        )
+        rows += cursor.fetchall()
+    return rows
+
+
+def match(cursor, field, text, patient_types, threshold, gram_counts=None, max_gram_rows=None):
+    """
+    Returns {(patient_type, registration_number): score} for names in
+    `field` scoring at least `threshold`. A multi-word query scores the
+    average of each query word's best-matching word, in any order.
+    gram_counts(grams) -> {trigram: index rows} lets the candidate scan
+    leave out grams with more than max_gram_rows rows (common ones such as
+    "kum"); candidates are then re-scored on all grams.
+    """
+    query_words = words(text)
+    if not query_words or not patient_types:
+        return {}
+    best = {}
+    type_marks = ", ".join(["%s"] * len(patient_types))
+    for qi, word in enumerate(query_words):
+        grams = sorted(trigrams(word))
+        # Jaccard >= t needs at least t * |query grams| shared grams.
+        need = max(1, math.ceil(threshold * len(grams)))
+        scan = grams
+        if gram_counts is not None and max_gram_rows and need > 1:
+            scan = _scan_grams(grams, need, gram_counts(grams), max_gram_rows)
+        cursor.execute(
+            "SELECT patient_type, registration_number, COUNT(*), MAX(word_trigrams) FROM name_trigrams "
+            f"WHERE field = %s AND trigram IN ({', '.join(['%s'] * len(scan))}) "
+            f"AND patient_type IN ({type_marks}) "
+            "GROUP BY patient_type, registration_number, word_no HAVING COUNT(*) >= %s",
+            [field, *scan, *patient_types, need - (len(grams) - len(scan))],
+        )
+        rows = cursor.fetchall()
+        if len(scan) < len(grams):
+            numbers = sorted({registration_number for _t, registration_number, _n, _w in rows})
+            rows = _shared_grams(cursor, field, grams, patient_types, need, numbers)
+        for patient_type, registration_number, shared, total in rows:
+            score = shared / (len(grams) + total - shared)
+            scores = best.setdefault((patient_type, registration_number), [0.0] * len(query_words))
+            scores[qi] = max(scores[qi], score)
+    results = {key: sum(scores) / len(scores) for key, scores in best.items()}
+    return {key: score for key, score in results.items() if score >= threshold}
+
+
+def sounds_like_clause(field, text, patient_type):
+    """
+    Returns (sql, args) for a `registration_number IN (...)` filter matching
+    patients of one type whose `field` contains a word sounding like each
+    word of `text`, in any order; (None, []) when text has no words.
+    """
+    keys = sorted({k for k in (phonetic_key(w) for w in words(text)) if k})
+    if not keys:
+        return None, []
+    sql = (
+        "registration_number IN (SELECT registration_number FROM name_phonetics "
+        f"WHERE field = %s AND phonetic_key IN ({', '.join(['%s'] * len(keys))}) AND patient_type = %s "
+        "GROUP BY registration_number HAVING COUNT(DISTINCT phonetic_key) = %s)"
+    )
+    return sql, [field, *keys, patient_type, len(keys)]
+
+
+def rebuild(conn, tables, batch=5000, trigram=True, phonetic=True):
+    """
+    Re-creates the index from the patient tables ({table: patient_type});
+    trigram/phonetic pick which index tables are refilled.
+    """
+    cursor = conn.cursor()
+    try:
+        if trigram:
+            cursor.execute("DELETE FROM name_trigrams")
+        if phonetic:
+            cursor.execute("DELETE FROM name_phonetics")
+        for table, patient_type in tables.items():
+            last_id = 0
+            while True:
+                cursor.execute(
+                    f"SELECT id, registration_number, first_name, last_name, father_name FROM {table} "
+                    "WHERE id > %s ORDER BY id LIMIT %s",
+                    (last_id, batch),
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                add_names(cursor, [(patient_type, *row[1:]) for row in rows], trigram, phonetic)
+                conn.commit()
+    finally:
+        cursor.close()
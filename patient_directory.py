@@ -0,0 +1,103 @@
+# One slim row per OPD, IPD and EPD patient with the columns the patient
+# list shows and searches on, so "All" listings and searches read a single
+# indexed table instead of merging three partitioned ones. Rows are written
+# in the same transaction as the patient table (see database.py).
+
+TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS patient_directory (
+        patient_type VARCHAR(3) NOT NULL,
+        registration_number VARCHAR(30) NOT NULL,
+        first_name VARCHAR(100),
+        last_name VARCHAR(100),
+        father_name VARCHAR(100),
+        mobile_number VARCHAR(15),
+        gender VARCHAR(10),
+        age INT,
+        date DATE NOT NULL,
+        medical_department VARCHAR(50),
+        PRIMARY KEY (patient_type, registration_number)
+    )
+"""
+
+# (name, columns, nocase) in the form of migrations.INDEXES.
+INDEXES = (
+    ("idx_directory_date", ("date", "registration_number"), False),
+    ("idx_directory_reg", ("registration_number",), False),
+    ("idx_directory_mobile", ("mobile_number",), False),
+    ("idx_directory_first_name", ("first_name",), True),
+    ("idx_directory_last_name", ("last_name",), True),
+)
+# Added by a later migration (v6), not in TABLE_SQL, which is migration v5's.
+# Led by patient_type so per-type lookups range-scan it rather than the
+# primary key; all-type lookups list the three types.
+MOBILE_SUFFIX_INDEX = ("idx_directory_mobile_rev", ("patient_type", "mobile_reversed"), False)
+MOBILE_REVERSED_COLUMN = "mobile_reversed VARCHAR(15)"
+
+# Columns copied from the patient tables; "date" is each table's visit date.
+COLUMNS = (
+    "patient_type", "registration_number", "first_name", "last_name", "father_name",
+    "mobile_number", "gender", "age", "date", "medical_department",
+)
+# The mobile number's digits reversed, so "ends with 1234" is an index range
+# scan for "starts with 4321".
+_ALL_COLUMNS = COLUMNS + ("mobile_reversed",)
+INSERT_SQL = (
+    f"INSERT INTO patient_directory ({', '.join(_ALL_COLUMNS)}) "
+    f"VALUES ({', '.join(['%s'] * len(_ALL_COLUMNS))})"
+)
+UPDATE_SQL = (
+    "UPDATE patient_directory SET "
+    + ", ".join(f"{c} = %s" for c in _ALL_COLUMNS[2:])
+    + " WHERE patient_type = %s AND registration_number = %s"
+)
+
+# Same columns, in the same order, as database._patient_select().
+LIST_SELECT = (
+    "SELECT registration_number, first_name, last_name, mobile_number, gender, age, date, patient_type "
+    "FROM patient_directory"
+)
+
+
+def source_columns(date_column):
+    """
+    Returns the patient table columns feeding COLUMNS[1:], in order.
+    """
+    return tuple(date_column if c == "date" else c for c in COLUMNS[1:])
+
+
+def reversed_digits(mobile_number):
+    """
+    Returns the digits of a mobile number in reverse order, or None.
+    """
+    digits = "".join(ch for ch in str(mobile_number or "") if ch.isdigit())
+    return digits[::-1] or None
+
+
+def row(patient_type, values, date_column):
+    """
+    Returns the INSERT_SQL parameters for one patient; values is a dict of
+    the patient table's columns.
+    """
+    return (
+        patient_type.upper(),
+        *(values.get(c) for c in source_columns(date_column)),
+        reversed_digits(values.get("mobile_number")),
+    )
+
+
+def update_params(patient_type, values, date_column):
+    """
+    Returns the UPDATE_SQL parameters for one patient.
+    """
+    params = row(patient_type, values, date_column)
+    return (*params[2:], params[0], params[1])
+
+
+def backfill_sql(table, patient_type, date_column):
+    """
+    Returns an INSERT ... SELECT copying `table` into the directory.
+    """
+    return (
+        f"INSERT INTO patient_directory ({', '.join(COLUMNS)}) "
+        f"SELECT '{patient_type.upper()}', {', '.join(source_columns(date_column))} FROM {table}"
+    )
@@ -0,0 +1,264 @@
+import bisect
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "250"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "slow_queries.log")
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open.
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Distinct SELECTs kept per call site (with their latest parameters) so
+# their plans can be checked later.
+SAMPLES_PER_TAG = 8
+
+# Statements starting with these do not modify data.
+_READ_VERBS = ("SELECT", "SHOW", "EXPLAIN", "DESCRIBE", "WITH", "PRAGMA")
+
+# Frames from these files are skipped when working out which feature ran a query.
+_INFRA_FILES = (
+    "connection_pool.py", "query_stats.py", "database.py", "contextlib.py", "sqlite_backend.py", "record_cache.py",
+)
+# Reaching these means the query was submitted straight to a worker thread.
+_RUNTIME_FILES = ("task_runner.py", "threading.py", os.path.join("concurrent", "futures", "thread.py"))
+
+_slow_logger = logging.getLogger("hms.slow_queries")
+_slow_logger.propagate = False
+_slow_handler_lock = threading.Lock()
+
+
+def _slow_log():
+    if not _slow_logger.handlers:
+        with _slow_handler_lock:
+            if not _slow_logger.handlers:
+                handler = logging.FileHandler(SLOW_QUERY_LOG, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                _slow_logger.addHandler(handler)
+                _slow_logger.setLevel(logging.INFO)
+    return _slow_logger
+
+
+def call_site_tag():
+    """
+    Returns "Class.method" (or "function") of the first caller outside the
+    database layer, e.g. "ReportingFrame._query_report". Work handed to the
+    task runner directly is tagged by its database function, e.g.
+    "database.search_patients".
+    """
+    db_function = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        filename = code.co_filename
+        if filename.endswith(_RUNTIME_FILES):
+            break
+        if os.path.basename(filename) not in _INFRA_FILES:
+            return getattr(code, "co_qualname", code.co_name)
+        if filename.endswith("database.py") and code.co_name[0] not in "_<" and code.co_name != "lease":
+            db_function = code.co_name
+        frame = frame.f_back
+    return f"database.{db_function}" if db_function else "database"
+
+
+def redact(params):
+    """
+    Replaces parameter values with their type (and length for strings), so
+    patient details never reach the slow-query log.
+    """
+    def one(value):
+        if value is None:
+            return "NULL"
+        if isinstance(value, (str, bytes, bytearray)):
+            return f"<{type(value).__name__}:{len(value)}>"
+        return f"<{type(value).__name__}>"
+    return [one(v) for v in (params or ())]
+
+
+class _TagStats:
+    __slots__ = ("count", "total_ms", "max_ms", "rows", "errors", "buckets", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.samples = {}  # SQL text -> latest params
+
+
+class QueryStats:
+    """
+    Per call-site statement timings, rows returned and latency histograms.
+    Statements slower than slow_ms go to the slow-query log with their
+    parameters redacted.
+    """
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self._tags = collections.defaultdict(_TagStats)
+        self._lock = threading.Lock()
+
+    def record(self, tag, sql, params, elapsed_ms, rows, error=None):
+        with self._lock:
+            stats = self._tags[tag]
+            stats.count += 1
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.rows += rows
+            stats.buckets[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+            if error is not None:
+                stats.errors += 1
+            elif str(sql).lstrip()[:6].upper().startswith(("SELECT", "WITH")) and (
+                sql in stats.samples or len(stats.samples) < SAMPLES_PER_TAG
+            ):
+                stats.samples[sql] = params
+        if elapsed_ms >= self.slow_ms:
+            statement = " ".join(str(sql).split())
+            _slow_log().info(
+                f"{elapsed_ms:.1f} ms rows={rows} tag={tag}"
+                + (f" error={type(error).__name__}" if error is not None else "")
+                + f" sql={statement} params={redact(params)}"
+            )
+
+    def snapshot(self):
+        """
+        Returns {tag: {count, avg_ms, max_ms, rows, errors, histogram}}, where
+        histogram maps bucket labels ("<=10ms", ">2500ms") to counts.
+        """
+        labels = [f"<={b}ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        with self._lock:
+            return {
+                tag: {
+                    "count": s.count,
+                    "avg_ms": s.total_ms / s.count if s.count else 0.0,
+                    "max_ms": s.max_ms,
+                    "rows": s.rows,
+                    "errors": s.errors,
+                    "histogram": dict(zip(labels, s.buckets)),
+                }
+                for tag, s in self._tags.items()
+            }
+
+    def hot_statements(self, limit=10):
+        """
+        Returns (tag, sql, params) for the SELECTs sampled at the `limit` call
+        sites with the most total query time.
+        """
+        with self._lock:
+            top = sorted(self._tags.items(), key=lambda item: item[1].total_ms, reverse=True)[:limit]
+            return [(tag, sql, params) for tag, s in top for sql, params in s.samples.items()]
+
+    def log_summary(self, limit=15):
+        """
+        Logs the call sites with the most total query time.
+        """
+        with self._lock:
+            top = sorted(self._tags.items(), key=lambda item: item[1].total_ms, reverse=True)[:limit]
+        for tag, s in top:
+            logger.info(
+                f"Queries {tag}: {s.count} calls, avg {s.total_ms / s.count:.1f} ms, "
+                f"max {s.max_ms:.1f} ms, {s.rows} rows, {s.errors} errors"
+            )
+
+    def reset(self):
+        with self._lock:
+            self._tags.clear()
+
+
+class InstrumentedCursor:
+    """
+    Wraps a DB-API cursor. Each statement is timed while execute() and the
+    fetch calls run, so time the caller spends between fetches does not
+    count; it is recorded with the rows fetched under the cursor's call-site
+    tag at the next execute() or close(). `wrote` becomes True once a
+    statement other than a read has run.
+    """
+
+    def __init__(self, cursor, stats, tag):
+        self._cursor = cursor
+        self._stats = stats
+        self._tag = tag
+        self._pending = None  # [sql, params, elapsed seconds]
+        self._rows = 0
+        self.wrote = False
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _finish(self, error=None):
+        if self._pending is not None:
+            sql, params, elapsed = self._pending
+            self._pending = None
+            self._stats.record(self._tag, sql, params, elapsed * 1000, self._rows, error)
+
+    def _start(self, sql, params):
+        self._finish()
+        self._rows = 0
+        if not self.wrote and not str(sql).lstrip().upper().startswith(_READ_VERBS):
+            self.wrote = True
+        self._pending = [sql, params, 0.0]
+
+    def _timed(self, call, *args):
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            if self._pending is not None:
+                self._pending[2] += time.perf_counter() - started
+
+    def execute(self, sql, params=()):
+        self._start(sql, params)
+        try:
+            self._timed(self._cursor.execute, sql, params)
+        except Exception as e:
+            self._finish(e)
+            raise
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        self._start(sql, seq_of_params[0] if seq_of_params else ())
+        try:
+            self._timed(self._cursor.executemany, sql, seq_of_params)
+        except Exception as e:
+            self._finish(e)
+            raise
+        self._rows = len(seq_of_params)
+        return self
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._timed(self._cursor.fetchmany, size)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        rows = iter(self._cursor)
+        while True:
+            try:
+                row = self._timed(next, rows)
+            except StopIteration:
+                return
+            self._rows += 1
+            yield row
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
@@ -0,0 +1,91 @@
+import collections
+import threading
+import time
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional time-to-live and hit/miss counters.
+    """
+
+    def __init__(self, maxsize=512, ttl=None, name="cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data = collections.OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._counters = collections.Counter()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._data[key]
+                self._counters["expired"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[1]
+
+    def put(self, key, value, epoch=None):
+        """
+        Stores value. When `epoch` (from current_epoch()) is given and anything
+        was invalidated after it, the value may be stale and is not stored.
+        """
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return False
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._counters["evictions"] += 1
+            return True
+
+    def current_epoch(self):
+        with self._lock:
+            return self._epoch
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value for key, or calls loader() and caches a
+        non-None result.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+        epoch = self.current_epoch()
+        value = loader()
+        if value is not None:
+            self.put(key, value, epoch)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._epoch += 1
+            if self._data.pop(key, None) is not None:
+                self._counters["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+
+    def stats(self):
+        """
+        Returns size, hits, misses, hit_rate, evictions, expired and invalidations.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._data)
+            stats["maxsize"] = self.maxsize
+        for key in ("hits", "misses", "evictions", "expired", "invalidations"):
+            stats.setdefault(key, 0)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
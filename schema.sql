@@ -1 +1,306 @@
+-- MySQL schema at the latest migration version, generated with
+--   python migrations.py --sql > schema.sql
+-- The application creates and upgrades these tables itself (create_tables);
+-- this file is for reference and manual installs.
 
+CREATE TABLE IF NOT EXISTS users (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(100) NOT NULL UNIQUE,
+    password_hash VARCHAR(255) NOT NULL,
+    plain_password VARCHAR(255),
+    role VARCHAR(20) NOT NULL DEFAULT 'user',
+    sections_allowed VARCHAR(255),
+    is_logged_in TINYINT(1) NOT NULL DEFAULT 0,
+    last_login DATETIME,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS user_cash_log (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(100) NOT NULL,
+    date DATE NOT NULL,
+    cash_in_hand DECIMAL(10,2) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_user_date (username, date)
+);
+
+CREATE TABLE IF NOT EXISTS registration_counters (
+    patient_type VARCHAR(10) NOT NULL,
+    year INT NOT NULL,
+    last_value INT NOT NULL,
+    PRIMARY KEY (patient_type, year)
+);
+
+CREATE TABLE IF NOT EXISTS OPD_Patients (
+    id INT AUTO_INCREMENT,
+    registration_number VARCHAR(30) NOT NULL,
+    first_name VARCHAR(100) NOT NULL,
+    last_name VARCHAR(100),
+    father_name VARCHAR(100),
+    abha_number VARCHAR(50),
+    age INT,
+    gender VARCHAR(10),
+    mobile_number VARCHAR(15),
+    email VARCHAR(100),
+    address VARCHAR(255),
+    post_office VARCHAR(100),
+    town VARCHAR(100),
+    state VARCHAR(100),
+    registration_fee DECIMAL(10,2) DEFAULT 5.00,
+    payment_status VARCHAR(10) DEFAULT 'Paid',
+    registration_date DATE NOT NULL,
+    medical_department VARCHAR(50),
+    created_by VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, registration_date),
+    KEY idx_opd_reg_no (registration_number),
+    KEY idx_opd_date (registration_date, registration_number)
+)
+PARTITION BY RANGE (YEAR(registration_date)) (
+PARTITION p2020 VALUES LESS THAN (2021),
+PARTITION p2021 VALUES LESS THAN (2022),
+PARTITION p2022 VALUES LESS THAN (2023),
+PARTITION p2023 VALUES LESS THAN (2024),
+PARTITION p2024 VALUES LESS THAN (2025),
+PARTITION p2025 VALUES LESS THAN (2026),
+PARTITION p2026 VALUES LESS THAN (2027),
+PARTITION p2027 VALUES LESS THAN (2028)
+    );
+
+CREATE TABLE IF NOT EXISTS IPD_Patients (
+    id INT AUTO_INCREMENT,
+    registration_number VARCHAR(30) NOT NULL,
+    first_name VARCHAR(100) NOT NULL,
+    last_name VARCHAR(100),
+    father_name VARCHAR(100),
+    abha_number VARCHAR(50),
+    age INT,
+    gender VARCHAR(10),
+    mobile_number VARCHAR(15),
+    email VARCHAR(100),
+    address VARCHAR(255),
+    post_office VARCHAR(100),
+    town VARCHAR(100),
+    state VARCHAR(100),
+    medical_department VARCHAR(50),
+    police_case VARCHAR(5) DEFAULT 'No',
+    bed_number VARCHAR(20),
+    room_number VARCHAR(20),
+    admission_date DATE NOT NULL,
+    discharge_date DATE,
+    notes TEXT,
+    created_by VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, admission_date),
+    KEY idx_ipd_reg_no (registration_number),
+    KEY idx_ipd_date (admission_date, registration_number)
+)
+PARTITION BY RANGE (YEAR(admission_date)) (
+PARTITION p2020 VALUES LESS THAN (2021),
+PARTITION p2021 VALUES LESS THAN (2022),
+PARTITION p2022 VALUES LESS THAN (2023),
+PARTITION p2023 VALUES LESS THAN (2024),
+PARTITION p2024 VALUES LESS THAN (2025),
+PARTITION p2025 VALUES LESS THAN (2026),
+PARTITION p2026 VALUES LESS THAN (2027),
+PARTITION p2027 VALUES LESS THAN (2028)
+    );
+
+CREATE TABLE IF NOT EXISTS EPD_Patients (
+    id INT AUTO_INCREMENT,
+    registration_number VARCHAR(30) NOT NULL,
+    first_name VARCHAR(100) NOT NULL,
+    last_name VARCHAR(100),
+    father_name VARCHAR(100),
+    abha_number VARCHAR(50),
+    age INT,
+    gender VARCHAR(10),
+    mobile_number VARCHAR(15),
+    email VARCHAR(100),
+    address VARCHAR(255),
+    post_office VARCHAR(100),
+    town VARCHAR(100),
+    state VARCHAR(100),
+    medical_department VARCHAR(50),
+    police_case VARCHAR(5) DEFAULT 'No',
+    emergency_type VARCHAR(50),
+    arrival_mode VARCHAR(50),
+    arrival_datetime DATETIME,
+    triage_level VARCHAR(20),
+    attending_doctor VARCHAR(100),
+    discharge_datetime DATETIME,
+    outcome VARCHAR(100),
+    notes TEXT,
+    date DATE NOT NULL,
+    created_by VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, date),
+    KEY idx_epd_reg_no (registration_number),
+    KEY idx_epd_date (date, registration_number)
+)
+PARTITION BY RANGE (YEAR(date)) (
+PARTITION p2020 VALUES LESS THAN (2021),
+PARTITION p2021 VALUES LESS THAN (2022),
+PARTITION p2022 VALUES LESS THAN (2023),
+PARTITION p2023 VALUES LESS THAN (2024),
+PARTITION p2024 VALUES LESS THAN (2025),
+PARTITION p2025 VALUES LESS THAN (2026),
+PARTITION p2026 VALUES LESS THAN (2027),
+PARTITION p2027 VALUES LESS THAN (2028)
+    );
+
+CREATE TABLE IF NOT EXISTS medicines (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(150) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS medicine_purchases (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    medicine_id INT NOT NULL,
+    supplier VARCHAR(150),
+    quantity INT NOT NULL,
+    purchase_date DATE NOT NULL,
+    expiry_date DATE,
+    unit_price DECIMAL(10,2),
+    batch_number VARCHAR(50),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_purchases_medicine (medicine_id, expiry_date),
+    FOREIGN KEY (medicine_id) REFERENCES medicines(id)
+);
+
+CREATE TABLE IF NOT EXISTS medicine_supplies (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    medicine_id INT NOT NULL,
+    purchase_id INT,
+    quantity INT NOT NULL,
+    supply_date DATE NOT NULL,
+    department VARCHAR(50),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_supplies_medicine (medicine_id),
+    KEY idx_supplies_purchase (purchase_id),
+    FOREIGN KEY (medicine_id) REFERENCES medicines(id),
+    FOREIGN KEY (purchase_id) REFERENCES medicine_purchases(id)
+);
+
+CREATE INDEX idx_opd_report ON OPD_Patients (registration_date, created_by, medical_department, payment_status, registration_fee);
+
+CREATE INDEX idx_ipd_report ON IPD_Patients (admission_date, created_by, medical_department);
+
+CREATE INDEX idx_epd_report ON EPD_Patients (date, created_by, medical_department);
+
+CREATE INDEX idx_opd_mobile ON OPD_Patients (mobile_number);
+
+CREATE INDEX idx_ipd_mobile ON IPD_Patients (mobile_number);
+
+CREATE INDEX idx_epd_mobile ON EPD_Patients (mobile_number);
+
+CREATE INDEX idx_opd_first_name ON OPD_Patients (first_name);
+
+CREATE INDEX idx_ipd_first_name ON IPD_Patients (first_name);
+
+CREATE INDEX idx_epd_first_name ON EPD_Patients (first_name);
+
+CREATE INDEX idx_opd_last_name ON OPD_Patients (last_name);
+
+CREATE INDEX idx_ipd_last_name ON IPD_Patients (last_name);
+
+CREATE INDEX idx_epd_last_name ON EPD_Patients (last_name);
+
+CREATE INDEX idx_purchases_stock ON medicine_purchases (medicine_id, quantity);
+
+CREATE INDEX idx_purchases_expiry ON medicine_purchases (expiry_date, medicine_id);
+
+CREATE INDEX idx_purchases_date ON medicine_purchases (purchase_date);
+
+CREATE INDEX idx_supplies_stock ON medicine_supplies (medicine_id, quantity);
+
+CREATE INDEX idx_supplies_date ON medicine_supplies (supply_date, id);
+
+CREATE TABLE IF NOT EXISTS name_trigrams (
+    field CHAR(1) NOT NULL,
+    trigram VARCHAR(3) NOT NULL,
+    patient_type VARCHAR(3) NOT NULL,
+    registration_number VARCHAR(30) NOT NULL,
+    word_no SMALLINT NOT NULL,
+    word_trigrams SMALLINT NOT NULL,
+    PRIMARY KEY (field, trigram, patient_type, registration_number, word_no)
+);
+
+CREATE INDEX idx_name_trigrams_patient ON name_trigrams (patient_type, registration_number);
+
+CREATE TABLE IF NOT EXISTS name_phonetics (
+    field CHAR(1) NOT NULL,
+    phonetic_key VARCHAR(30) NOT NULL,
+    patient_type VARCHAR(3) NOT NULL,
+    registration_number VARCHAR(30) NOT NULL,
+    word_no SMALLINT NOT NULL,
+    PRIMARY KEY (field, phonetic_key, patient_type, registration_number, word_no)
+);
+
+CREATE INDEX idx_name_phonetics_patient ON name_phonetics (patient_type, registration_number);
+
+CREATE TABLE IF NOT EXISTS patient_directory (
+    patient_type VARCHAR(3) NOT NULL,
+    registration_number VARCHAR(30) NOT NULL,
+    first_name VARCHAR(100),
+    last_name VARCHAR(100),
+    father_name VARCHAR(100),
+    mobile_number VARCHAR(15),
+    gender VARCHAR(10),
+    age INT,
+    date DATE NOT NULL,
+    medical_department VARCHAR(50),
+    PRIMARY KEY (patient_type, registration_number)
+);
+
+ALTER TABLE patient_directory ADD COLUMN mobile_reversed VARCHAR(15);
+
+CREATE INDEX idx_directory_date ON patient_directory (date, registration_number);
+
+CREATE INDEX idx_directory_reg ON patient_directory (registration_number);
+
+CREATE INDEX idx_directory_mobile ON patient_directory (mobile_number);
+
+CREATE INDEX idx_directory_first_name ON patient_directory (first_name);
+
+CREATE INDEX idx_directory_last_name ON patient_directory (last_name);
+
+CREATE INDEX idx_directory_mobile_rev ON patient_directory (patient_type, mobile_reversed);
+
+CREATE TABLE IF NOT EXISTS ipd_transfers (
+    source_type VARCHAR(3) NOT NULL,
+    source_registration_number VARCHAR(30) NOT NULL,
+    ipd_registration_number VARCHAR(30) NOT NULL,
+    transferred_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source_type, source_registration_number)
+);
+
+CREATE INDEX idx_ipd_transfers_ipd ON ipd_transfers (ipd_registration_number);
+
+ALTER TABLE OPD_Patients ADD PARTITION (PARTITION pmax VALUES LESS THAN MAXVALUE);
+
+ALTER TABLE IPD_Patients ADD PARTITION (PARTITION pmax VALUES LESS THAN MAXVALUE);
+
+ALTER TABLE EPD_Patients ADD PARTITION (PARTITION pmax VALUES LESS THAN MAXVALUE);
+
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(200) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_migrations (version, name) VALUES (1, 'tables and yearly partitions');
+
+INSERT INTO schema_migrations (version, name) VALUES (2, 'report, search and medicine indexes');
+
+INSERT INTO schema_migrations (version, name) VALUES (3, 'fuzzy name trigram index');
+
+INSERT INTO schema_migrations (version, name) VALUES (4, 'phonetic name keys');
+
+INSERT INTO schema_migrations (version, name) VALUES (5, 'patient directory');
+
+INSERT INTO schema_migrations (version, name) VALUES (6, 'mobile number suffix index');
+
+INSERT INTO schema_migrations (version, name) VALUES (7, 'ipd transfer links');
+
+INSERT INTO schema_migrations (version, name) VALUES (8, 'catch-all partitions for future years');
@@ -0,0 +1,355 @@
+import datetime
+import functools
+import logging
+import re
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# Pragmas applied to every new connection. WAL lets the UI read while
+# registration writes are committing; NORMAL sync is safe under WAL.
+CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# sqlite3 keeps compiled statements per connection keyed by SQL text; size it
+# above the pool's prepared-statement cache so those cursors never recompile.
+STATEMENT_CACHE_SIZE = 256
+
+# Patient tables and the date column MySQL partitions them on (by YEAR()).
+PARTITIONED_TABLES = {
+    "OPD_Patients": "registration_date",
+    "IPD_Patients": "admission_date",
+    "EPD_Patients": "date",
+}
+
+_PLACEHOLDER_RE = re.compile(r"%s")
+
+
+def _convert_date(value):
+    text = value.decode()
+    try:
+        return datetime.date.fromisoformat(text[:10])
+    except ValueError:
+        return text
+
+
+def _convert_datetime(value):
+    text = value.decode()
+    try:
+        return datetime.datetime.fromisoformat(text)
+    except ValueError:
+        return _convert_date(value)
+
+
+sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(sep=" ", timespec="seconds"))
+sqlite3.register_converter("DATE", _convert_date)
+sqlite3.register_converter("DATETIME", _convert_datetime)
+sqlite3.register_converter("TIMESTAMP", _convert_datetime)
+
+
+@functools.lru_cache(maxsize=512)
+def translate_sql(sql):
+    """
+    Rewrites MySQL-style %s placeholders to SQLite's qmark style.
+    """
+    return _PLACEHOLDER_RE.sub("?", sql)
+
+
+class SQLiteCursor:
+    """
+    Cursor with the subset of the mysql.connector cursor API used by the app:
+    %s placeholders, optional dictionary rows, lastrowid and rowcount.
+    """
+
+    def __init__(self, connection, dictionary=False):
+        self._cursor = connection.cursor()
+        self._dictionary = dictionary
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def column_names(self):
+        return tuple(col[0] for col in self._cursor.description or ())
+
+    def _shape(self, row):
+        if row is None:
+            return None
+        if self._dictionary:
+            return dict(zip(row.keys(), tuple(row)))
+        return tuple(row)
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(translate_sql(sql), tuple(params or ()))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate_sql(sql), [tuple(p) for p in seq_of_params])
+        return self
+
+    def fetchone(self):
+        return self._shape(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size else self._cursor.fetchmany()
+        return [self._shape(r) for r in rows]
+
+    def fetchall(self):
+        return [self._shape(r) for r in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._shape(row)
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """
+    Thin wrapper exposing the mysql.connector connection methods used by the
+    database layer and ui.py (cursor(dictionary=True), commit, rollback, close).
+    """
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self._raw, dictionary=dictionary)
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def is_connected(self):
+        try:
+            self._raw.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def ping(self, reconnect=False):
+        if not self.is_connected():
+            raise sqlite3.OperationalError("SQLite connection is closed")
+
+    def close(self):
+        self._raw.close()
+
+
+def connect(path):
+    """
+    Opens a tuned SQLite connection wrapped in the MySQL-compatible API.
+    """
+    raw = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False,
+        timeout=5.0,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    raw.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        raw.execute(pragma)
+    return SQLiteConnection(raw)
+
+
+def enable_wal(conn):
+    """
+    Switches the database file to write-ahead logging (persistent setting).
+    """
+    mode = conn.raw.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    if str(mode).lower() != "wal":
+        logger.warning(f"SQLite journal_mode is {mode}, WAL not available for this file")
+    return mode
+
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL,
+        plain_password TEXT,
+        role TEXT NOT NULL DEFAULT 'user',
+        sections_allowed TEXT,
+        is_logged_in INTEGER NOT NULL DEFAULT 0,
+        last_login DATETIME,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_cash_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        date DATE NOT NULL,
+        cash_in_hand DECIMAL(10,2) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (username, date)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS registration_counters (
+        patient_type TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        last_value INTEGER NOT NULL,
+        PRIMARY KEY (patient_type, year)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS OPD_Patients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        registration_number TEXT NOT NULL,
+        first_name TEXT NOT NULL,
+        last_name TEXT,
+        father_name TEXT,
+        abha_number TEXT,
+        age INTEGER,
+        gender TEXT,
+        mobile_number TEXT,
+        email TEXT,
+        address TEXT,
+        post_office TEXT,
+        town TEXT,
+        state TEXT,
+        registration_fee DECIMAL(10,2) DEFAULT 5.00,
+        payment_status TEXT DEFAULT 'Paid',
+        registration_date DATE NOT NULL,
+        medical_department TEXT,
+        created_by TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS IPD_Patients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        registration_number TEXT NOT NULL,
+        first_name TEXT NOT NULL,
+        last_name TEXT,
+        father_name TEXT,
+        abha_number TEXT,
+        age INTEGER,
+        gender TEXT,
+        mobile_number TEXT,
+        email TEXT,
+        address TEXT,
+        post_office TEXT,
+        town TEXT,
+        state TEXT,
+        medical_department TEXT,
+        police_case TEXT DEFAULT 'No',
+        bed_number TEXT,
+        room_number TEXT,
+        admission_date DATE NOT NULL,
+        discharge_date DATE,
+        notes TEXT,
+        created_by TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS EPD_Patients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        registration_number TEXT NOT NULL,
+        first_name TEXT NOT NULL,
+        last_name TEXT,
+        father_name TEXT,
+        abha_number TEXT,
+        age INTEGER,
+        gender TEXT,
+        mobile_number TEXT,
+        email TEXT,
+        address TEXT,
+        post_office TEXT,
+        town TEXT,
+        state TEXT,
+        medical_department TEXT,
+        police_case TEXT DEFAULT 'No',
+        emergency_type TEXT,
+        arrival_mode TEXT,
+        arrival_datetime DATETIME,
+        triage_level TEXT,
+        attending_doctor TEXT,
+        discharge_datetime DATETIME,
+        outcome TEXT,
+        notes TEXT,
+        date DATE NOT NULL,
+        created_by TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS medicines (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS medicine_purchases (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        medicine_id INTEGER NOT NULL REFERENCES medicines(id),
+        supplier TEXT,
+        quantity INTEGER NOT NULL,
+        purchase_date DATE NOT NULL,
+        expiry_date DATE,
+        unit_price DECIMAL(10,2),
+        batch_number TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS medicine_supplies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        medicine_id INTEGER NOT NULL REFERENCES medicines(id),
+        purchase_id INTEGER REFERENCES medicine_purchases(id),
+        quantity INTEGER NOT NULL,
+        supply_date DATE NOT NULL,
+        department TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_opd_reg_no ON OPD_Patients (registration_number)",
+    "CREATE INDEX IF NOT EXISTS idx_opd_date ON OPD_Patients (registration_date, registration_number)",
+    "CREATE INDEX IF NOT EXISTS idx_ipd_reg_no ON IPD_Patients (registration_number)",
+    "CREATE INDEX IF NOT EXISTS idx_ipd_date ON IPD_Patients (admission_date, registration_number)",
+    "CREATE INDEX IF NOT EXISTS idx_epd_reg_no ON EPD_Patients (registration_number)",
+    "CREATE INDEX IF NOT EXISTS idx_epd_date ON EPD_Patients (date, registration_number)",
+    "CREATE INDEX IF NOT EXISTS idx_purchases_medicine ON medicine_purchases (medicine_id, expiry_date)",
+    "CREATE INDEX IF NOT EXISTS idx_supplies_medicine ON medicine_supplies (medicine_id)",
+    "CREATE INDEX IF NOT EXISTS idx_supplies_purchase ON medicine_supplies (purchase_id)",
+)
+
+
+def create_schema(conn):
+    """
+    Creates all tables and secondary indexes. SQLite has no partitions; the
+    (date, registration_number) indexes serve the per-year date ranges.
+    """
+    cur = conn.raw.cursor()
+    try:
+        for statement in SCHEMA:
+            cur.execute(statement)
+    finally:
+        cur.close()
+    conn.commit()
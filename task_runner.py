@@ -0,0 +1,166 @@
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Kept below DB_POOL_SIZE so background work never starves the pool.
+MAX_WORKERS = int(os.getenv("UI_WORKERS", "4"))
+POLL_MS = 25
+
+_current = threading.local()
+
+
+class Task:
+    """
+    Handle for a submitted job. A keyed task is cancelled as soon as a newer
+    task is submitted under the same key; its result is then never delivered.
+    """
+
+    def __init__(self, name, key=None):
+        self.name = name
+        self.key = key
+        self.future = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+
+def current_task():
+    """
+    Returns the Task running on this worker thread (None elsewhere), so long
+    jobs can check `current_task().cancelled` and stop early.
+    """
+    return getattr(_current, "task", None)
+
+
+class TaskRunner:
+    """
+    Shared bounded worker pool for database and file work started from the UI.
+
+    - submit() runs a callable on a worker and returns a Task.
+    - key= gives "latest request wins" per widget: submitting again under the
+      same key cancels the previous task and drops its result.
+    - on_done/on_error callbacks, and anything passed to call_soon(), run on
+      the Tk mainloop via one thread-safe queue drained every POLL_MS.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="hms-worker"
+        )
+        self._dispatch = queue.SimpleQueue()
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._root = None
+
+    def attach(self, root):
+        """
+        Starts draining the dispatch queue on `root`'s mainloop.
+        """
+        if self._root is None:
+            self._root = root
+            root.after(POLL_MS, self._pump)
+
+    def submit(self, fn, *args, key=None, on_done=None, on_error=None, **kwargs):
+        task = Task(getattr(fn, "__name__", repr(fn)), key)
+        if key is not None:
+            with self._lock:
+                previous = self._latest.get(key)
+                self._latest[key] = task
+            if previous is not None:
+                previous.cancel()
+        task.future = self._executor.submit(self._run, task, fn, args, kwargs)
+        task.future.add_done_callback(lambda future: self._finish(task, future, on_done, on_error))
+        return task
+
+    def cancel(self, key):
+        """
+        Cancels the pending task for `key`, if any.
+        """
+        with self._lock:
+            task = self._latest.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    def call_soon(self, fn, *args):
+        """
+        Schedules fn(*args) on the mainloop; safe to call from any thread.
+        """
+        self._dispatch.put((fn, args))
+
+    def shutdown(self):
+        with self._lock:
+            tasks, self._latest = list(self._latest.values()), {}
+        for task in tasks:
+            task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, task, fn, args, kwargs):
+        if task.cancelled:
+            return None
+        _current.task = task
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.task = None
+
+    def _finish(self, task, future, on_done, on_error):
+        if task.key is not None:
+            with self._lock:
+                if self._latest.get(task.key) is task:
+                    del self._latest[task.key]
+        if task.cancelled or future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Background task {task.name} failed: {error!r}")
+            if on_error:
+                self.call_soon(self._deliver, task, on_error, error)
+        elif on_done:
+            self.call_soon(self._deliver, task, on_done, future.result())
+
+    @staticmethod
+    def _deliver(task, callback, value):
+        # Re-checked on the mainloop: a newer request may have arrived meanwhile.
+        if not task.cancelled:
+            callback(value)
+
+    def _pump(self):
+        while True:
+            try:
+                fn, args = self._dispatch.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"UI callback {getattr(fn, '__name__', fn)} failed: {e}")
+        try:
+            self._root.after(POLL_MS, self._pump)
+        except Exception:
+            pass  # root window destroyed
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """
+    Returns the process-wide TaskRunner.
+    """
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = TaskRunner()
+    return _runner
@@ -0,0 +1,50 @@
+import logging
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The suite runs against the SQLite backend. Set up before database is
+# imported: its basicConfig would otherwise log to patient_app.log here.
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ.pop("SQLITE_READ_PATH", None)
+os.environ["SLOW_QUERY_LOG"] = os.devnull
+logging.getLogger().addHandler(logging.NullHandler())
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """
+    The database module on a fresh, migrated SQLite file.
+    """
+    import database
+
+    database.close_pool()
+    monkeypatch.setattr(database, "SQLITE_PATH", str(tmp_path / "hms.sqlite3"))
+    monkeypatch.setattr(database, "_sqlite_ready", False)
+    database._patient_cache.clear()
+    database._fuzzy_cache.clear()
+    database._gram_cache.clear()
+    database._query_stats.reset()
+    yield database
+    database.close_pool()
+
+
+@pytest.fixture
+def add_opd(db):
+    """
+    Adds an OPD patient; keyword arguments override the defaults.
+    """
+    def add(registration_number, **fields):
+        values = dict(
+            first_name="Ram", last_name="Kumar", father_name="Shyam", abha_number="", age=30,
+            gender="Male", mobile_number="9876543210", email="", address="", post_office="",
+            town="Samastipur", state="Bihar",
+        )
+        values.update(fields)
+        assert db.add_opd_patient(registration_number, **values) == registration_number
+        return registration_number
+    return add
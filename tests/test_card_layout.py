@@ -0,0 +1,67 @@
+import types
+
+import pytest
+
+import card_layout
+
+PATIENT = {
+    "registration_number": "OPD1", "first_name": "Ram", "last_name": "Kumar", "father_name": "Shyam",
+    "age": 30, "gender": "Male", "address": "Ward 4", "town": "Samastipur", "state": "Bihar",
+    "mobile_number": "9876543210", "registration_date": "06/05/2025",
+}
+
+
+@pytest.fixture(autouse=True)
+def fonts(monkeypatch):
+    # tkfont.Font needs a Tk root; measure 7 px per character, 15 px a line.
+    font = types.SimpleNamespace(measure=lambda text: 7 * len(text), metrics=lambda option: 15)
+    monkeypatch.setattr(card_layout, "_font", lambda spec: font)
+    card_layout._layouts.clear()
+    yield
+    card_layout._layouts.clear()
+
+
+def test_record_version_follows_every_field():
+    version = card_layout.record_version(PATIENT)
+    assert card_layout.record_version(dict(reversed(list(PATIENT.items())))) == version
+    assert card_layout.record_version({**PATIENT, "age": 31}) != version
+
+
+@pytest.mark.parametrize("build", [card_layout.opd_card, card_layout.ipd_bed_head_ticket, card_layout.epd_card])
+def test_layouts_are_cached_until_the_record_changes(build):
+    data = dict(PATIENT)
+    layout = build(data)
+    assert build(dict(PATIENT)) is layout and layout.items
+
+    data["first_name"] = "Sita"
+    assert layout.data["first_name"] == "Ram"
+    edited = build(data)
+    assert edited is not layout
+    assert any(options.get("text") == "Sita Kumar" for _kind, _coords, options in edited.items)
+
+
+def test_grid_aligns_columns_and_rows_like_tk():
+    layout = card_layout.CardLayout(100, 100, {})
+    height = layout.grid(10, 20, [
+        {"row": 0, "col": 0, "text": "Name", "font": "f"},
+        {"row": 0, "col": 1, "text": "Ram", "font": "f"},
+        {"row": 1, "col": 0, "text": "Mobile", "font": "f", "pady": (7, 0)},
+        {"row": 1, "col": 1, "text": "98765", "font": "f", "pady": (7, 0)},
+    ])
+    (name, ram, mobile, number) = [coords for _kind, coords, _options in layout.items]
+    label_width = 7 * len("Mobile") + 2 * card_layout._LABEL_PADX
+    assert name[0] == mobile[0] and ram[0] == number[0] == name[0] + label_width
+    assert name[1] == ram[1] and mobile[1] == number[1] == name[1] + 15 + 2 * card_layout._LABEL_PADY + 7
+    assert height == 2 * (15 + 2 * card_layout._LABEL_PADY) + 7
+
+
+def test_draw_replays_the_items_on_the_canvas():
+    calls = []
+    canvas = types.SimpleNamespace(
+        create_text=lambda *coords, **options: calls.append(("text", coords)),
+        create_line=lambda *coords, **options: calls.append(("line", coords)),
+        create_rectangle=lambda *coords, **options: calls.append(("rectangle", coords)),
+    )
+    layout = card_layout.epd_card(PATIENT)
+    layout.draw(canvas)
+    assert calls == [(kind, coords) for kind, coords, _options in layout.items]
@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+import sqlite_backend
+from connection_pool import ConnectionPool, ConnectionUnavailableError
+
+
+@pytest.fixture
+def pool(tmp_path):
+    path = str(tmp_path / "pool.sqlite3")
+    pool = ConnectionPool(lambda: sqlite_backend.connect(path), max_size=2, timeout=0.2, statement_cache_size=2)
+    with pool.lease() as cursor:
+        cursor.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    yield pool
+    pool.close()
+
+
+def test_lease_commits_and_rolls_back(pool):
+    with pool.lease() as cursor:
+        cursor.execute("INSERT INTO t (v) VALUES (%s)", ("kept",))
+    with pytest.raises(RuntimeError):
+        with pool.lease() as cursor:
+            cursor.execute("INSERT INTO t (v) VALUES (%s)", ("dropped",))
+            raise RuntimeError("boom")
+    with pool.lease(dictionary=True) as cursor:
+        cursor.execute("SELECT v FROM t")
+        assert cursor.fetchall() == [{"v": "kept"}]
+    assert pool.stats()["in_use"] == 0
+
+
+def test_exhausted_pool_times_out(pool):
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(ConnectionUnavailableError):
+        pool.acquire()
+    for conn in held:
+        conn.close()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_thread_gets_its_connection_back(pool):
+    with pool.lease():
+        pass
+    with pool.lease():
+        pass
+    assert pool.stats()["affinity_hits"] >= 1
+
+
+
+def test_waiting_checkout_gets_a_returned_connection(pool):
+    held = [pool.acquire(), pool.acquire()]
+    threading.Timer(0.05, held[0].close).start()
+    conn = pool.acquire()
+    conn.close()
+    held[1].close()
+    stats = pool.stats()
+    assert stats["waits"] == 1 and stats["timeouts"] == 0 and stats["created"] == 2
+
+
+def test_dead_idle_connection_is_replaced(pool):
+    pool.ping_after = 0
+    pool._idle[0].conn.close()
+    time.sleep(0.01)
+    with pool.lease() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM t")
+        assert cursor.fetchone() == (0,)
+    stats = pool.stats()
+    assert stats["ping_failures"] == 1 and stats["discarded"] == 1
+
+
+def test_long_lease_is_reported_once(pool, caplog):
+    pool.leak_after = 0.05
+    held = pool.acquire()
+    time.sleep(0.06)
+    with pool.lease():
+        pass
+    held.close()
+    assert pool.stats()["leaks_reported"] == 1
+    assert "possible connection leak" in caplog.text
+
+
+def test_database_lease_returns_its_connection(db):
+    with pytest.raises(RuntimeError):
+        with db.lease() as cursor:
+            cursor.execute("INSERT INTO medicines (name) VALUES (%s)", ("Paracetamol",))
+            raise RuntimeError("boom")
+    conn = db.get_db_connection()
+    conn.close()
+    assert db.add_medicine("Paracetamol") == 1
+    stats = db.pool_stats()
+    assert stats["in_use"] == 0 and stats["checkouts"] >= 3
+
+def test_prepared_statement_cache(pool):
+    for value in ("a", "b", "c"):
+        with pool.lease(prepared=True) as cursor:
+            cursor.execute("SELECT id FROM t WHERE v = %s", (value,))
+            cursor.fetchall()
+    stats = pool.stats()
+    assert stats["statement_cache_misses"] == 1
+    assert stats["statement_cache_hits"] == 2
+
+
+def test_prepared_statements_evict_least_recently_used(pool):
+    queries = ["SELECT id FROM t WHERE v = %s", "SELECT v FROM t WHERE id = %s", "SELECT COUNT(*) FROM t WHERE v = %s"]
+    with pool.lease(prepared=True) as cursor:
+        for sql in (queries[0], queries[1], queries[0], queries[2], queries[0]):
+            cursor.execute(sql, ("x",))
+        assert list(cursor._slot.statements) == [queries[2], queries[0]]
+    stats = pool.stats()
+    assert stats["statement_cache_evictions"] == 1
+    assert stats["statement_cache_hits"] == 2 and stats["statement_cache_misses"] == 3
+
+
+def test_prepared_cursor_reads_eagerly(pool):
+    with pool.lease(prepared=True, dictionary=True) as cursor:
+        cursor.execute("INSERT INTO t (v) VALUES (%s)", ("a",))
+        assert cursor.rowcount == 1 and cursor.lastrowid == 1
+        cursor.execute("INSERT INTO t (v) VALUES (%s)", ("b",))
+        cursor.execute("SELECT id, v FROM t ORDER BY id")
+        assert cursor.fetchone() == {"id": 1, "v": "a"}
+        # A new execute drops the unread rows instead of leaving them on
+        # the cached cursor.
+        cursor.execute("SELECT v FROM t WHERE id = %s", (2,))
+        assert cursor.fetchall() == [{"v": "b"}]
+
+
+def test_discarded_connection_drops_its_statements(pool):
+    conn = pool.acquire()
+    slot = conn._slot
+    pool._statement(slot, "SELECT v FROM t")
+    conn.discard()
+    assert len(slot.statements) == 0
+    assert pool.stats()["discarded"] == 1
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+from PIL import Image
+
+import image_assets
+
+
+@pytest.fixture
+def assets(tmp_path, monkeypatch):
+    """
+    Fresh icon caches, PhotoImage replaced (it needs a Tk root) and
+    Image.open counted. Yields (png path, list of opened paths).
+    """
+    monkeypatch.setattr(image_assets, "_sources", {})
+    monkeypatch.setattr(image_assets, "_photos", {})
+    monkeypatch.setattr(image_assets, "_packed", None)
+    monkeypatch.setattr(image_assets, "ASSET_CACHE_PATH", "")
+    monkeypatch.setattr(image_assets.ImageTk, "PhotoImage", lambda image: ("photo", image.size, image.tobytes()))
+    opened = []
+    real_open = Image.open
+    monkeypatch.setattr(image_assets.Image, "open", lambda path: opened.append(path) or real_open(path))
+    path = str(tmp_path / "admin.png")
+    Image.new("RGB", (40, 40), "red").save(path)
+    yield path, opened
+
+
+def _touch(path, colour):
+    stat = os.stat(path)
+    Image.new("RGB", (40, 40), colour).save(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_each_file_is_decoded_once_and_each_size_scaled_once(assets):
+    path, opened = assets
+    small = image_assets.icon(path, (16, 16))
+    assert image_assets.icon(path, [16, 16]) is small
+    assert image_assets.icon(path, (32, 32))[1] == (32, 32)
+    assert opened == [path]
+
+
+def test_changed_or_missing_files_are_picked_up(assets):
+    path, opened = assets
+    red = image_assets.icon(path, (16, 16))
+    _touch(path, "blue")
+    assert image_assets.icon(path, (16, 16)) != red and len(opened) == 2
+    os.remove(path)
+    assert image_assets.icon(path, (16, 16)) is None
+
+
+def test_packed_cache_skips_decoding_on_the_next_start(assets, tmp_path, monkeypatch):
+    path, opened = assets
+    monkeypatch.setattr(image_assets, "ASSET_CACHE_PATH", str(tmp_path / "icons.bin"))
+    first = image_assets.icon(path, (16, 16))
+
+    monkeypatch.setattr(image_assets, "_sources", {})
+    monkeypatch.setattr(image_assets, "_photos", {})
+    monkeypatch.setattr(image_assets, "_packed", None)
+    assert image_assets.icon(path, (16, 16)) == first and opened == [path]
+
+
+def test_unreadable_packed_cache_is_ignored(assets, tmp_path, monkeypatch):
+    path, opened = assets
+    cache = tmp_path / "icons.bin"
+    cache.write_bytes(b"not a cache")
+    monkeypatch.setattr(image_assets, "ASSET_CACHE_PATH", str(cache))
+    assert image_assets.icon(path, (16, 16))[1] == (16, 16) and opened == [path]
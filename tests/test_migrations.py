@@ -0,0 +1,58 @@
+import migrations
+import patient_directory
+import sqlite_backend
+
+YEARS = range(2024, 2027)
+
+
+def _connect(tmp_path):
+    return sqlite_backend.connect(str(tmp_path / "migrate.sqlite3"))
+
+
+def test_migrate_applies_every_version_once(tmp_path):
+    conn = _connect(tmp_path)
+    versions = [version for version, _name, _apply in migrations.MIGRATIONS]
+    assert migrations.migrate(conn, "sqlite", YEARS) == versions
+    assert migrations.migrate(conn, "sqlite", YEARS) == []
+    assert migrations.applied_versions(conn) == set(versions)
+
+
+def test_migrations_can_be_reapplied(tmp_path):
+    # A migration interrupted before it was recorded runs again on the next
+    # start, so every step has to tolerate its own earlier work.
+    conn = _connect(tmp_path)
+    migrations.migrate(conn, "sqlite", YEARS)
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO OPD_Patients (registration_number, first_name, mobile_number, registration_date) "
+        "VALUES (%s, %s, %s, %s)",
+        ("OPD1", "Ram", "9876543210", "2025-01-02"),
+    )
+    cursor.execute("DELETE FROM schema_migrations")
+    conn.commit()
+
+    assert len(migrations.migrate(conn, "sqlite", YEARS)) == len(migrations.MIGRATIONS)
+    cursor.execute("SELECT registration_number, mobile_reversed FROM patient_directory")
+    assert cursor.fetchall() == [("OPD1", "0123456789")]
+
+
+def test_directory_column_comes_from_v6_only(tmp_path):
+    assert "mobile_reversed" not in patient_directory.TABLE_SQL
+    conn = _connect(tmp_path)
+    migrations.migrate(conn, "sqlite", YEARS)
+    cursor = conn.cursor()
+    assert migrations._column_exists(cursor, "sqlite", "patient_directory", "mobile_reversed")
+
+
+def test_mysql_schema_ends_patient_tables_with_a_catchall_partition():
+    sql = migrations.schema_sql(YEARS)
+    for table in sqlite_backend.PARTITIONED_TABLES:
+        assert f"ALTER TABLE {table} ADD PARTITION (PARTITION pmax VALUES LESS THAN MAXVALUE)" in sql
+    assert "PARTITION p2026 VALUES LESS THAN (2027)" in sql
+
+
+def test_query_indexes_exist_after_migrating(db):
+    assert db.schema_version() == migrations.MIGRATIONS[-1][0]
+    with db.lease() as cursor:
+        for table, name, _columns, _nocase in migrations.INDEXES:
+            assert migrations._index_exists(cursor, "sqlite", table, name), name
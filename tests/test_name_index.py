@@ -0,0 +1,18 @@
+import pytest
+
+import name_index
+
+
+@pytest.mark.parametrize("spellings", [
+    ("mohammad", "muhammed", "mohd", "md"),
+    ("bhushan", "booshan"),
+    ("chhotu", "chotu"),
+    ("kumar", "kr"),
+])
+def test_spelling_variants_share_a_phonetic_key(spellings):
+    keys = {name_index.phonetic_key(word) for word in spellings}
+    assert len(keys) == 1 and keys != {""}
+
+
+def test_words_drop_accents_punctuation_and_repeats():
+    assert name_index.words("Zoë  D'Souza zoe") == ["zoe", "d", "souza"]
@@ -0,0 +1,39 @@
+def test_year_slices_only_name_existing_partitions(db):
+    slices = db._year_slices("15/06/2018", "10/03/2027", frozenset(range(2020, 2027)))
+    assert slices[0] == (None, "2027-01-01", "2027-03-10")
+    assert slices[1] == (2026, "2026-01-01", "2026-12-31")
+    assert slices[-1] == (2020, "2018-06-15", "2020-12-31")
+    assert len(slices) == 8
+
+
+def test_year_slices_without_partitions(db):
+    slices = db._year_slices("01/01/2024", "31/01/2025")
+    assert slices == [(None, "2025-01-01", "2025-01-31"), (None, "2024-01-01", "2024-12-31")]
+
+
+def test_multi_year_stream_matches_single_query(db, add_opd, monkeypatch):
+    dates = ["2022-02-01", "2023-05-05", "2023-05-05", "2024-07-01", "2025-12-31"]
+    for i, date in enumerate(dates):
+        add_opd(f"OPD{i}", registration_date=date)
+    criteria = dict(patient_type="OPD", from_date="01/01/2022", to_date="31/12/2025")
+    expected, _info = db.search_patients(page_size=100, **criteria)
+
+    monkeypatch.setattr(db, "PARTITION_FANOUT_PER_SEARCH", 1)
+    streamed = [row for chunk in db.iter_search_patients(first_chunk=1, chunk_size=2, **criteria) for row in chunk]
+
+    assert [r["registration_number"] for r in streamed] == [r["registration_number"] for r in expected]
+    assert len(streamed) == len(dates)
+
+
+def test_year_range_search_uses_the_date_index(db, add_opd):
+    add_opd("OPD1", registration_date="2024-03-01")
+    (select, _date_col, where, args), = db._search_branches(
+        patient_type="OPD", from_date="01/01/2024", to_date="31/12/2024"
+    )[0]
+    with db.lease(dictionary=True) as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {select} WHERE {' AND '.join(where)}", args)
+        plan = " ".join(row["detail"] for row in cursor.fetchall())
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE '%\\_p20%' ESCAPE '\\'")
+        per_year = cursor.fetchall()
+    assert "INDEX idx_opd_date (registration_date>? AND registration_date<?)" in plan, plan
+    assert per_year == []
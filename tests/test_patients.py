@@ -0,0 +1,308 @@
+import base64
+import json
+
+import pytest
+
+
+def _numbers(rows):
+    return [row["registration_number"] for row in rows]
+
+
+def test_keyset_pages_cover_every_patient_once(db, add_opd):
+    dates = ["2025-01-01", "2025-01-01", "2025-01-01", "2025-02-01", "2025-03-01"]
+    for i, date in enumerate(dates):
+        add_opd(f"OPD{i}", registration_date=date)
+
+    seen, token = [], None
+    while True:
+        rows, _info, token = db.search_patients_page(token, page_size=2, patient_type="OPD")
+        seen += _numbers(rows)
+        if not token:
+            break
+    assert seen == ["OPD4", "OPD3", "OPD2", "OPD1", "OPD0"]
+
+
+def test_page_token_is_tied_to_its_search(db, add_opd):
+    for i in range(3):
+        add_opd(f"OPD{i}")
+    _rows, _info, token = db.search_patients_page(page_size=1, patient_type="OPD")
+
+    with pytest.raises(ValueError):
+        db.search_patients_page(token, page_size=1, patient_type="IPD")
+
+    date, number, fingerprint = json.loads(base64.urlsafe_b64decode(token))
+    forged = base64.urlsafe_b64encode(json.dumps([date, number, fingerprint + 1]).encode()).decode()
+    with pytest.raises(ValueError):
+        db.search_patients_page(forged, page_size=1, patient_type="OPD")
+    with pytest.raises(ValueError):
+        db.search_patients_page("not-a-token", page_size=1, patient_type="OPD")
+
+
+def _token(*key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def test_page_token_checks_filter_values_and_shape(db, add_opd):
+    for i in range(3):
+        add_opd(f"OPD{i}")
+    _rows, _info, token = db.search_patients_page(page_size=1, name="Ram")
+    date, number, fingerprint = json.loads(base64.urlsafe_b64decode(token))
+
+    with pytest.raises(ValueError):
+        db.search_patients_page(token, page_size=1, name="Rama")
+    with pytest.raises(ValueError):
+        db.search_patients_page(_token(date, fingerprint), page_size=1, name="Ram")
+    rows, _info, _next = db.search_patients_page(token, page_size=5, name="Ram")
+    assert _numbers(rows) == ["OPD1", "OPD0"]
+
+
+def test_page_token_values_are_bound_not_spliced(db, add_opd):
+    add_opd("OPD1")
+    add_opd("OPD2")
+    _rows, _info, token = db.search_patients_page(page_size=1)
+    _date, _number, fingerprint = json.loads(base64.urlsafe_b64decode(token))
+
+    forged = _token("2999-01-01' OR '1'='1", "OPD9'; DROP TABLE OPD_Patients; --", fingerprint)
+    rows, _info, _next = db.search_patients_page(forged, page_size=5)
+    assert _numbers(rows) == ["OPD2", "OPD1"]  # the forged date is just a value after every visit
+    assert db.get_patient("opd", "OPD1") is not None
+
+
+def test_streamed_search_sends_a_small_first_chunk(db, add_opd):
+    for i in range(7):
+        add_opd(f"OPD{i}", registration_date=f"2025-02-0{i + 1}")
+    chunks = list(db.iter_search_patients(first_chunk=2, chunk_size=3, patient_type="OPD"))
+
+    assert [len(chunk) for chunk in chunks] == [2, 3, 2]
+    assert [number for chunk in chunks for number in _numbers(chunk)] == [f"OPD{i}" for i in range(6, -1, -1)]
+
+
+def test_streamed_search_rejects_bad_filters_before_reading(db):
+    with pytest.raises(ValueError):
+        next(db.iter_search_patients(age="thirty"))
+
+
+def test_update_invalidates_cached_patient(db, add_opd):
+    add_opd("OPD1", first_name="Ram", registration_date="2025-05-06")
+    assert db.get_patient("opd", "OPD1")["first_name"] == "Ram"
+    assert db.get_patient("opd", "OPD1")["first_name"] == "Ram"
+    assert db.patient_cache_stats()["hits"] == 1
+
+    assert db.update_patient("OPD1", "06/05/2025", first_name="Shyam")
+    assert db.get_patient("opd", "OPD1")["first_name"] == "Shyam"
+
+
+
+def test_cached_patient_is_a_copy(db, add_opd):
+    add_opd("OPD1", registration_date="2025-05-06")
+    db.get_patient("opd", "OPD1")["first_name"] = "changed by caller"
+    assert db.get_patient("opd", "OPD1")["first_name"] == "Ram"
+
+
+def test_invalidate_patient_after_a_direct_write(db, add_opd):
+    add_opd("OPD1", registration_date="2025-05-06")
+    db.get_patient("opd", "OPD1")
+    with db.lease() as cursor:
+        cursor.execute("UPDATE OPD_Patients SET age = %s WHERE registration_number = %s", (41, "OPD1"))
+    assert db.get_patient("opd", "OPD1")["age"] == 30
+
+    db.invalidate_patient("OPD", "OPD1")
+    assert db.get_patient("opd", "OPD1")["age"] == 41
+
+
+def test_failed_update_leaves_cache_and_counter(db, add_opd):
+    add_opd("OPD1", registration_date="2025-05-06")
+    db.get_patient("opd", "OPD1")
+    changes = db.patient_change_count()
+
+    assert db.update_patient("OPD1", "07/05/2025", first_name="Shyam") is False  # wrong visit date
+    assert db.patient_change_count() == changes
+    assert db.get_patient("opd", "OPD1")["first_name"] == "Ram"
+
+
+def test_bulk_insert_reports_each_row(db, add_opd):
+    add_opd("OPD1")
+    rows = [
+        {"registration_number": "OPD1", "first_name": "Existing"},
+        {"registration_number": "OPD2", "first_name": "Sita"},
+        {"registration_number": "OPD2", "first_name": "Repeated"},
+        {"registration_number": "OPD3", "first_name": None},  # violates NOT NULL
+        {"registration_number": "OPD4", "first_name": "Gita"},
+    ]
+    outcomes = db.add_opd_patients_bulk(rows, batch_size=10)
+
+    assert [number for number, _error in outcomes] == ["OPD1", "OPD2", "OPD2", "OPD3", "OPD4"]
+    assert [error is None for _number, error in outcomes] == [False, True, False, False, True]
+    assert "Duplicate" in outcomes[0][1] and "Duplicate" in outcomes[2][1]
+    assert db.get_patient("opd", "OPD3") is None
+    assert db.get_patient("opd", "OPD4")["first_name"] == "Gita"
+    rows, _info, _token = db.search_patients_page(page_size=10, patient_type="All")
+    assert sorted(_numbers(rows)) == ["OPD1", "OPD2", "OPD4"]
+
+
+def test_bulk_insert_keeps_good_rows_of_a_failing_batch(db):
+    rows = [{"registration_number": f"OPD{i}", "first_name": "Sita"} for i in range(5)]
+    rows[3]["first_name"] = None  # violates NOT NULL; its batch is replayed row by row
+    outcomes = db.add_opd_patients_bulk(rows, batch_size=2)
+
+    assert [error is None for _number, error in outcomes] == [True, True, True, False, True]
+    listed, _info = db.search_patients(patient_type="All")
+    assert sorted(_numbers(listed)) == ["OPD0", "OPD1", "OPD2", "OPD4"]
+    assert len(db.fuzzy_name_search("Sita", limit=10)) == 4
+
+
+def test_bulk_insert_allocates_missing_numbers(db):
+    outcomes = db.add_opd_patients_bulk([{"first_name": "Ram"}, {"first_name": "Sita"}])
+    numbers = [number for number, error in outcomes if error is None]
+    assert len(numbers) == 2 and len(set(numbers)) == 2
+
+
+@pytest.mark.parametrize("patient_type", ["All", "OPD"])
+def test_phone_suffix_search(db, add_opd, patient_type):
+    add_opd("OPD1", mobile_number="98765 43210")
+    add_opd("OPD2", mobile_number="9123443210")
+    add_opd("OPD3", mobile_number="9876501234")
+
+    rows, _info = db.search_patients(phone="43210", phone_match="suffix", patient_type=patient_type)
+    assert sorted(_numbers(rows)) == ["OPD1", "OPD2"]
+    rows, _info = db.search_patients(phone="1234", phone_match="suffix", patient_type=patient_type)
+    assert _numbers(rows) == ["OPD3"]
+
+
+def test_transfer_candidates_page_past_transferred_patients(db, add_opd):
+    for i in range(5):
+        add_opd(f"OPD{i}", registration_date=f"2025-01-0{i + 1}")
+    with db.lease() as cursor:
+        db.record_ipd_transfer(cursor, "opd", "OPD3", "IPD1")
+
+    seen, token, pages = [], None, 0
+    while True:
+        rows, token = db.get_transfer_candidates("opd", page_token=token, page_size=2)
+        seen += _numbers(rows)
+        pages += 1
+        if not token:
+            break
+    assert seen == ["OPD4", "OPD2", "OPD1", "OPD0"]
+    assert pages == 2
+
+    rows, token = db.get_transfer_candidates("opd", search="OPD", page_size=10)
+    assert "OPD3" not in _numbers(rows) and token is None
+
+
+
+def test_fuzzy_transfer_candidates_skip_transferred_before_the_page_cut(db, add_opd):
+    for i in range(6):
+        add_opd(f"OPD{i}", first_name="Ramesh")
+    with db.lease() as cursor:
+        for i in range(3):
+            db.record_ipd_transfer(cursor, "opd", f"OPD{i}", f"IPD{i}")
+
+    seen, token, pages = [], None, 0
+    while True:
+        rows, token = db.get_transfer_candidates("opd", search="Ramesh", page_token=token, page_size=2)
+        seen += _numbers(rows)
+        pages += 1
+        if not token:
+            break
+    assert sorted(seen) == ["OPD3", "OPD4", "OPD5"]
+    assert pages == 2
+
+
+def test_renamed_patient_shows_up_in_fuzzy_search(db, add_opd):
+    add_opd("OPD1", first_name="Ramesh", registration_date="2025-05-06")
+    assert _numbers(db.fuzzy_name_search("Suresh")) == []
+
+    db.update_patient("OPD1", "2025-05-06", first_name="Suresh")
+    assert _numbers(db.fuzzy_name_search("Suresh")) == ["OPD1"]
+
+
+def test_fuzzy_search_keeps_best_matches_after_other_filters(db, add_opd, monkeypatch):
+    monkeypatch.setattr(db, "FUZZY_NAME_CANDIDATES", 2)
+    add_opd("OPD1", first_name="Ramesh", town="Patna")
+    add_opd("OPD2", first_name="Ramesh", town="Patna")
+    add_opd("OPD3", first_name="Rameshwar", town="Darbhanga")
+
+    rows, _info = db.search_patients(name="Ramesh", name_match="fuzzy", town="Darbhanga", patient_type="OPD")
+    assert _numbers(rows) == ["OPD3"]
+
+
+def test_fuzzy_scan_skips_common_grams_without_losing_matches(db, add_opd, monkeypatch):
+    for i, first_name in enumerate(["Kumari", "Kumar", "Kumkum", "Kumaari", "Mukesh"]):
+        add_opd(f"OPD{i}", first_name=first_name, last_name="")
+    expected = db.fuzzy_name_search("Kumari", limit=10)
+
+    db._fuzzy_cache.clear()
+    monkeypatch.setattr(db, "FUZZY_GRAM_MAX_ROWS", 1)
+    assert db.fuzzy_name_search("Kumari", limit=10) == expected
+    assert _numbers(expected)[:2] == ["OPD0", "OPD3"]
+
+
+def test_gram_scan_leaves_out_at_most_need_minus_one_grams():
+    import name_index
+
+    grams = ["  k", " ku", "kum", "uma", "mar", "ari", "ri "]
+    rows = {"  k": 90, " ku": 80, "kum": 70, "uma": 5, "mar": 60, "ari": 1, "ri ": 1}
+    assert name_index._scan_grams(grams, 3, rows, 10) == ["kum", "uma", "mar", "ari", "ri "]
+    assert name_index._scan_grams(grams, 1, rows, 10) == grams
+
+
+def test_sounds_like_search_matches_spelling_variants(db, add_opd):
+    add_opd("OPD1", first_name="Mohd", last_name="Irfan")
+    add_opd("OPD2", first_name="Muhammed", last_name="Irfaan")
+    add_opd("OPD3", first_name="Mahesh", last_name="Irfan")
+
+    rows, _info = db.search_patients(name="Mohammad Irfan", name_match="phonetic", patient_type="OPD")
+    assert sorted(_numbers(rows)) == ["OPD1", "OPD2"]
+
+
+def _add_other(add, number, **fields):
+    values = dict(
+        first_name="Sita", last_name="Devi", father_name="Ram", abha_number="", age=40, gender="Female",
+        mobile_number="9000000001", email="", address="", post_office="", town="Patna", state="Bihar",
+        medical_department="General",
+    )
+    values.update(fields)
+    assert add(number, **values) == number
+
+
+def test_directory_lists_every_patient_type(db, add_opd):
+    add_opd("OPD1", registration_date="2025-01-01")
+    _add_other(db.add_ipd_patient, "IPD1", admission_date="2025-01-02")
+    _add_other(db.add_epd_patient, "EPD1", date="2025-01-03")
+
+    rows = db.get_all_patients()
+    assert [(row["registration_number"], row["patient_type"]) for row in rows] == [
+        ("EPD1", "EPD"), ("IPD1", "IPD"), ("OPD1", "OPD"),
+    ]
+
+
+def test_directory_follows_patient_updates(db, add_opd):
+    add_opd("OPD1", first_name="Ramesh", mobile_number="9876543210", registration_date="2025-05-06")
+    _add_other(db.add_ipd_patient, "IPD1")
+
+    db.update_patient("OPD1", "2025-05-06", first_name="Suresh", mobile_number="9123400000")
+    db.update_ipd_patient("IPD1", age=41)
+
+    rows = {row["registration_number"]: row for row in db.get_all_patients()}
+    assert rows["OPD1"]["first_name"] == "Suresh" and rows["OPD1"]["mobile_number"] == "9123400000"
+    assert rows["IPD1"]["age"] == 41
+    rows, _info = db.search_patients(name="Suresh")
+    assert _numbers(rows) == ["OPD1"]
+    rows, _info = db.search_patients(phone="43210", phone_match="suffix")
+    assert _numbers(rows) == []
+
+
+def test_count_estimate_follows_the_filters_and_cap(db, add_opd, monkeypatch):
+    for i, town in enumerate(["Patna", "Patna", "Gaya"]):
+        add_opd(f"OPD{i}", town=town)
+    _add_other(db.add_ipd_patient, "IPD1", town="Patna")
+
+    assert db.estimate_patient_count() == 4
+    assert db.estimate_patient_count(town="Patna") == 3
+    assert db.estimate_patient_count(town="Patna", patient_type="OPD") == 2
+    assert db.estimate_patient_count(age="old") is None
+
+    monkeypatch.setattr(db, "COUNT_ESTIMATE_CAP", 2)
+    assert db.estimate_patient_count(town="Patna") == 2
+    rows, total = db.get_all_patients(estimate=True)
+    assert len(rows) == 4 and total == 2
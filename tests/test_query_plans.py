@@ -0,0 +1,33 @@
+import pytest
+
+
+def test_keyset_page_queries_are_not_reported(db, add_opd):
+    for i, date in enumerate(["2024-01-05", "2024-01-05", "2025-03-10", "2026-02-01"]):
+        add_opd(f"OPD{i}", registration_date=date)
+    db._query_stats.reset()
+
+    token = None
+    for patient_type in ("All", "OPD"):
+        _rows, _info, token = db.search_patients_page(page_size=2, patient_type=patient_type)
+        db.search_patients_page(token, page_size=2, patient_type=patient_type)
+
+    assert token is not None
+    assert db.check_query_plans(limit=20) == []
+
+
+def test_unindexed_filter_is_reported(db, add_opd):
+    add_opd("OPD1")
+    with db.lease(dictionary=True) as cursor:
+        scans = db._full_scans(cursor, "SELECT * FROM OPD_Patients o WHERE o.email = %s", ("x",))
+    assert [table for table, _plan in scans] == ["OPD_Patients"]
+
+
+@pytest.mark.parametrize("patient_type", ["All", "OPD"])
+def test_phone_suffix_search_uses_the_reversed_index(db, add_opd, patient_type):
+    add_opd("OPD1")
+    branches, _error = db._search_branches(phone="43210", phone_match="suffix", patient_type=patient_type)
+    (select, _date_col, where, args), = branches
+    with db.lease() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + select + " WHERE " + " AND ".join(where), args)
+        plan = " | ".join(str(row[-1]) for row in cursor.fetchall())
+    assert "idx_directory_mobile_rev" in plan
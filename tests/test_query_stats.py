@@ -0,0 +1,58 @@
+import sqlite3
+import time
+
+from query_stats import InstrumentedCursor, QueryStats, redact
+
+
+def test_time_between_fetches_is_not_counted():
+    stats = QueryStats(slow_ms=1e9)
+    cursor = InstrumentedCursor(sqlite3.connect(":memory:").cursor(), stats, "tag")
+    cursor.execute("SELECT 1 UNION ALL SELECT 2")
+    cursor.fetchone()
+    time.sleep(0.2)  # caller work between fetches
+    cursor.fetchall()
+    cursor.close()
+
+    snapshot = stats.snapshot()["tag"]
+    assert snapshot["count"] == 1 and snapshot["rows"] == 2
+    assert snapshot["max_ms"] < 100
+
+
+def test_writes_and_errors_are_recorded():
+    stats = QueryStats(slow_ms=1e9)
+    cursor = InstrumentedCursor(sqlite3.connect(":memory:").cursor(), stats, "tag")
+    cursor.execute("CREATE TABLE t (v)")
+    assert cursor.wrote
+    try:
+        cursor.execute("SELECT * FROM missing")
+    except sqlite3.OperationalError:
+        pass
+    assert stats.snapshot()["tag"]["errors"] == 1
+
+
+def test_redact_hides_values():
+    assert redact(["Ram", 42, None]) == ["<str:3>", "<int>", "NULL"]
+
+
+def test_slow_statements_are_logged_redacted(monkeypatch):
+    import types
+    import query_stats
+
+    lines = []
+    monkeypatch.setattr(query_stats, "_slow_log", lambda: types.SimpleNamespace(info=lines.append))
+    stats = QueryStats(slow_ms=0)
+    stats.record("ReportingFrame._query_report", "SELECT * FROM users\n  WHERE username = %s", ("ram",), 3.0, 1)
+
+    assert lines == [
+        "3.0 ms rows=1 tag=ReportingFrame._query_report sql=SELECT * FROM users WHERE username = %s params=['<str:3>']"
+    ]
+    assert stats.snapshot()["ReportingFrame._query_report"]["histogram"]["<=5ms"] == 1
+
+
+def test_statements_are_tagged_by_the_calling_feature(db, add_opd):
+    def lookup_for_reception():
+        return db.get_patient("opd", "OPD1")
+
+    add_opd("OPD1")
+    lookup_for_reception()
+    assert "test_statements_are_tagged_by_the_calling_feature.<locals>.lookup_for_reception" in db.query_stats()
@@ -0,0 +1,47 @@
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def replica(db, monkeypatch):
+    """
+    The database module with its own file doubling as the read replica.
+    """
+    assert db.create_tables()
+    monkeypatch.setattr(db, "SQLITE_READ_PATH", db.SQLITE_PATH)
+    monkeypatch.setattr(db, "READ_REPLICA_ENABLED", True)
+    monkeypatch.setattr(db, "_primary_reads_until", 0.0)
+    monkeypatch.setattr(db, "_replica_down_until", 0.0)
+    return db
+
+
+def _replica_checkouts(db):
+    return db.pool_stats(read=True).get("checkouts", 0)
+
+
+def test_readonly_leases_use_the_replica(replica):
+    with replica.lease(readonly=True) as cursor:
+        cursor.execute("SELECT COUNT(*) FROM users")
+        with pytest.raises(sqlite3.OperationalError):
+            cursor.execute("DELETE FROM users")
+    assert _replica_checkouts(replica) == 1
+
+
+def test_reads_stay_on_the_primary_after_a_write(replica, add_opd):
+    add_opd("OPD1")
+    assert replica.get_all_patients(page_size=10)[0]["registration_number"] == "OPD1"
+    assert _replica_checkouts(replica) == 0
+
+    replica._primary_reads_until = 0.0
+    replica.get_all_patients(page_size=10)
+    assert _replica_checkouts(replica) == 1
+
+
+def test_unreachable_replica_falls_back_to_the_primary(replica, monkeypatch, tmp_path):
+    monkeypatch.setattr(replica, "SQLITE_READ_PATH", str(tmp_path / "missing" / "replica.sqlite3"))
+    with replica.lease(readonly=True) as cursor:
+        cursor.execute("SELECT COUNT(*) FROM users")
+        assert cursor.fetchone() == (1,)  # admin
+    assert replica._replica_down_until > 0
+    assert replica._pool_for(True) is replica.get_pool()
@@ -0,0 +1,41 @@
+from record_cache import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expires_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("record_cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(4, ttl=10)
+    cache.put("a", 1)
+    now[0] += 11
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_load_racing_an_invalidation_is_not_stored():
+    cache = LRUCache(4)
+
+    def load():
+        cache.invalidate("a")  # a write lands while the row is being read
+        return "stale"
+
+    assert cache.get_or_load("a", load) == "stale"
+    assert cache.get("a") is None
+    assert cache.get_or_load("a", lambda: "fresh") == "fresh"
+    assert cache.get("a") == "fresh"
+
+
+def test_missing_rows_are_not_cached():
+    cache = LRUCache(4)
+    assert cache.get_or_load("a", lambda: None) is None
+    assert cache.get_or_load("a", lambda: "added") == "added"
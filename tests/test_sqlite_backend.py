@@ -0,0 +1,42 @@
+import datetime
+
+import sqlite_backend
+
+
+def test_translate_sql_rewrites_placeholders():
+    sql = "SELECT * FROM users WHERE username = %s AND role IN (%s, %s)"
+    assert sqlite_backend.translate_sql(sql) == "SELECT * FROM users WHERE username = ? AND role IN (?, ?)"
+
+
+def _table(tmp_path):
+    conn = sqlite_backend.connect(str(tmp_path / "backend.sqlite3"))
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE visits (id INTEGER PRIMARY KEY, name TEXT, visit_date DATE)")
+    cursor.executemany(
+        "INSERT INTO visits (name, visit_date) VALUES (%s, %s)",
+        [("Ram", datetime.date(2025, 1, 2)), ("Sita", "2025-03-04")],
+    )
+    conn.commit()
+    return conn
+
+
+def test_tuple_cursor_reads_dates(tmp_path):
+    cursor = _table(tmp_path).cursor()
+    cursor.execute("SELECT name, visit_date FROM visits WHERE name = %s", ("Ram",))
+    assert cursor.fetchall() == [("Ram", datetime.date(2025, 1, 2))]
+    assert cursor.column_names == ("name", "visit_date")
+
+
+def test_dictionary_cursor(tmp_path):
+    cursor = _table(tmp_path).cursor(dictionary=True)
+    cursor.execute("SELECT id, name, visit_date FROM visits ORDER BY id")
+    assert cursor.fetchone() == {"id": 1, "name": "Ram", "visit_date": datetime.date(2025, 1, 2)}
+    assert [row["name"] for row in cursor] == ["Sita"]
+
+
+def test_rowcount_and_lastrowid(tmp_path):
+    cursor = _table(tmp_path).cursor()
+    cursor.execute("INSERT INTO visits (name) VALUES (%s)", ("Gita",))
+    assert cursor.lastrowid == 3
+    cursor.execute("UPDATE visits SET name = %s WHERE id > %s", ("X", 1))
+    assert cursor.rowcount == 2
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from task_runner import TaskRunner, current_task
+
+
+class _Root:
+    # Stands in for the Tk root: runs the dispatch pump on demand.
+    def __init__(self):
+        self.pending = []
+
+    def after(self, _ms, fn):
+        self.pending.append(fn)
+
+
+@pytest.fixture
+def runner():
+    runner = TaskRunner(max_workers=2)
+    runner.attach(_Root())
+    yield runner
+    runner.shutdown()
+
+
+def _pump_until(runner, condition, timeout=2):
+    # Done callbacks are queued from the worker just after the future
+    # completes, so keep pumping until the expected delivery shows up.
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+        runner._pump()
+
+
+def test_newer_task_under_the_same_key_wins(runner):
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def slow():
+        started.set()
+        release.wait(2)
+        return "old"
+
+    first = runner.submit(slow, key="tree", on_done=results.append)
+    started.wait(2)
+    second = runner.submit(lambda: "new", key="tree", on_done=results.append)
+    release.set()
+    _pump_until(runner, lambda: results)
+    first.future.result(timeout=2)
+    runner._pump()
+
+    assert first.cancelled and not second.cancelled
+    assert results == ["new"]
+
+
+def test_running_job_sees_its_cancellation(runner):
+    started = threading.Event()
+    seen = []
+
+    def job():
+        started.set()
+        task = current_task()
+        while not task.cancelled:
+            task._cancelled.wait(0.01)
+        seen.append("stopped")
+
+    task = runner.submit(job, key="search", on_done=seen.append)
+    started.wait(2)
+    runner.cancel("search")
+    task.future.result(timeout=2)
+    _pump_until(runner, lambda: len(seen) > 1, timeout=0.1)
+    assert seen == ["stopped"]
+    assert current_task() is None
+
+
+def test_errors_reach_on_error_on_the_mainloop(runner):
+    errors, done = [], []
+
+    def fail():
+        raise ValueError("bad date")
+
+    runner.submit(fail, on_done=done.append, on_error=errors.append)
+    _pump_until(runner, lambda: errors)
+    assert done == [] and [str(e) for e in errors] == ["bad date"]
+
+
+def test_callbacks_wait_for_the_pump(runner):
+    calls = []
+    runner.call_soon(calls.append, 1)
+    assert calls == []
+    runner._pump()
+    assert calls == [1]
@@ -0,0 +1,312 @@
+import types
+
+import pytest
+
+try:
+    import ui
+except Exception as e:  # needs Tk, tkcalendar and the printer modules
+    pytest.skip(f"ui.py cannot be imported: {e}", allow_module_level=True)
+
+App = ui.PatientRegistrationApp
+
+
+class FakeTable:
+    """
+    Flat Treeview stand-in; after_idle callbacks wait until run_idle().
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.idle = {}
+        self.exists = True
+        self._next = 0
+
+    def nametowidget(self, name):
+        return self
+
+    def winfo_exists(self):
+        return self.exists
+
+    def after_idle(self, fn, *args):
+        self._next += 1
+        self.idle[self._next] = (fn, args)
+        return self._next
+
+    def after_cancel(self, ident):
+        self.idle.pop(ident, None)
+
+    def run_idle(self):
+        while self.idle:
+            fn, args = self.idle.pop(min(self.idle))
+            fn(*args)
+
+    def insert(self, parent, index, values=(), tags=()):
+        self.rows.append(tuple(values))
+
+    def delete(self, *items):
+        self.rows = []
+
+    def get_children(self):
+        return tuple(range(len(self.rows)))
+
+
+class Label:
+    def __init__(self):
+        self.text = None
+
+    def config(self, text=None, **kw):
+        self.text = text
+
+
+def _patient(number):
+    return {"registration_number": number, "first_name": "Ram", "last_name": "", "mobile_number": "98765"}
+
+
+def _view(**attrs):
+    # Just enough of PatientRegistrationApp for its View/Search methods.
+    view = types.SimpleNamespace(
+        patient_tree=FakeTable(), page_label=Label(),
+        last_search={"criteria": {}, "rows": [], "complete": False},
+        _patient_tree_values=lambda p: (p["registration_number"],),
+    )
+    view.__dict__.update(attrs)
+    return view
+
+
+@pytest.fixture(autouse=True)
+def _no_fills_left():
+    yield
+    ui._table_fills.clear()
+
+
+def test_first_streamed_chunk_replaces_the_old_rows():
+    view = _view()
+    view.patient_tree.rows = [("OLD1",), ("OLD2",)]
+    task = types.SimpleNamespace(cancelled=False)
+
+    App._append_search_chunk(view, task, [_patient("OPD3"), _patient("OPD2")], 2)
+    App._append_search_chunk(view, task, [_patient("OPD1")], 3)
+    view.patient_tree.run_idle()
+
+    assert view.patient_tree.rows == [("OPD3",), ("OPD2",), ("OPD1",)]
+    assert view.page_label.text == "3 results so far..."
+    assert len(view.last_search["rows"]) == 3
+
+
+def test_chunks_of_a_cancelled_search_are_dropped():
+    view = _view()
+    App._append_search_chunk(view, types.SimpleNamespace(cancelled=True), [_patient("OPD1")], 1)
+    assert view.patient_tree.rows == [] and view.last_search["rows"] == []
+
+
+def test_large_streamed_results_are_not_kept_for_narrowing(monkeypatch):
+    monkeypatch.setattr(ui, "LIVE_SEARCH_KEEP_ROWS", 2)
+    view = _view()
+    task = types.SimpleNamespace(cancelled=False)
+    App._append_search_chunk(view, task, [_patient(f"OPD{i}") for i in range(3)], 3)
+    assert view.last_search["rows"] is None
+
+
+def _criteria(**values):
+    criteria = dict.fromkeys(ui._FILTER_FIELDS, "")
+    criteria.update(patient_type="All", name_match="contains", phone_match="contains")
+    criteria.update(values)
+    return criteria
+
+
+def _live_view(criteria, last_search):
+    calls = []
+    view = _view(
+        last_search=last_search, live_search_after="after#1",
+        _search_criteria=lambda: criteria,
+        _run_search=lambda c, live=False: calls.append(("search", c)),
+        load_all_patients=lambda page: calls.append(("all", page)),
+        _on_search_done=lambda total, live=False: calls.append(("done", total)),
+        tasks=types.SimpleNamespace(cancel=lambda key: calls.append(("cancel", key))),
+    )
+    view._narrowed_results = types.MethodType(App._narrowed_results, view)
+    return view, calls
+
+
+def test_longer_name_narrows_the_kept_rows():
+    rows = [_patient("OPD1"), dict(_patient("OPD2"), first_name="Ramesh"), dict(_patient("OPD3"), first_name="Sita")]
+    view, calls = _live_view(
+        _criteria(name="rame"), {"criteria": _criteria(name="ra"), "rows": rows, "complete": True},
+    )
+    App._live_search(view)
+    view.patient_tree.run_idle()
+
+    assert view.patient_tree.rows == [("OPD2",)]
+    assert calls == [("cancel", view.patient_tree), ("done", 1)]
+
+
+@pytest.mark.parametrize("last", [
+    {"criteria": _criteria(name="ra"), "rows": [], "complete": False},     # still streaming
+    {"criteria": _criteria(name="ra"), "rows": None, "complete": True},    # too many rows kept
+    {"criteria": _criteria(name="ram", town="Patna"), "rows": [], "complete": True},  # other filter changed
+    {"criteria": _criteria(name="sita"), "rows": [], "complete": True},    # not a narrowing
+])
+def test_searches_that_cannot_narrow_go_to_the_database(last):
+    criteria = _criteria(name="rame")
+    view, calls = _live_view(criteria, last)
+    App._live_search(view)
+    assert calls == [("search", criteria)]
+
+
+def test_fuzzy_search_is_never_narrowed_locally():
+    last = {"criteria": _criteria(name="ra", name_match="fuzzy"), "rows": [_patient("OPD1")], "complete": True}
+    view, _calls = _live_view(None, last)
+    assert App._narrowed_results(view, _criteria(name="ram", name_match="fuzzy")) is None
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("ra", []),           # same search as last time
+    ("r", []),            # too short to search, still a filter
+    ("", [("all", 1)]),   # box cleared: back to the full list
+])
+def test_short_or_unchanged_terms_do_not_search(name, expected):
+    view, calls = _live_view(_criteria(name=name), {"criteria": _criteria(name="ra"), "rows": [], "complete": True})
+    App._live_search(view)
+    assert calls == expected
+
+
+def _rows(*names):
+    return [((name,), None) for name in names]
+
+
+def test_fill_inserts_in_slices_and_finishes_once(monkeypatch):
+    monkeypatch.setattr(ui, "TABLE_FILL_SLICE_MS", 0)
+    table, done = FakeTable(), []
+    table.rows = [("OLD",)]
+
+    ui._fill_table(table, _rows("A", "B", "C"), on_done=lambda: done.append(True))
+    assert table.rows == [("A",)] and len(table.idle) == 1
+
+    table.run_idle()
+    assert table.rows == [("A",), ("B",), ("C",)]
+    assert done == [True] and table not in ui._table_fills
+
+
+def test_newer_fill_replaces_an_unfinished_one(monkeypatch):
+    monkeypatch.setattr(ui, "TABLE_FILL_SLICE_MS", 0)
+    table, done = FakeTable(), []
+    ui._fill_table(table, _rows("A", "B", "C"), on_done=lambda: done.append("old"))
+    ui._fill_table(table, _rows("X", "Y"), on_done=lambda: done.append("new"))
+    table.run_idle()
+    assert table.rows == [("X",), ("Y",)] and done == ["new"]
+
+
+def test_appended_rows_wait_for_the_unfinished_fill(monkeypatch):
+    monkeypatch.setattr(ui, "TABLE_FILL_SLICE_MS", 0)
+    table, done = FakeTable(), []
+    ui._fill_table(table, _rows("A", "B"), on_done=lambda: done.append(1))
+    ui._fill_table(table, _rows("C"), append=True, on_done=lambda: done.append(2))
+    table.run_idle()
+    assert table.rows == [("A",), ("B",), ("C",)] and done == [1, 2]
+
+
+def test_fill_stops_when_the_table_is_destroyed(monkeypatch):
+    monkeypatch.setattr(ui, "TABLE_FILL_SLICE_MS", 0)
+    table, done = FakeTable(), []
+    ui._fill_table(table, _rows("A", "B", "C"), on_done=lambda: done.append(True))
+    table.exists = False
+    table.run_idle()
+    assert table.rows == [("A",)] and done == [] and table not in ui._table_fills
+
+
+class FakeNotebook:
+    def __init__(self):
+        self.texts = {}
+
+    def add(self, frame, text):
+        self.texts[str(frame)] = text
+
+    def tab(self, frame, option):
+        return self.texts[str(frame)]
+
+    def winfo_exists(self):
+        return True
+
+
+class FakeMaster:
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, fn, *args):
+        self.scheduled.append((fn, args))
+
+
+def _tabbed_app(*names):
+    built = []
+    app = types.SimpleNamespace(notebook=FakeNotebook(), master=FakeMaster(), tab_factories={})
+    for method in ("_add_lazy_tab", "_ensure_tab", "_prewarm_next_tab"):
+        setattr(app, method, types.MethodType(getattr(App, method), app))
+    for name in names:
+        app._add_lazy_tab(name, f" {name} ", lambda name=name: built.append(name))
+    return app, built
+
+
+def test_tab_is_built_on_first_selection_only():
+    app, built = _tabbed_app("register", "search")
+    app._ensure_tab("search")
+    app._ensure_tab("search")
+    assert built == ["search"] and list(app.tab_factories) == ["register"]
+
+
+def test_prewarm_builds_one_tab_per_step():
+    app, built = _tabbed_app("register", "search", "reports")
+    app._ensure_tab("search")
+
+    app._prewarm_next_tab(app.notebook)
+    assert built == ["search", "register"] and len(app.master.scheduled) == 1
+    while app.master.scheduled:
+        fn, args = app.master.scheduled.pop(0)
+        fn(*args)
+    assert built == ["search", "register", "reports"] and app.tab_factories == {}
+
+
+def test_prewarm_stops_for_a_replaced_notebook():
+    app, built = _tabbed_app("register")
+    app._prewarm_next_tab(FakeNotebook())  # the window was rebuilt after a logout
+    assert built == [] and app.master.scheduled == []
+
+
+def _search_tab(state, loading=False):
+    calls = []
+    view = types.SimpleNamespace(
+        view_state=state, is_loading=loading,
+        load_all_patients=lambda page: calls.append(("load", page)),
+        _revalidate_view=lambda search: calls.append(("revalidate", search)),
+    )
+    return view, calls
+
+
+@pytest.mark.parametrize("age, changes, expected", [
+    (0, 7, []),                                        # fresh and nothing saved since
+    (0, 8, [("revalidate", {"name": "ram"})]),         # a patient was saved here
+    (ui.VIEW_STALE_AFTER + 1, 7, [("revalidate", {"name": "ram"})]),  # saves made elsewhere
+])
+def test_search_tab_requeries_only_stale_results(monkeypatch, age, changes, expected):
+    monkeypatch.setattr(ui, "patient_change_count", lambda: changes)
+    state = {"search": {"name": "ram"}, "loaded_at": ui.time.monotonic() - age, "changes": 7}
+    view, calls = _search_tab(state)
+    App._show_view_search(view)
+    assert calls == expected
+
+
+def test_search_tab_loads_once_and_waits_for_a_running_query():
+    view, calls = _search_tab(None)
+    App._show_view_search(view)
+    view.is_loading = True
+    App._show_view_search(view)
+    assert calls == [("load", 1)]
+
+
+def test_revalidated_search_keeps_the_rows_until_results_stream_in():
+    calls = []
+    view = _view(
+        _view_position=lambda: "restore",
+        _run_search=lambda criteria, live=False, restore=None: calls.append((criteria, live, restore)),
+    )
+    App._revalidate_view(view, {"name": "ram"})
+    assert calls == [({"name": "ram"}, True, "restore")]
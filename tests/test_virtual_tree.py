@@ -0,0 +1,68 @@
+import tkinter as tk
+from decimal import Decimal
+from tkinter import ttk
+
+import pytest
+
+from virtual_tree import VirtualTreeview, date_key, number_key
+
+
+class HeadlessTree(VirtualTreeview):
+    """
+    The virtual rows of a VirtualTreeview without a Tk widget; nothing is drawn.
+    """
+
+    columns = ("reg", "date", "age")
+
+    def __getitem__(self, option):
+        return self.columns
+
+    def _install_bindings(self):
+        pass
+
+    def _schedule(self):
+        pass
+
+    def _render(self):
+        pass
+
+
+@pytest.fixture
+def tree(monkeypatch):
+    monkeypatch.setattr(ttk.Treeview, "__init__", lambda self, master=None, **kw: None)
+    tree = HeadlessTree(sort_keys={"date": date_key})
+    for values in (("OPD2", "02/01/2025", "9"), ("OPD1", "31/12/2024", "10"), ("OPD3", "", "Unknown")):
+        tree.insert("", "end", iid=values[0], values=values)
+    return tree
+
+
+def test_date_key_orders_ddmmyyyy_by_date():
+    dates = ["02/01/2025", "31/12/2024", "", "15/06/2024", "2024-07-01"]
+    assert sorted(dates, key=date_key) == ["15/06/2024", "2024-07-01", "31/12/2024", "02/01/2025", ""]
+
+
+def test_number_key_orders_numbers_by_value():
+    values = ["10", 9, "", Decimal("250.50"), "1,200", "Unknown"]
+    assert sorted(values, key=number_key) == [9, "10", Decimal("250.50"), "1,200", "", "Unknown"]
+
+
+def test_rows_behave_like_treeview_items(tree):
+    assert tree.get_children() == ("OPD2", "OPD1", "OPD3")
+    assert tree.item("OPD1", "values") == ("OPD1", "31/12/2024", 10)
+    with pytest.raises(tk.TclError):
+        tree.insert("", "end", iid="OPD1", values=())
+
+    tree.insert("", 0, iid="OPD0", values=("OPD0",))
+    tree.delete("OPD2")
+    assert tree.get_children() == ("OPD0", "OPD1", "OPD3") and tree.index("OPD3") == 2
+    tree.delete(*tree.get_children())
+    assert tree.get_children() == () and not tree.exists("OPD1")
+
+
+def test_heading_sort_uses_column_keys_and_toggles(tree):
+    tree.sort_by("date")
+    assert tree.get_children() == ("OPD1", "OPD2", "OPD3")
+    tree.sort_by("date")
+    assert tree.get_children() == ("OPD3", "OPD2", "OPD1")
+    tree.sort_by("age")
+    assert tree.get_children() == ("OPD2", "OPD1", "OPD3")
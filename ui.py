@@ -1,12 +1,12 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog
-from PIL import Image, ImageTk
 from tkcalendar import DateEntry
-import threading
 import datetime
 import re
 import csv
 import logging
+import os
+import time
 from printer_manager import list_printers, save_printer_choice, load_printer_choice
 
 # Import utility functions
@@ -20,45 +20,117 @@ from database import (
     create_tables, get_next_registration_number,
     add_opd_patient, add_epd_patient, add_ipd_patient,
     update_patient, update_epd_patient, update_ipd_patient,
-    get_all_patients, search_patients,
-    get_patient_by_reg_number,
+    get_all_patients_page, iter_search_patients, get_transfer_candidates, record_ipd_transfer,
+    get_patient_by_reg_number, get_patient, invalidate_patient, index_patient, patient_change_count,
     add_medicine, add_medicine_purchase, add_medicine_supply,
     get_current_stock, get_batchwise_stock,
-    get_db_connection, update_user_sections, get_user_by_username
+    update_user_sections, get_user_by_username,
+    lease, close_pool, ConnectionUnavailableError
 )
 
 from printer_manager import save_printer_choice, load_printer_choice
 from printer_selector import PrinterSelector
+from task_runner import get_runner, current_task
+from virtual_tree import VirtualTreeview, date_key, number_key
+import card_layout
+import image_assets
 from tkinter import messagebox
 
-def get_cash_in_hand(username, date=None):
-    import datetime
-    if username == "admin":
-        return None
-    if not date or (isinstance(date, str) and not date.strip()):
-        date = datetime.date.today().strftime("%Y-%m-%d")
-    elif isinstance(date, datetime.date):
-        date = date.strftime("%Y-%m-%d")
-    
-    conn = get_db_connection()
-    if not conn:
-        return None
-    cursor = conn.cursor()
-    try:
-        cursor.execute(
-            "SELECT cash_in_hand FROM user_cash_log WHERE username = %s AND date = %s",
-            (username, date)
-        )
-        row = cursor.fetchone()
-      
-        return row[0] if row else None
-    finally:
-        cursor.close()
-        conn.close()
-
-        
 logger = logging.getLogger(__name__)
 
+# Search-as-you-type on the View/Search registration number, name and phone
+# boxes: wait this long after the last keystroke, need this many characters,
+# and keep up to this many results in memory to narrow without a query.
+LIVE_SEARCH_FIELDS = ("registration_number", "name", "phone")
+# Search criteria that narrow the list (the rest pick how to match).
+_FILTER_FIELDS = (
+    "registration_number", "name", "father_name", "phone", "department", "town", "state",
+    "gender", "age", "from_date", "to_date",
+)
+LIVE_SEARCH_DELAY_MS = 300
+LIVE_SEARCH_MIN_CHARS = 2
+LIVE_SEARCH_KEEP_ROWS = 5000
+
+# Tables fill in slices of about this many milliseconds, yielding to Tk
+# between slices so the window keeps repainting while a large table loads.
+TABLE_FILL_SLICE_MS = 15
+
+_table_fills = {}  # table -> state of its running fill, see _fill_table()
+
+# Main window tabs are built when first selected. With TAB_PREWARM=1 the
+# rest are built one at a time once the window has painted, TAB_PREWARM_MS
+# apart, so the first visit to a tab is instant without slowing login.
+TAB_PREWARM = os.getenv("TAB_PREWARM", "1") == "1"
+TAB_PREWARM_MS = int(os.getenv("TAB_PREWARM_MS", "300"))
+
+# The View/Search tab keeps its results between visits and re-runs its query
+# in the background only after a patient is saved on this workstation or
+# after this many seconds (saves made elsewhere).
+VIEW_STALE_AFTER = float(os.getenv("VIEW_STALE_AFTER", "120"))
+
+
+def _cancel_table_fill(table):
+    """
+    Stops a fill still inserting rows into `table`.
+    """
+    fill = _table_fills.pop(table, None)
+    if fill is not None and fill["after"] is not None:
+        table.nametowidget(".").after_cancel(fill["after"])
+
+
+def _fill_table(table, rows, name="table", started=None, on_done=None, append=False):
+    """
+    Replaces the rows of a Treeview with (values, tag) pairs loaded in the
+    background, inserting them in time-sliced after_idle chunks. A newer fill
+    of the same table cancels this one. With append=True the rows go after
+    the existing ones, and after any an unfinished fill still has to insert,
+    instead. Logs the time to the first and last row, counted from `started`
+    (a time.perf_counter() value) when given, and calls on_done() after the
+    last row.
+    """
+    fill = _table_fills.get(table)
+    if append and fill is not None:
+        fill["rows"].append(iter(rows))
+        if on_done:
+            fill["on_done"].append(on_done)
+        return
+    if not append:
+        _cancel_table_fill(table)
+        table.delete(*table.get_children())
+    root = table.nametowidget(".")
+    started = started or time.perf_counter()
+    fill = _table_fills[table] = {
+        "after": None, "rows": [iter(rows)], "on_done": [on_done] if on_done else [], "count": 0, "first": None,
+    }
+
+    def fill_slice():
+        fill["after"] = None
+        if _table_fills.get(table) is not fill:
+            return
+        if not table.winfo_exists():
+            del _table_fills[table]
+            return
+        deadline = time.perf_counter() + TABLE_FILL_SLICE_MS / 1000
+        while fill["rows"]:
+            for values, tag in fill["rows"][0]:
+                table.insert("", "end", values=values, tags=(tag,) if tag else ())
+                fill["count"] += 1
+                if fill["first"] is None:
+                    fill["first"] = time.perf_counter() - started
+                if time.perf_counter() >= deadline:
+                    fill["after"] = root.after_idle(fill_slice)
+                    return
+            fill["rows"].pop(0)
+        del _table_fills[table]
+        first = fill["first"] or 0.0
+        (logger.debug if append else logger.info)(
+            f"Loaded {fill['count']} rows into {name}: first row after {first * 1000:.0f} ms, "
+            f"all rows after {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        for callback in fill["on_done"]:
+            callback()
+
+    fill_slice()
 
 
 class PatientRegistrationApp:
@@ -67,13 +139,26 @@ class PatientRegistrationApp:
         self.current_reg_number = None
         self.current_page = 1
         self.page_size = 100
+        self.page_tokens = [None]  # keyset token that starts each visited page
+        self.next_page_token = None
+        self.total_estimate = None  # approximate patient count, for "Page 3 of ~120"
+        self.live_search_after = None  # pending debounced search-as-you-type
+        self.last_search = None  # {"criteria", "rows", "complete"} of the latest search
+        self.view_state = None  # {"search", "loaded_at", "changes"} of the rows shown in View/Search
+        self.view_query_changes = 0  # patient_change_count() when the running query started
         self.is_loading = False
+        self.tree_query_started = None
         self.current_role = None
         self.current_username = None
         self.cash_in_hand = 0.0
         self.date_entries = []
         self.style = ttk.Style()
         self.last_saved_ipd_registration_number = None
+        self.ipd_transfer_source = None
+        self.tab_factories = {}
+        self.login_started = None
+        self.tasks = get_runner()
+        self.tasks.attach(master)
         self.style.theme_use('clam')
         self.style.configure('TFrame', background='#e0f2f7')
         self.style.configure('TLabel', background='#e0f2f7', font=('Inter', 10))
@@ -112,17 +197,9 @@ class PatientRegistrationApp:
         btn_frame = ttk.Frame(self.role_frame, style='TFrame')
         btn_frame.pack(pady=3)
 
-        # Try loading icons
-        try:
-            admin_img = Image.open("admin_icon.png").resize((44, 44))
-            admin_icon = ImageTk.PhotoImage(admin_img)
-        except Exception:
-            admin_icon = None
-        try:
-            user_img = Image.open("user_icon.png").resize((44, 44))
-            user_icon = ImageTk.PhotoImage(user_img)
-        except Exception:
-            user_icon = None
+        # Icons are decoded and scaled once per run (None if missing)
+        admin_icon = image_assets.icon("admin_icon.png", (44, 44))
+        user_icon = image_assets.icon("user_icon.png", (44, 44))
 
         def select_admin():
             self.current_role = 'admin'
@@ -188,10 +265,7 @@ class PatientRegistrationApp:
       self.master.resizable(False, False)
 
       # --- Top-left Back Button with Icon (place on self.master, not container) ---
-      try:
-        self._back_icon = ImageTk.PhotoImage(Image.open("back_icon.png").resize((28, 28)))
-      except Exception:
-        self._back_icon = None
+      self._back_icon = image_assets.icon("back_icon.png", (28, 28))
 
       def go_back():
         self.login_frame.destroy()
@@ -215,15 +289,8 @@ class PatientRegistrationApp:
       container.pack(expand=True, fill='both')
 
       # --- Load relevant logo ---
-      logo_icon = None
-      try:
-        if self.current_role == "admin":
-            logo_img = Image.open("admin_icon.png").resize((84, 84))
-        else:
-            logo_img = Image.open("user_icon.png").resize((84, 84))
-        logo_icon = ImageTk.PhotoImage(logo_img)
-      except Exception:
-        logo_icon = None
+      logo_file = "admin_icon.png" if self.current_role == "admin" else "user_icon.png"
+      logo_icon = image_assets.icon(logo_file, (84, 84))
 
       # Logo (centered)
       if logo_icon:
@@ -301,14 +368,9 @@ class PatientRegistrationApp:
          if self.current_role == "user":
             from database import save_cash_in_hand
             save_cash_in_hand(username, self.cash_in_hand)
-         conn = get_db_connection()
-         if conn:
-            cur = conn.cursor(dictionary=True)
-            cur.execute("SELECT role FROM users WHERE username=%s", (username,))
-            user = cur.fetchone()
-            actual_role = user.get('role', 'user') if user else 'user'
-            cur.close()
-            conn.close()
+         user = get_user_by_username(username)
+         if user:
+            actual_role = user.get('role', 'user')
             if actual_role != self.current_role:
                 messagebox.showerror("Login Error", f"User '{username}' does not have {self.current_role} privileges.")
                 return
@@ -320,6 +382,7 @@ class PatientRegistrationApp:
             self.back_btn.destroy()
             self.back_btn = None
 
+         self.login_started = time.perf_counter()
          self.launch_main_ui()
        else:
          messagebox.showerror("Login Error", "Invalid username or password.")
@@ -360,6 +423,7 @@ class PatientRegistrationApp:
 
       self.notebook = ttk.Notebook(self.master)
       self.notebook.pack(expand=True, fill='both', padx=10, pady=10)
+      self.tab_factories = {}  # tab frame name -> builder, until first selected
 
 
       
@@ -398,57 +462,87 @@ class PatientRegistrationApp:
       ttk.Label(self.account_tab, text=f"Logged in as: {self.current_username}", font=('Arial', 12)).pack(pady=(0,10))
       ttk.Button(self.account_tab, text="Logout", command=self.logout).pack(pady=16)
 
-      # -- REGULAR TABS (Add ONLY if allowed) --
+      # -- REGULAR TABS (Add ONLY if allowed); their widgets are built on first selection --
       if 'OPD' in allowed_sections:
         self.registration_frame = ttk.Frame(self.notebook, style='TFrame', padding="20")
-        self.notebook.add(self.registration_frame, text='  OPD Patient Registration  ')
         self.registration_frame.columnconfigure(1, weight=1)
-        self.create_registration_widgets()
+        self._add_lazy_tab(self.registration_frame, '  OPD Patient Registration  ', self.create_registration_widgets)
       if 'View/Search' in allowed_sections or 'OPD' in allowed_sections or 'IPD' in allowed_sections or 'EPD' in allowed_sections:
         self.view_search_frame = ttk.Frame(self.notebook, style='TFrame', padding="20")
-        self.notebook.add(self.view_search_frame, text='  View/Search Patients  ')
-        self.create_view_search_widgets()
+        self._add_lazy_tab(self.view_search_frame, '  View/Search Patients  ', self.create_view_search_widgets)
       if 'Reception' in allowed_sections:
         self.reception_frame = ttk.Frame(self.notebook, style='TFrame', padding="20")
-        self.notebook.add(self.reception_frame, text='  Reception ')
-        self.create_reception_widgets()
+        self._add_lazy_tab(self.reception_frame, '  Reception ', self.create_reception_widgets)
       if 'IPD' in allowed_sections:
         self.ipd_frame = ttk.Frame(self.notebook, style='TFrame', padding="20")
-        self.notebook.add(self.ipd_frame, text='  IPD Management ')
-        self.create_ipd_widgets()
+        self._add_lazy_tab(self.ipd_frame, '  IPD Management ', self.create_ipd_widgets)
       if 'Medicine' in allowed_sections:
         self.medicine_tab = ttk.Frame(self.notebook, style='TFrame', padding="20")
-        self.notebook.add(self.medicine_tab, text='  Medicine  ')
-        self.add_medicine_options(self.medicine_tab)
+        self._add_lazy_tab(self.medicine_tab, '  Medicine  ', lambda: self.add_medicine_options(self.medicine_tab))
       if 'Reporting' in allowed_sections:
         self.reporting_tab = ttk.Frame(self.notebook, style='TFrame', padding="20")
-        self.notebook.add(self.reporting_tab, text='  Reporting  ')
-        self.reporting_frame = ReportingFrame(self.reporting_tab, self.current_username, self.current_role)
-        self.reporting_frame.pack(fill="both", expand=True)
+        self._add_lazy_tab(self.reporting_tab, '  Reporting  ', self.create_reporting_widgets)
 
       self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_change)
       self.master.bind("<Configure>", lambda event: self.on_resize(event))
+      # Runs once the window has been drawn with the first tab.
+      self.master.after_idle(self._on_main_ui_painted, self.notebook)
+
+    def create_reporting_widgets(self):
+      self.reporting_frame = ReportingFrame(self.reporting_tab, self.current_username, self.current_role)
+      self.reporting_frame.pack(fill="both", expand=True)
+
+    def _add_lazy_tab(self, frame, text, build):
+      self.notebook.add(frame, text=text)
+      self.tab_factories[str(frame)] = build
+
+    def _ensure_tab(self, frame):
+      """
+      Builds a tab's widgets if it has not been selected (or pre-warmed) yet.
+      """
+      build = self.tab_factories.pop(str(frame), None)
+      if build is None:
+        return
+      started = time.perf_counter()
+      build()
+      text = self.notebook.tab(frame, "text").strip()
+      logger.info(f"Built tab {text} in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def _select_tab(self, frame):
+      self._ensure_tab(frame)
+      self.notebook.select(frame)
+
+    def _on_main_ui_painted(self, notebook):
+      if notebook is not self.notebook or not notebook.winfo_exists():
+        return
+      if self.login_started is not None:
+        logger.info(f"Login to interactive: {(time.perf_counter() - self.login_started) * 1000:.0f} ms")
+        self.login_started = None
+      if TAB_PREWARM:
+        self.master.after(TAB_PREWARM_MS, self._prewarm_next_tab, notebook)
+
+    def _prewarm_next_tab(self, notebook):
+      # One tab per step, so clicks and typing are handled in between.
+      if notebook is not self.notebook or not notebook.winfo_exists() or not self.tab_factories:
+        return
+      self._ensure_tab(next(iter(self.tab_factories)))
+      self.master.after(TAB_PREWARM_MS, self._prewarm_next_tab, notebook)
 
     def open_user_management(self):
       UserManagementWindow(self.master)
 
     def close_app(self):
       try:
-        pool = getattr(self, "connection_pool", None)
-        if pool and hasattr(pool, "_cnx_queue"):
-            for conn in list(pool._cnx_queue.queue):
-                try:
-                    conn.close()
-                except Exception:
-                    pass
-            logger.info("Database pool connections closed.")
-      except Exception as e:
-        logger.error(f"Error cleaning up pool: {e}")
-      finally:
         # LOGOUT current user before application closes
         if self.current_username:
             from database import logout_user
             logout_user(self.current_username)
+        self.tasks.shutdown()
+        close_pool()
+        logger.info("Database pool connections closed.")
+      except Exception as e:
+        logger.error(f"Error cleaning up pool: {e}")
+      finally:
         self.master.destroy()
 
     def logout(self):
@@ -466,10 +560,81 @@ class PatientRegistrationApp:
             entry.hide_calendar()  # This safely hides the popup without breaking future interactions.
         except Exception:
             pass
+      self._ensure_tab(self.notebook.select())
       selected_tab = self.notebook.tab(self.notebook.select(), "text")
       if "View/Search Patients" in selected_tab:
-        self.current_page = 1
-        self.load_all_patients()
+        self._show_view_search()
+
+    def _show_view_search(self):
+      # Stale-while-revalidate: the tab keeps its rows and scroll position, and
+      # re-runs its query in the background only when they may be out of date.
+      state = self.view_state
+      if self.is_loading:
+        return
+      if state is None:
+        self.load_all_patients(page=1)
+        return
+      fresh = time.monotonic() - state["loaded_at"] < VIEW_STALE_AFTER
+      if fresh and state["changes"] == patient_change_count():
+        return
+      self._revalidate_view(state["search"])
+
+    def _revalidate_view(self, search):
+      restore = self._view_position()
+      if search is not None:
+        # Streams like a new search; the first chunk replaces the stale rows.
+        self._run_search(search, live=True, restore=restore)
+        return
+      changes = patient_change_count()
+      self.tasks.submit(
+          get_all_patients_page, self.page_tokens[self.current_page - 1], self.page_size,
+          key=self.patient_tree, on_error=self._on_revalidate_error,
+          on_done=lambda result: self._on_view_revalidated(result[0], result[1], changes, restore),
+      )
+
+    def _on_revalidate_error(self, error):
+      logger.error(f"Could not refresh the patient list: {error}")
+
+    def _view_position(self):
+      """
+      Returns a function that scrolls the patient list back to where it is
+      now and refocuses the focused patient, for after re-queried rows have
+      replaced the current ones.
+      """
+      tree = self.patient_tree
+      top = tree.yview()[0]
+      focused = tree.focus()
+      focused_key = None
+      if focused:
+        values = tree.item(focused, "values")
+        focused_key = (values[0], values[6])
+
+      def restore():
+        if not tree.winfo_exists():
+          return
+        tree.yview_moveto(top)
+        if focused_key is None:
+          return
+        for iid in tree.get_children():
+          values = tree.item(iid, "values")
+          if (values[0], values[6]) == focused_key:
+            tree.see(iid)
+            tree.focus(iid)
+            tree.selection_set(iid)
+            break
+
+      return restore
+
+    def _on_view_revalidated(self, patients, next_token, changes, restore):
+      if not self.patient_tree.winfo_exists():
+        return
+      self.next_page_token = next_token
+      self.next_button.config(state='normal' if next_token else 'disabled')
+      self.view_state = {"search": None, "loaded_at": time.monotonic(), "changes": changes}
+      _fill_table(
+          self.patient_tree, ((self._patient_tree_values(p), None) for p in patients), "patient list (refresh)",
+          on_done=restore,
+      )
     
     def on_resize(self, event):
       # Only adjust layout if these frames exist
@@ -638,6 +803,7 @@ class PatientRegistrationApp:
 
     def create_view_search_widgets(self):
       from tkcalendar import DateEntry
+      self.view_state = None  # a new, empty patient list
 
       # --- Outer Frame for Padding ---
       outer_frame = ttk.Frame(self.view_search_frame, style='TFrame')
@@ -651,7 +817,7 @@ class PatientRegistrationApp:
       for i in range(6):
         filter_frame.columnconfigure(i, weight=1)
 
-      # Row 0: Registration Number, Name, Phone
+      # Row 0: Registration Number, Name, Father's Name
       ttk.Label(filter_frame, text="Registration Number:", font=('Arial', 10)).grid(row=0, column=0, sticky="e", padx=(2,2), pady=3)
       self.reg_no_search_var = tk.StringVar()
       self.reg_no_search_entry = ttk.Entry(filter_frame, textvariable=self.reg_no_search_var, width=15)
@@ -662,11 +828,8 @@ class PatientRegistrationApp:
       self.name_search_entry = ttk.Entry(filter_frame, textvariable=self.name_search_var, width=15)
       self.name_search_entry.grid(row=0, column=3, sticky="w", padx=(0,12), pady=3)
       self.name_search_entry.bind("<Return>", lambda event: self.perform_search())
-
-      ttk.Label(filter_frame, text="Phone:", font=('Arial', 10)).grid(row=0, column=4, sticky="e", padx=(2,2), pady=3)
-      self.phone_search_var = tk.StringVar()
-      self.phone_search_entry = ttk.Entry(filter_frame, textvariable=self.phone_search_var, width=15)
-      self.phone_search_entry.grid(row=0, column=5, sticky="w", padx=(0,6), pady=3)
+      for entry in (self.reg_no_search_entry, self.name_search_entry):
+        entry.bind("<KeyRelease>", self._on_live_search_key)
 
       ttk.Label(filter_frame, text="Father's Name:", font=('Arial', 10)).grid(row=0, column=4, sticky="e", padx=(2,2), pady=3)
       self.father_name_search_var = tk.StringVar()
@@ -733,6 +896,27 @@ class PatientRegistrationApp:
       self.patient_type_combo.grid(row=3, column=3, sticky="w", padx=(0,12), pady=3)
       self.patient_type_combo.set("All")
 
+      ttk.Label(filter_frame, text="Name Match:", font=('Arial', 10)).grid(row=3, column=4, sticky="e", padx=(2,2), pady=3)
+      self.name_match_var = tk.StringVar(value="Contains")
+      self.name_match_combo = ttk.Combobox(
+        filter_frame, textvariable=self.name_match_var,
+        values=['Contains', 'Fuzzy', 'Sounds like'], width=15, state="readonly")
+      self.name_match_combo.grid(row=3, column=5, sticky="w", padx=(0,6), pady=3)
+
+      # Row 4: Phone, Phone Match
+      ttk.Label(filter_frame, text="Phone:", font=('Arial', 10)).grid(row=4, column=0, sticky="e", padx=(2,2), pady=3)
+      self.phone_search_var = tk.StringVar()
+      self.phone_search_entry = ttk.Entry(filter_frame, textvariable=self.phone_search_var, width=15)
+      self.phone_search_entry.grid(row=4, column=1, sticky="w", padx=(0,12), pady=3)
+      self.phone_search_entry.bind("<KeyRelease>", self._on_live_search_key)
+
+      ttk.Label(filter_frame, text="Phone Match:", font=('Arial', 10)).grid(row=4, column=2, sticky="e", padx=(2,2), pady=3)
+      self.phone_match_var = tk.StringVar(value="Contains")
+      self.phone_match_combo = ttk.Combobox(
+        filter_frame, textvariable=self.phone_match_var,
+        values=['Contains', 'Exact', 'Starts with', 'Ends with'], width=15, state="readonly")
+      self.phone_match_combo.grid(row=4, column=3, sticky="w", padx=(0,12), pady=3)
+
       # --- Button Row ---
       btn_frame = ttk.Frame(outer_frame, style='TFrame')
       btn_frame.grid(row=1, column=0, sticky="ew", pady=(8,0))
@@ -747,7 +931,10 @@ class PatientRegistrationApp:
 
       # --- Results Table ---
       columns = ("registration_number", "first_name", "last_name", "mobile_number", "gender", "age", "patient_type")
-      self.patient_tree = ttk.Treeview(self.view_search_frame, columns=columns, show="headings", selectmode="browse")
+      self.patient_tree = VirtualTreeview(
+          self.view_search_frame, columns=columns, show="headings", selectmode="browse",
+          sort_keys={"age": number_key},
+      )
       for col in columns:
         self.patient_tree.heading(col, text=col.replace('_', ' ').title(), anchor=tk.W)
         self.patient_tree.column(col, width=120, anchor=tk.W)
@@ -786,6 +973,8 @@ class PatientRegistrationApp:
       self.from_date_var.set("")
       self.to_date_var.set("")
       self.patient_type_var.set("All")
+      self.name_match_var.set("Contains")
+      self.phone_match_var.set("Contains")
 
     def create_reception_widgets(self):
         for widget in self.reception_frame.winfo_children():
@@ -800,7 +989,7 @@ class PatientRegistrationApp:
         opd_reg_frame = ttk.LabelFrame(self.reception_frame, text="2. OPD Patient Registration", padding="10")
         opd_reg_frame.grid(row=2, column=0, sticky="nsew", padx=10, pady=5)
         ttk.Button(opd_reg_frame, text="Register OPD Patient",
-                   command=lambda: self.notebook.select(self.registration_frame)).pack(pady=5)
+                   command=lambda: self._select_tab(self.registration_frame)).pack(pady=5)
         opd_card_frame = ttk.LabelFrame(self.reception_frame, text="3. OPD Patient Card", padding="10")
         opd_card_frame.grid(row=3, column=0, sticky="nsew", padx=10, pady=5)
         ttk.Button(opd_card_frame, text="Generate OPD Patient Card",
@@ -812,7 +1001,7 @@ class PatientRegistrationApp:
         enquiry_frame = ttk.LabelFrame(self.reception_frame, text="5. Patient Enquiry", padding="10")
         enquiry_frame.grid(row=5, column=0, sticky="nsew", padx=10, pady=5)
         ttk.Button(enquiry_frame, text="Search Patient Records",
-                   command=lambda: self.notebook.select(self.view_search_frame)).pack(pady=5)
+                   command=lambda: self._select_tab(self.view_search_frame)).pack(pady=5)
         self.reception_frame.columnconfigure(0, weight=1)
         self.reception_frame.rowconfigure(5, weight=1)
 
@@ -993,7 +1182,6 @@ class PatientRegistrationApp:
             for field in self.fields.values():
                 if hasattr(field, 'configure'):
                     field.configure(style='TEntry')
-            self.load_all_patients()
         else:
             messagebox.showerror("Error", f"Failed to {action_msg} patient. Please check inputs or database connection.")
 
@@ -1045,33 +1233,37 @@ class PatientRegistrationApp:
       search_entry = ttk.Entry(search_frame, textvariable=search_var, width=35)
       search_entry.pack(side=tk.LEFT, padx=5)
 
-      def load_patients(search_term=""):
-        # Fetch OPD patients not already in IPD, filtered by search term if provided
-        conn = get_db_connection()
-        patients = []
-        if conn:
-            cur = conn.cursor(dictionary=True)
-            base_query = """
-                SELECT registration_number, first_name, last_name, gender, age
-                FROM OPD_Patients
-                WHERE registration_number NOT IN (SELECT registration_number FROM IPD_Patients)
-            """
-            params = ()
-            if search_term:
-                base_query += " AND (first_name LIKE %s OR last_name LIKE %s OR registration_number LIKE %s)"
-                like = f"%{search_term}%"
-                params = (like, like, like)
-            base_query += " ORDER BY registration_number DESC"
-            cur.execute(base_query, params)
-            patients = cur.fetchall()
-            cur.close()
-            conn.close()
+      # Recent-first pages of OPD patients not yet admitted to IPD.
+      paging = {"term": "", "next_token": None}
+
+      def load_patients(search_term="", more=False):
+        if not more:
+            paging["term"] = search_term
+            paging["next_token"] = None
+        self.tasks.submit(
+            fetch_patients, paging["term"], paging["next_token"] if more else None,
+            key=tree, on_done=lambda result: show_patients(result, more),
+        )
+
+      def fetch_patients(search_term, page_token):
+        try:
+            return get_transfer_candidates("opd", search_term, page_token)
+        except ConnectionUnavailableError as e:
+            logger.error(f"Could not load OPD patients for transfer: {e}")
+            return [], None
+
+      def show_patients(result, more=False):
         # Populate the treeview
-        tree.delete(*tree.get_children())
+        if not tree.winfo_exists():
+            return
+        patients, paging["next_token"] = result
+        if not more:
+            tree.delete(*tree.get_children())
         for p in patients:
             tree.insert("", "end", values=(
                 p["registration_number"], p["first_name"], p["last_name"], p["gender"], p["age"]
             ))
+        more_button.config(state='normal' if paging["next_token"] else 'disabled')
 
       def on_search(*args):
         search_term = search_var.get().strip()
@@ -1088,9 +1280,12 @@ class PatientRegistrationApp:
       # Search and show all buttons
       ttk.Button(search_frame, text="Search", command=on_search).pack(side=tk.LEFT, padx=5)
       ttk.Button(search_frame, text="Show All", command=lambda: load_patients("")).pack(side=tk.LEFT, padx=5)
+      more_button = ttk.Button(search_frame, text="Load More", state='disabled',
+                               command=lambda: load_patients(more=True))
+      more_button.pack(side=tk.LEFT, padx=5)
       search_entry.bind("<Return>", lambda e: on_search())
 
-      # Initial load: show all patients
+      # Initial load: the most recent patients
       load_patients()
 
       def on_transfer():
@@ -1123,33 +1318,37 @@ class PatientRegistrationApp:
       search_entry = ttk.Entry(search_frame, textvariable=search_var, width=35)
       search_entry.pack(side=tk.LEFT, padx=5)
 
-      def load_patients(search_term=""):
-        # Fetch EPD patients not already in IPD, filtered by search term if provided
-        conn = get_db_connection()
-        patients = []
-        if conn:
-            cur = conn.cursor(dictionary=True)
-            base_query = """
-                SELECT registration_number, first_name, last_name, gender, age
-                FROM EPD_Patients
-                WHERE registration_number NOT IN (SELECT registration_number FROM IPD_Patients)
-            """
-            params = ()
-            if search_term:
-                base_query += " AND (first_name LIKE %s OR last_name LIKE %s OR registration_number LIKE %s)"
-                like = f"%{search_term}%"
-                params = (like, like, like)
-            base_query += " ORDER BY registration_number DESC"
-            cur.execute(base_query, params)
-            patients = cur.fetchall()
-            cur.close()
-            conn.close()
+      # Recent-first pages of EPD patients not yet admitted to IPD.
+      paging = {"term": "", "next_token": None}
+
+      def load_patients(search_term="", more=False):
+        if not more:
+            paging["term"] = search_term
+            paging["next_token"] = None
+        self.tasks.submit(
+            fetch_patients, paging["term"], paging["next_token"] if more else None,
+            key=tree, on_done=lambda result: show_patients(result, more),
+        )
+
+      def fetch_patients(search_term, page_token):
+        try:
+            return get_transfer_candidates("epd", search_term, page_token)
+        except ConnectionUnavailableError as e:
+            logger.error(f"Could not load EPD patients for transfer: {e}")
+            return [], None
+
+      def show_patients(result, more=False):
         # Populate the treeview
-        tree.delete(*tree.get_children())
+        if not tree.winfo_exists():
+            return
+        patients, paging["next_token"] = result
+        if not more:
+            tree.delete(*tree.get_children())
         for p in patients:
             tree.insert("", "end", values=(
                 p["registration_number"], p["first_name"], p["last_name"], p["gender"], p["age"]
             ))
+        more_button.config(state='normal' if paging["next_token"] else 'disabled')
 
       def on_search(*args):
         search_term = search_var.get().strip()
@@ -1165,9 +1364,12 @@ class PatientRegistrationApp:
       # Search and show all buttons
       ttk.Button(search_frame, text="Search", command=on_search).pack(side=tk.LEFT, padx=5)
       ttk.Button(search_frame, text="Show All", command=lambda: load_patients("")).pack(side=tk.LEFT, padx=5)
+      more_button = ttk.Button(search_frame, text="Load More", state='disabled',
+                               command=lambda: load_patients(more=True))
+      more_button.pack(side=tk.LEFT, padx=5)
       search_entry.bind("<Return>", lambda e: on_search())
 
-      # Initial load: show all patients
+      # Initial load: the most recent patients
       load_patients()
 
       def on_transfer():
@@ -1181,99 +1383,189 @@ class PatientRegistrationApp:
 
       ttk.Button(top, text="Transfer Selected to IPD", command=on_transfer).pack(pady=10)
 
+    def _search_criteria(self):
+      return dict(
+          registration_number=self.reg_no_search_var.get().strip(),
+          name=self.name_search_var.get().strip(),
+          father_name=self.father_name_search_var.get().strip(),
+          phone=self.phone_search_var.get().strip(),
+          department=self.dept_search_var.get().strip(),
+          town=self.town_search_var.get().strip(),
+          state=self.state_search_var.get().strip(),
+          gender=self.gender_search_var.get().strip(),
+          age=self.age_search_var.get().strip(),
+          from_date=self.from_date_var.get().strip(),
+          to_date=self.to_date_var.get().strip(),
+          patient_type=self.patient_type_var.get().strip(),
+          name_match={'Fuzzy': 'fuzzy', 'Sounds like': 'phonetic'}.get(self.name_match_var.get(), 'contains'),
+          phone_match={'Exact': 'exact', 'Starts with': 'prefix', 'Ends with': 'suffix'}.get(
+              self.phone_match_var.get(), 'contains'),
+      )
+
     def perform_search(self):
-      registration_number = self.reg_no_search_var.get().strip()
-      name = self.name_search_var.get().strip()
-      father_name = self.father_name_search_var.get().strip()
-      phone = self.phone_search_var.get().strip()
-      department = self.dept_search_var.get().strip()
-      town = self.town_search_var.get().strip()
-      state = self.state_search_var.get().strip()
-      gender = self.gender_search_var.get().strip()
-      age = self.age_search_var.get().strip()
-      from_date = self.from_date_var.get().strip()
-      to_date = self.to_date_var.get().strip()
-      patient_type = self.patient_type_var.get().strip()
-      # CHANGE: Always search all pages at once!
-      page = 1
-      page_size = 10000  # Arbitrarily large; fetch all results in one go
+      # Read the form on the Tk thread; only the query runs in the background.
+      self._cancel_live_search()
+      self._run_search(self._search_criteria())
+
+    def _run_search(self, criteria, live=False, restore=None):
+      # With restore (a _view_position()) the current rows stay until the
+      # first chunk replaces them, and restore() runs after the last one.
+      self.last_search = {"criteria": criteria, "rows": [], "complete": False}
+      _cancel_table_fill(self.patient_tree)
+      if restore is None:
+        self.patient_tree.delete(*self.patient_tree.get_children())
+      self.prev_button.config(state='disabled')
+      self.next_button.config(state='disabled')
+      self.page_label.config(text="Searching...")
+      self._start_tree_query()
+      # Keyed on the tree, so this cancels any search or page load still running.
+      self.tasks.submit(
+          self._stream_search, criteria, key=self.patient_tree,
+          on_done=lambda total: self._on_search_done(total, live, restore), on_error=self._on_tree_query_error,
+      )
 
-      try:
-        results, info_msg = search_patients(
-            registration_number=registration_number,
-            name=name,
-            father_name=father_name, 
-            phone=phone,
-            department=department,
-            town=town,
-            state=state,
-            gender=gender,
-            age=age,
-            from_date=from_date,
-            to_date=to_date,
-            patient_type=patient_type,
-            page=page,
-            page_size=page_size
-        )
-        self._update_patient_tree(results, info_msg)
-        # CHANGE: Disable pagination buttons after search
-        self.prev_button.config(state='disabled')
-        self.next_button.config(state='disabled')
-        self.page_label.config(text="All results")
-      except Exception as e:
-        import traceback
-        traceback.print_exc()
-        self.show_error(f"Search error: {e}")
-      finally:
-        self.is_loading = False
-        self.progress_bar.stop()
-        self.master.config(cursor="")
+    def _on_live_search_key(self, event=None):
+      # Debounce: only search once typing pauses for LIVE_SEARCH_DELAY_MS.
+      self._cancel_live_search()
+      self.live_search_after = self.master.after(LIVE_SEARCH_DELAY_MS, self._live_search)
 
-    def _perform_search_thread(self):
-      try:
-        results, info_msg = search_patients(
-            registration_number=self.reg_no_search_var.get().strip(),
-            name=self.name_search_var.get().strip(),
-            phone=self.phone_search_var.get().strip(),
-            department=self.dept_search_var.get().strip(),
-            town=self.town_search_var.get().strip(),
-            state=self.state_search_var.get().strip(),
-            gender=self.gender_search_var.get().strip(),
-            age=self.age_search_var.get().strip(),
-            from_date=self.from_date_var.get().strip(),
-            to_date=self.to_date_var.get().strip(),
-            patient_type=self.patient_type_var.get().strip(),
-            page=self.current_page,
-            page_size=self.page_size,
-        )
-        self.master.after(0, lambda: self._update_patient_tree(results, info_msg))
-      except Exception as e:
-        import traceback
-        traceback.print_exc()
-        self.master.after(0, self.show_error, f"Search error: {e}")
-      finally:
-        self.is_loading = False
-        self.master.after(0, self.progress_bar.stop)
-        self.master.after(0, lambda: self.master.config(cursor=""))
+    def _cancel_live_search(self):
+      if self.live_search_after is not None:
+        self.master.after_cancel(self.live_search_after)
+        self.live_search_after = None
+
+    def _live_search(self):
+      self.live_search_after = None
+      if not self.patient_tree.winfo_exists():
+        return
+      criteria = self._search_criteria()
+      if self.last_search and criteria == self.last_search["criteria"]:
+        return  # arrow keys, Shift, ... or the same search still running
+      if not any(len(criteria[f]) >= LIVE_SEARCH_MIN_CHARS for f in LIVE_SEARCH_FIELDS):
+        unfiltered = criteria["patient_type"] in ("", "All") and not any(criteria[f] for f in _FILTER_FIELDS)
+        if self.last_search and unfiltered:
+          self.load_all_patients(page=1)  # search boxes cleared: back to the full list
+        return
+      rows = self._narrowed_results(criteria)
+      if rows is None:
+        self._run_search(criteria, live=True)
+        return
+      self.tasks.cancel(self.patient_tree)
+      self.last_search = {"criteria": criteria, "rows": rows, "complete": True}
+      _fill_table(self.patient_tree, ((self._patient_tree_values(p), None) for p in rows), "patient search")
+      self._on_search_done(len(rows), live=True)
+
+    def _narrowed_results(self, criteria):
+      """
+      When the new terms only narrow the last complete search (longer name or
+      phone text, longer registration number prefix, other filters the same),
+      returns its kept rows that still match; otherwise None.
+      """
+      last = self.last_search
+      if not last or not last["complete"] or last["rows"] is None:
+        return None
+      if criteria["name_match"] != "contains" or criteria["phone_match"] != "contains":
+        return None
+      old = last["criteria"]
+      if any(criteria[k] != old[k] for k in criteria if k not in LIVE_SEARCH_FIELDS):
+        return None
+      reg, name, phone = (criteria[f].lower() for f in LIVE_SEARCH_FIELDS)
+      old_reg, old_name, old_phone = (old[f].lower() for f in LIVE_SEARCH_FIELDS)
+      if not (reg.startswith(old_reg) and old_name in name and old_phone in phone):
+        return None
+      return [
+          p for p in last["rows"]
+          if str(p['registration_number']).lower().startswith(reg)
+          and (name in (p['first_name'] or '').lower() or name in (p['last_name'] or '').lower())
+          and phone in (p['mobile_number'] or '')
+      ]
+
+    def _stream_search(self, criteria):
+      # Worker thread: hand each chunk to the Tk thread as soon as it arrives.
+      task = current_task()
+      total = 0
+      for chunk in iter_search_patients(**criteria):
+        if task.cancelled:
+            break
+        total += len(chunk)
+        self.tasks.call_soon(self._append_search_chunk, task, chunk, total)
+      return total
+
+    def _append_search_chunk(self, task, chunk, total):
+      if task.cancelled or not self.patient_tree.winfo_exists():
+        return
+      kept = self.last_search["rows"]
+      if kept is not None:
+        kept.extend(chunk)
+        if len(kept) > LIVE_SEARCH_KEEP_ROWS:
+          self.last_search["rows"] = None
+      # The first chunk replaces whatever the tree showed before the search.
+      _fill_table(
+          self.patient_tree, ((self._patient_tree_values(p), None) for p in chunk), "patient search",
+          append=total > len(chunk),
+      )
+      self.page_label.config(text=f"{total} results so far...")
+
+    def _on_search_done(self, total, live=False, restore=None):
+      self._finish_tree_query()
+      self.last_search["complete"] = True
+      if not total:
+        _cancel_table_fill(self.patient_tree)
+        self.patient_tree.delete(*self.patient_tree.get_children())
+      if restore is not None:
+        _fill_table(self.patient_tree, (), append=True, on_done=restore)
+      self.view_state = {
+          "search": self.last_search["criteria"], "loaded_at": time.monotonic(), "changes": self.view_query_changes,
+      }
+      # Search shows every match in one scrolling list, so paging is off.
+      self.prev_button.config(state='disabled')
+      self.next_button.config(state='disabled')
+      self.page_label.config(text=f"{total} results")
+      if not total and not live:
+        messagebox.showinfo("Search Results", "No patients found matching the given criteria.")
+
+    def _start_tree_query(self):
+      # A newer search or page load supersedes any query still running for the tree.
+      self.is_loading = True
+      self.tree_query_started = time.perf_counter()
+      self.view_query_changes = patient_change_count()
+      self.progress_bar.start()
+      self.master.config(cursor="wait")
+
+    def _finish_tree_query(self):
+      self.is_loading = False
+      self.progress_bar.stop()
+      self.master.config(cursor="")
+
+    def _on_tree_query_error(self, error):
+      self._finish_tree_query()
+      messagebox.showerror("Search Error", f"Search error: {error}")
+
+    @staticmethod
+    def _patient_tree_values(patient):
+      return (
+          patient['registration_number'],
+          patient['first_name'],
+          patient['last_name'],
+          patient['mobile_number'],
+          patient['gender'],
+          patient['age'] if patient['age'] is not None else 'N/A',
+          patient['patient_type'],
+      )
 
     def _update_patient_tree(self, patients, info_msg=None):
-      for item in self.patient_tree.get_children():
-        self.patient_tree.delete(item)
-      for patient in patients:
-        display_age = patient['age'] if patient['age'] is not None else 'N/A'
-        self.patient_tree.insert("", tk.END, values=(
-            patient['registration_number'],
-            patient['first_name'],
-            patient['last_name'],
-            patient['mobile_number'],
-            patient['gender'],
-            display_age,
-            patient['patient_type']
-        ))
-
-      self.page_label.config(text=f"Page {self.current_page}")
+      _fill_table(
+          self.patient_tree, ((self._patient_tree_values(p), None) for p in patients),
+          "patient list", self.tree_query_started,
+      )
+
+      if self.total_estimate:
+        pages = max(-(-self.total_estimate // self.page_size), self.current_page)
+        self.page_label.config(text=f"Page {self.current_page} of ~{pages}")
+      else:
+        self.page_label.config(text=f"Page {self.current_page}")
       self.prev_button.config(state='normal' if self.current_page > 1 else 'disabled')
-      self.next_button.config(state='normal' if len(patients) == self.page_size else 'disabled')
+      self.next_button.config(state='normal' if self.next_page_token else 'disabled')
       self.master.config(cursor="")
 
       # Show patients found/not found message
@@ -1281,39 +1573,43 @@ class PatientRegistrationApp:
         messagebox.showinfo("Search Results", info_msg)
      
     def load_all_patients(self, page=None):
-        if self.is_loading:
-            return
-        self.is_loading = True
-        if page:
-            self.current_page = page
-        for item in self.patient_tree.get_children():
-            self.patient_tree.delete(item)
-        self.progress_bar.start()
-        self.master.config(cursor="wait")
-        threading.Thread(target=self._load_all_patients_thread, daemon=True).start()
-    
-    def _load_all_patients_thread(self):
-        try:
-            patients = get_all_patients(page=self.current_page, page_size=self.page_size)
-            self.master.after(0, lambda: self._update_patient_tree(patients))
-        finally:
-            self.master.after(0, lambda: self.progress_bar.stop())
-            self.master.after(0, lambda: setattr(self, 'is_loading', False))
+        if str(getattr(self, "view_search_frame", "")) in self.tab_factories:
+            return  # not built yet; it loads on first selection
+        if page == 1:
+            self.current_page = 1
+            self.page_tokens = [None]
+            self.last_search = None  # the tree shows the listing, not a search
+        _cancel_table_fill(self.patient_tree)
+        self.patient_tree.delete(*self.patient_tree.get_children())
+        self._start_tree_query()
+        # The (estimated) total is refreshed whenever the first page loads.
+        first = self.current_page == 1
+        self.tasks.submit(
+            get_all_patients_page, self.page_tokens[self.current_page - 1], self.page_size, estimate=first,
+            key=self.patient_tree, on_done=self._on_patients_loaded, on_error=self._on_tree_query_error,
+        )
+
+    def _on_patients_loaded(self, result):
+        patients, self.next_page_token = result[:2]
+        if len(result) > 2:
+            self.total_estimate = result[2]
+        self._finish_tree_query()
+        self.view_state = {"search": None, "loaded_at": time.monotonic(), "changes": self.view_query_changes}
+        self._update_patient_tree(patients)
 
     def prev_page(self):
       if self.current_page > 1:
         self.current_page -= 1
-        if self.reg_no_search_var.get().strip() or self.name_search_var.get().strip():
-            self.perform_search()
-        else:
-            self.load_all_patients()
+        self.load_all_patients()
 
     def next_page(self):
+      # Keyset paging: the next page starts after the last row shown.
+      if not self.next_page_token:
+        return
+      del self.page_tokens[self.current_page:]
+      self.page_tokens.append(self.next_page_token)
       self.current_page += 1
-      if self.reg_no_search_var.get().strip() or self.name_search_var.get().strip():
-        self.perform_search()
-      else:
-        self.load_all_patients()
+      self.load_all_patients()
 
     def edit_selected_patient(self):
       selected = self.patient_tree.focus()
@@ -1327,7 +1623,7 @@ class PatientRegistrationApp:
       if patient_type == "OPD":
         patient = get_patient_by_reg_number(reg_no)
         if patient:
-            self.notebook.select(self.registration_frame)
+            self._select_tab(self.registration_frame)
             self.current_reg_number = reg_no
             
             # Populate registration form with patient data
@@ -1380,11 +1676,12 @@ class PatientRegistrationApp:
       elif patient_type == "EPD":
         patient = self.get_epd_patient_by_reg_number(reg_no)
         if patient:
+          self._ensure_tab(self.reception_frame)
           # Clear reception frame and create EPD form
           for widget in self.reception_frame.winfo_children():
             widget.destroy()
         
-          self.notebook.select(self.reception_frame)
+          self._select_tab(self.reception_frame)
           self.show_emergency_case_form()
 
           self.editing_epd_reg_number = reg_no
@@ -1452,17 +1749,10 @@ class PatientRegistrationApp:
         for widget in self.ipd_frame.winfo_children():
             widget.destroy()
             
-        patient = None
-        conn = get_db_connection()
-        if conn:
-            cur = conn.cursor(dictionary=True)
-            cur.execute("SELECT * FROM IPD_Patients WHERE registration_number = %s", (reg_no,))
-            patient = cur.fetchone()
-            cur.close()
-            conn.close()
+        patient = get_patient("ipd", reg_no)
         
         if patient:
-            self.notebook.select(self.ipd_frame)
+            self._select_tab(self.ipd_frame)
             self.create_ipd_form_widgets()
             
             for key, widget in self.ipd_field_widgets.items():
@@ -1770,7 +2060,6 @@ class PatientRegistrationApp:
         self.emergency_field_widgets['police_case'].config(state='readonly')
     
     def print_emergency_card(self):
-      import tkinter as tk
       from tkinter import messagebox
 
       data = getattr(self, 'last_emergency_save_data', None)
@@ -1778,118 +2067,19 @@ class PatientRegistrationApp:
         messagebox.showerror("Error", "No emergency case data has been saved yet.\nSave before printing!")
         return
 
-      # --- Window setup for A4 ---
-      a4_width_px = 793
-      a4_height_px = 1122
-
-      preview_window = tk.Toplevel(self.master)
-      preview_window.title("EPD Bed Head Ticket Print Preview")
-      preview_window.geometry(f"{a4_width_px}x{a4_height_px}")
-      preview_window.config(bg="white")
-      preview_window.resizable(False, False)
-      preview_window.grab_set()
-
-      # --- Outer Frame with margin ---
-      outer_frame = tk.Frame(preview_window, bg="white", width=a4_width_px, height=a4_height_px)
-      outer_frame.pack(expand=True, fill='both', padx=32, pady=32)
-
-      # --- Header ---
-      tk.Label(outer_frame, text="SRI RAM JANKI MEDICAL COLLEGE & HOSPITAL", font=('Arial', 22, 'bold'), bg='white').pack(anchor='center', pady=(10,0))
-      tk.Label(outer_frame, text="MUZAFFARPUR", font=('Arial', 16, 'bold'), bg='white').pack(anchor='center', pady=(0,4))
-      tk.Label(outer_frame, text="EPD PATIENT CARD", font=('Arial', 16, 'bold', 'underline'), bg='white').pack(anchor='center', pady=(0,18))
-
-      # --- Patient Info Section ---
-      info_frame = tk.Frame(outer_frame, bg="white")
-      info_frame.pack(fill='x', padx=22, pady=(0,12))
-
-      left_labels = [
-        "Reg. No.:", "Name:", "Father's/Husband's Name:", "Address:", "Town:", "Date:"
-      ]
-      right_labels = [
-        "Age:", "Gender:", "Mobile:", "Department:", "State:", "Attending Doctor:"
-      ]
-      def safe(v, default="N/A"):
-        val = data.get(v)
-        return "" if val is None or str(val).strip().lower() in ("", "none", "null", "n/a") else str(val)
-      def safe_date(v):
-        val = data.get(v)
-        try:
-            import datetime
-            if isinstance(val, datetime.date):
-                return val.strftime("%d/%m/%Y")
-            elif isinstance(val, str) and len(val) >= 10:
-                from datetime import datetime as dt
-                try:
-                    if "/" in val:
-                        return val
-                    elif "-" in val:
-                        return dt.strptime(val[:10], "%Y-%m-%d").strftime("%d/%m/%Y")
-                except Exception:
-                    return val
-            return val or ""
-        except Exception:
-            return val or ""
-      left_values = [
-        safe('registration_number'),
-        f"{safe('first_name','')} {safe('last_name','')}".strip(),
-        safe('father_name'),
-        safe('address'),
-        safe('town'),
-        safe_date('date'),
-        
-        ]
-      right_values = [
-        safe('age'),
-        safe('gender'),
-        safe('mobile_number'),
-        safe('medical_department'),
-        safe('state'),
-        safe('attending_doctor'),
-      ]
-      for i in range(len(left_labels)):
-        tk.Label(info_frame, text=left_labels[i], font=('Arial', 12, 'bold'), bg='white', anchor='w').grid(
-            row=i, column=0, sticky='w', padx=2, pady=3
-        )
-        tk.Label(info_frame, text=left_values[i], font=('Arial', 12), bg='white', anchor='w').grid(
-            row=i, column=1, sticky='w', padx=2, pady=3
-        )
-        tk.Label(info_frame, text=right_labels[i], font=('Arial', 12, 'bold'), bg='white', anchor='w').grid(
-            row=i, column=2, sticky='w', padx=16, pady=3
-        )
-        tk.Label(info_frame, text=right_values[i], font=('Arial', 12), bg='white', anchor='w').grid(
-            row=i, column=3, sticky='w', padx=2, pady=3
-        )
-
-
-      # --- Table for Clinical Notes ---
-      table_frame = tk.Frame(outer_frame, bg="white", bd=1, relief="solid")
-      table_frame.pack(fill="x", expand=False, padx=2, pady=(18,18))
-      for col, text, width in zip(range(3), ["Date/Time", "Clinical Notes", "Advice"], [20, 54, 22]):
-        tk.Label(table_frame, text=text, font=('Arial', 12, 'bold'), bg="white", borderwidth=1, relief="solid", width=width, anchor='center').grid(row=0, column=col, sticky="nsew")
-        table_frame.columnconfigure(col, weight=1)
-      for i in range(1, 8):  # 7 rows
-        for col, width in zip(range(3), [20, 54, 22]):
-            tk.Label(table_frame, text="", font=('Arial', 12), bg="white", borderwidth=1, relief="solid", width=width, anchor='w').grid(row=i, column=col, sticky="nsew")
+      layout = card_layout.epd_card(data)
 
       # --- Print Button ---
       def on_print():
        try:
         from dot_matrix_print_utils import print_epd_card_dot_matrix
-        print_epd_card_dot_matrix(self.last_emergency_save_data)
+        print_epd_card_dot_matrix(layout.data)
         messagebox.showinfo("Print", "Print job sent!")
         self.last_emergency_save_data = None  # Clear data after printing
        except Exception as e:
         messagebox.showerror("Print Error", f"Printing failed: {e}")
 
-      tk.Button(
-        outer_frame,
-        text="Print",
-        font=('Arial', 12, 'bold'),
-        command=on_print
-      ).pack(pady=(24,0))
-
-      preview_window.transient(self.master)
-      preview_window.wait_window(preview_window)
+      self._show_card_preview("EPD Bed Head Ticket Print Preview", layout, on_print)
 
     def prompt_and_generate_opd_card(self):
       from tkinter import simpledialog
@@ -1926,6 +2116,7 @@ class PatientRegistrationApp:
     # --- Transfer OPD/EPD to IPD: Always generate a new registration number ---
 
     def show_ipd_patient_form(self, prefill_opd_registration_number=None, prefill_epd_registration_number=None):
+      self._ensure_tab(self.ipd_frame)  # so selecting it below keeps this form
       import datetime
       # Clear the IPD form
       for widget in self.ipd_frame.winfo_children():
@@ -1944,9 +2135,11 @@ class PatientRegistrationApp:
       if prefill_opd_registration_number:
         patient_data = self.get_opd_patient_by_reg_number(prefill_opd_registration_number)
         previous_reg_no = prefill_opd_registration_number
+        self.ipd_transfer_source = ("opd", previous_reg_no)
       elif prefill_epd_registration_number:
         patient_data = self.get_epd_patient_by_reg_number(prefill_epd_registration_number)
         previous_reg_no = prefill_epd_registration_number
+        self.ipd_transfer_source = ("epd", previous_reg_no)
 
       if patient_data:
         mapping = {
@@ -2004,7 +2197,7 @@ class PatientRegistrationApp:
         self.ipd_field_widgets['police_case'].state(['readonly'])
 
       if hasattr(self, "notebook") and hasattr(self, "ipd_frame"):
-        self.notebook.select(self.ipd_frame)
+        self._select_tab(self.ipd_frame)
 
       if patient_data:
         msg = "Patient details copied. Previous registration number: {}".format(previous_reg_no) if previous_reg_no else "Patient details copied."
@@ -2149,45 +2342,20 @@ class PatientRegistrationApp:
       Fetch EPD patient details by registration number.
       Returns a dict of patient data, or None if not found.
       """
-      conn = get_db_connection()
-      if not conn:
-        return None
-      try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT * FROM EPD_Patients WHERE registration_number = %s", (registration_number,))
-        patient = cur.fetchone()
-        cur.close()
-        return patient
-      except Exception as e:
-        print(f"Error fetching EPD patient: {e}")
-        return None
-      finally:
-        conn.close()
+      return get_patient("epd", registration_number)
 
     def get_opd_patient_by_reg_number(self, registration_number):
       """
       Fetch OPD patient details by registration number.
       Returns a dict of patient data, or None if not found.
       """
-      conn = get_db_connection()
-      if not conn:
-        return None
-      try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT * FROM OPD_Patients WHERE registration_number = %s", (registration_number,))
-        patient = cur.fetchone()
-        cur.close()
-        return patient
-      except Exception as e:
-        print(f"Error fetching OPD patient: {e}")
-        return None
-      finally:
-        conn.close()
+      return get_patient("opd", registration_number)
 
     def create_ipd_form_widgets(self):
       # Clear existing widgets
       for widget in self.ipd_frame.winfo_children():
         widget.destroy()
+      self.ipd_transfer_source = None  # ("opd"/"epd", registration number) when admitting a transfer
 
       # Create main frame
       self.ipd_form_frame = ttk.Frame(self.ipd_frame)
@@ -2467,13 +2635,7 @@ class PatientRegistrationApp:
         messagebox.showerror("Input Error", f"Missing required fields for IPD patient: {', '.join(missing)}")
         return None
 
-      conn = get_db_connection()
-      if not conn:
-        messagebox.showerror("Database Error", "Could not connect to database.")
-        return None
-      cursor = None
       try:
-        cursor = conn.cursor()
         sql = """
             INSERT INTO IPD_Patients (
                 registration_number, first_name, last_name, father_name, abha_number, age, gender,
@@ -2504,19 +2666,23 @@ class PatientRegistrationApp:
             data.get("notes"),
             self.current_username
         )
-        cursor.execute(sql, values)
-        conn.commit()
-        ipd_id = cursor.lastrowid
+        with lease() as cursor:
+            cursor.execute(sql, values)
+            ipd_id = cursor.lastrowid
+            index_patient(cursor, "ipd", data)
+            if self.ipd_transfer_source:
+              record_ipd_transfer(cursor, *self.ipd_transfer_source, data.get("registration_number"))
+        invalidate_patient("ipd", data.get("registration_number"))
+        self.ipd_transfer_source = None
         logger.info(f"Added IPD patient: {ipd_id}, Reg: {data.get('registration_number')}")
         return ipd_id
+      except ConnectionUnavailableError:
+        messagebox.showerror("Database Error", "Could not connect to database.")
+        return None
       except Exception as e:
         logger.error(f"Error saving IPD patient: {e}")
         messagebox.showerror("Database Error", f"Error saving IPD patient: {e}")
         return None
-      finally:
-        if cursor:
-            cursor.close()
-        conn.close()
 
     def move_to_next_ipd_field(self, event):
       widget = event.widget
@@ -2558,132 +2724,42 @@ class PatientRegistrationApp:
         self.ipd_field_widgets['police_case'].config(state='readonly')
 
       self.last_saved_ipd_registration_number = None
+      self.ipd_transfer_source = None
       if self.ipd_print_button:
         self.ipd_print_button.config(state='disabled')
       self.save_ipd_button.config(text="Save IPD Patient")
       self.last_saved_ipd_registration_number = None  
 
     def show_print_preview(self):
-      import tkinter as tk
-      from tkinter import ttk, messagebox
-      import textwrap
+      from tkinter import messagebox
 
       data = self.get_opd_patient_by_reg_number(self.current_reg_number)
       if not data:
         messagebox.showerror("Print Error", "No OPD patient data found for the current registration number.\nPlease save or select a patient first.")
         return
-      def safe(key, default=""):
-        v = data.get(key, default) if data else default
-        return v if v is not None else default
-
-      a4_width_px = 793
-      a4_height_px = 1122
-      top_content_height = int(a4_height_px / 3)
+      layout = card_layout.opd_card(data)
+      self._show_card_preview("OPD Card Print Preview", layout, lambda: self._do_print_opd_card(layout.data))
 
+    def _show_card_preview(self, title, layout, on_print, wait=True):
+      """
+      Shows a card layout (see card_layout.py) on one Canvas with a Print button.
+      """
       preview = tk.Toplevel(self.master)
-      preview.title("OPD Card Print Preview")
-      preview.geometry(f"{a4_width_px}x{a4_height_px}")
+      preview.title(title)
+      preview.geometry(f"{layout.width}x{layout.height}")
       preview.config(bg="white")
       preview.resizable(False, False)
       preview.grab_set()
 
-      main_frame = tk.Frame(preview, bg="white")
-      main_frame.pack(fill="both", expand=True)
-
-      # Top 1/3rd: Actual card content
-      card_frame = tk.Frame(main_frame, bg="white", height=top_content_height)
-      card_frame.pack(fill="x", side="top")
-      card_frame.pack_propagate(False)
-
-      # --- Header Section ---
-      tk.Label(card_frame, text="अनुसूची • 6 धर्म संख्या • 10",
-             font=("Arial Unicode MS", 10), bg="white").pack(pady=(12,0))
-      tk.Label(card_frame, text="श्री राम जानकी मेडिकल कॉलेज एवं अस्पताल समस्तीपुर",
-             font=("Arial", 16,"bold"), bg="white").pack()
-      tk.Label(card_frame, text="(OPD PATIENT CARD)",
-             font=("Arial", 13, "bold"), bg="white").pack(pady=(7,0))
-      ttk.Separator(card_frame, orient="horizontal").pack(fill='x', padx=10, pady=(8, 0))
-
-      # --- Patient Info Section ---
-      info_frame = tk.Frame(card_frame, bg="white")
-      info_frame.pack(padx=16, pady=(10,4), anchor="nw")
-
-      font_label = ("Arial", 11)
-      font_value = ("Arial", 11, "bold")
-
-      row = 0
-      # Row 0: Registration No. | Abha No. | Date
-      tk.Label(info_frame, text="Registration No.", font=font_label, bg="white").grid(row=row, column=0, sticky="w")
-      tk.Label(info_frame, text=safe('registration_number'), font=font_value, bg="white").grid(row=row, column=1, sticky="w", padx=(0,18))
-      tk.Label(info_frame, text="Abha No.", font=font_label, bg="white").grid(row=row, column=2, sticky="w")
-      tk.Label(info_frame, text=safe('abha_number'), font=font_value, bg="white").grid(row=row, column=3, sticky="w", padx=(0,18))
-      tk.Label(info_frame, text="Date", font=font_label, bg="white").grid(row=row, column=4, sticky="w")
-      tk.Label(info_frame, text=safe('registration_date'), font=font_value, bg="white").grid(row=row, column=5, sticky="w")
-      row += 1
-
-      # Row 1: Patient Name | Age
-      tk.Label(info_frame, text="Patient Name:-", font=font_label, bg="white").grid(row=row, column=0, sticky="w", pady=(7,0))
-      tk.Label(info_frame, text=f"{safe('first_name','')} {safe('last_name','')}", font=font_value, bg="white").grid(row=row, column=1, sticky="w", pady=(7,0), padx=(0,18))
-      tk.Label(info_frame, text="Age: ", font=font_label, bg="white").grid(row=row, column=2, sticky="w")
-      tk.Label(info_frame, text=f"{safe('age')} M/Yrs", font=font_value, bg="white").grid(row=row, column=3, sticky="w", pady=(7,0))
-      row += 1
-
-      # Father's/Guardian/Husband Name (multi-line)
-      guardian_value = safe('father_name')
-      guardian_lines = textwrap.wrap(guardian_value, 35)
-      tk.Label(info_frame, text="Father's/Guardian/\nHusband Name: ", font=font_label, bg="white", justify="left", anchor="nw").grid(row=row, column=0, sticky="nw", pady=(7,0))
-      for idx, gline in enumerate(guardian_lines):
-        tk.Label(info_frame, text=gline, font=font_value, bg="white", justify="left", wraplength=250, anchor="nw").grid(row=row+idx, column=1, sticky="nw", pady=(7,0) if idx == 0 else (0,0), padx=(0,18))
-      tk.Label(info_frame, text="Gender: ", font=font_label, bg="white").grid(row=row, column=2, sticky="w")
-      tk.Label(info_frame, text=safe('gender'), font=font_value, bg="white").grid(row=row, column=3, sticky="w", pady=(7,0))
-      row += max(1, len(guardian_lines))
-
-      # Address (multi-line: pushes everything down)
-      address_value = " ".join([safe('address'), safe('town'), safe('state')])
-      address_lines = textwrap.wrap(address_value, 45)
-      tk.Label(info_frame, text="Address: ", font=font_label, bg="white").grid(row=row, column=0, sticky="nw", pady=(7,0))
-      for idx, aline in enumerate(address_lines):
-        tk.Label(info_frame, text=aline, font=font_value, bg="white", justify="left", wraplength=320, anchor="nw").grid(row=row+idx, column=1, sticky="nw", pady=(7,0) if idx == 0 else (0,0), padx=(0,18))
-      row += len(address_lines)
-
-      # --- Mobile and Fee: ALWAYS after last address line, aligned right ---
-      tk.Label(info_frame, text="Mobile No: ", font=font_label, bg="white").grid(row=row, column=3, sticky="w", padx=(0,8), pady=(7,0))
-      tk.Label(info_frame, text=safe('mobile_number'), font=font_value, bg="white").grid(row=row, column=4, sticky="w", pady=(7,0))
-      tk.Label(info_frame, text="निबंधन शुल्क: ", font=font_label, bg="white").grid(row=row+1, column=3, sticky="w", padx=(0,8), pady=(0,0))
-      tk.Label(info_frame, text=f"₹ {safe('registration_fee','5.00')}", font=font_value, bg="white").grid(row=row+1, column=4, sticky="w", pady=(0,0))
-
-      # --- Thin horizontal line under info ---
-      ttk.Separator(card_frame, orient="horizontal").pack(fill='x', padx=10, pady=(8,0))
-
-      # --- Left-aligned block for Weight, BP, PR, Room No. ---
-      fields_block = tk.Frame(card_frame, bg="white")
-      fields_block.pack(anchor="w", padx=10, pady=(4,0))  # Tight to separator, left aligned
-
-      labels = ["Weight :", "BP :", "PR :", "Room No. :"]
-      for i, lbl in enumerate(labels):
-        tk.Label(fields_block, text=lbl, font=("Arial", 9), bg="white", anchor="w", justify="left").grid(row=i, column=0, sticky="w", pady=(0,0), padx=(0,0))
-
-      # --- Centered Print Button Only ---
-      btn_frame = tk.Frame(main_frame, bg="white")
-      btn_frame.pack(expand=True, fill='both')
-      ttk.Button(
-        btn_frame,
-        text="Print",
-        command=lambda: self._do_print_opd_card(data),
-        width=26
-      ).pack(expand=True, anchor="center", pady=20)
-
- 
-      # --- Footer Note (always at the bottom) ---
-      footer_frame = tk.Frame(main_frame, bg="white")
-      footer_frame.pack(side='top', fill='x', pady=(2, 5))
-      ttk.Separator(footer_frame, orient="horizontal").pack(fill='x', pady=(0,1))
-      tk.Label(footer_frame, text="नोट•", font=("Arial", 12, "bold"), fg="black", bg="white", anchor="w").pack(side="left", padx=(5,0))
-      tk.Label(footer_frame, text="कृपया इस टिकट को हमेशा साथ लावें अन्यथा दवा नहीं मिलेगी ।",
-             font=("Arial Unicode MS", 10), fg="black", bg="white", anchor="w").pack(side="left", padx=(6,0))
-      
-      preview.transient(self.master)
-      preview.wait_window(preview)
+      canvas = tk.Canvas(preview, width=layout.width, height=layout.height, bg="white", highlightthickness=0)
+      canvas.pack(fill="both", expand=True)
+      layout.draw(canvas)
+      print_button = tk.Button(canvas, text="Print", font=("Arial", 12, "bold"), command=on_print, width=14)
+      canvas.create_window(*layout.button_at, window=print_button, anchor="n")
+
+      if wait:
+        preview.transient(self.master)
+        preview.wait_window(preview)
 
     def _do_print_opd_card(self, data):
       from tkinter import messagebox
@@ -2757,21 +2833,13 @@ class PatientRegistrationApp:
       show_option(options[0][0])
 
     def show_print_preview_ipd(self):
-      import tkinter as tk
       from tkinter import messagebox
 
       if not self.last_saved_ipd_registration_number:
         messagebox.showerror("Error", "No IPD patient has been saved yet. Save before printing!")
         return
 
-      patient_data = None
-      conn = get_db_connection()
-      if conn:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT * FROM IPD_Patients WHERE registration_number = %s", (self.last_saved_ipd_registration_number,))
-        patient_data = cur.fetchone()
-        cur.close()
-        conn.close()
+      patient_data = get_patient("ipd", self.last_saved_ipd_registration_number)
       if not patient_data:
         messagebox.showerror("Error", "IPD patient data not found. Cannot print.")
         return
@@ -2780,218 +2848,7 @@ class PatientRegistrationApp:
         v = patient_data.get(key, default)
         return str(v) if v is not None else default
 
-      # --- Page and margin setup for A4 ---
-      PAGE_W, PAGE_H = 794, 1123    # A4 at ~96dpi, adjust for your printer/screen
-      MARGIN = 36                   # About 0.5 inch
-      BORDER_W, BORDER_H = PAGE_W - 2*MARGIN, PAGE_H - 2*MARGIN
-
-      preview = tk.Toplevel(self.master)
-      preview.title("IPD Bed Head Ticket Print Preview")
-      preview.geometry(f"{PAGE_W}x{PAGE_H}")
-      preview.config(bg="white")
-      preview.resizable(False, False)
-      preview.grab_set()
-
-      # --- Draw the solid page border with Canvas for sharpness ---
-      border_canvas = tk.Canvas(preview, width=PAGE_W, height=PAGE_H, bg="white", highlightthickness=0)
-      border_canvas.place(x=0, y=0)
-      border_canvas.create_rectangle(MARGIN, MARGIN, PAGE_W-MARGIN, PAGE_H-MARGIN, width=2)
-
-      main_frame = tk.Frame(preview, bg="white")
-      main_frame.place(x=MARGIN, y=MARGIN, width=BORDER_W, height=BORDER_H)
-
-      # Title
-      tk.Label(main_frame, text="SRI RAM JANKI MEDICAL COLLEGE & HOSPITAL", font=("Helvetica", 18, "bold"), bg="white").place(relx=0.5, y=32, anchor="n")
-      tk.Label(main_frame, text="SAMASTIPUR", font=("Helvetica", 15, "bold"), bg="white").place(relx=0.5, y=62, anchor="n")
-      tk.Label(main_frame, text="BED HEAD TICKET", font=("Helvetica", 15, "bold"), bg="white").place(relx=0.5, y=87, anchor="n")
-      canvas_title = tk.Canvas(main_frame, width=300, height=5, bg="white", highlightthickness=0)
-      canvas_title.place(relx=0.5, y=110, anchor="n")
-      canvas_title.create_line(0, 2, 300, 2, width=2)
-
-      y0 = 130
-      x_left = 30
-      x_right = 765
-      mid = 410
-      font = ("Helvetica", 11)
-      field_height = 22
-      value_gap = 8     # vertical gap below value text before dotted line
-      line_gap = 14     # vertical gap after dotted line before next field (increase for more space)
-      section_gap = 24  # extra gap before diagnosis section
-      INNER_MARGIN = 16
-
-      # Helper to draw dotted line below a widget
-      def draw_dotted_line_below_widget(widget, x_start, x_end, y_offset=2, min_length=60):
-         widget.update_idletasks()
-         label_y = widget.winfo_y()
-         label_h = widget.winfo_height()
-         width = max(x_end - x_start, min_length)
-         dot_canvas = tk.Canvas(main_frame, width=width, height=4, bg="white", highlightthickness=0)
-         dot_canvas.place(x=x_start, y=label_y + label_h + y_offset)
-         x = 0
-         while x < width:
-          dot_canvas.create_line(x, 2, min(x+6, width), 2, fill="#333", width=1)
-          x += 10
-
-      y = y0
-
-      # 1. Ward & Side
-      label1 = tk.Label(main_frame, text="Ward:", font=font, bg="white")
-      label1.place(x=x_left, y=y)
-      value1 = tk.Label(main_frame, text=val("ward"), font=font, bg="white")
-      value1.place(x=x_left + 60, y=y)
-      label2 = tk.Label(main_frame, text="Side:", font=font, bg="white")
-      label2.place(x=mid-10, y=y)
-      value2 = tk.Label(main_frame, text=val("side"), font=font, bg="white")
-      value2.place(x=mid+50, y=y)
-      draw_dotted_line_below_widget(value1, value1.winfo_x()+90, mid-INNER_MARGIN)
-      draw_dotted_line_below_widget(value2, value2.winfo_x(), value2.winfo_x() + value2.winfo_width() + 230)
-      y += field_height + value_gap + line_gap
-
-      # 2. Year, Reg. No., Bed No.
-      label1 = tk.Label(main_frame, text="Year: ", font=font, bg="white")
-      label1.place(x=x_left, y=y)
-      value1 = tk.Label(main_frame, text=val("admission_date")[:4], font=font, bg="white")
-      value1.place(x=x_left+45, y=y)
-      label2 = tk.Label(main_frame, text="Reg. No.: ", font=font, bg="white")
-      label2.place(x=x_left+105, y=y)
-      value2 = tk.Label(main_frame, text=val("registration_number"), font=font, bg="white")
-      value2.place(x=x_left+105+100, y=y)
-      label3 = tk.Label(main_frame, text="Bed No.: ", font=font, bg="white")
-      label3.place(x=mid, y=y)
-      value3 = tk.Label(main_frame, text=val("bed_number"), font=font, bg="white")
-      value3.place(x=mid+80, y=y)
-      draw_dotted_line_below_widget(value1, value1.winfo_x()+70, x_left+95 - INNER_MARGIN)
-      draw_dotted_line_below_widget(value2, value2.winfo_x()-30, mid- INNER_MARGIN)
-      draw_dotted_line_below_widget(value3, value3.winfo_x(), value3.winfo_x() + value3.winfo_width() + 180)
-      y += field_height + value_gap + line_gap
-
-      # 3. Name, Age, Sex, Religion
-      label1 = tk.Label(main_frame, text="Name: ", font=font, bg="white")
-      label1.place(x=x_left, y=y)
-      full_name = f"{val('first_name')} {val('last_name')}"
-      value1 = tk.Label(main_frame, text=full_name, font=font, bg="white")
-      value1.place(x=x_left+52, y=y)
-      label2 = tk.Label(main_frame, text="Age: ", font=font, bg="white")
-      label2.place(x=x_left+250, y=y)
-      value2 = tk.Label(main_frame, text=val("age"), font=font, bg="white")
-      value2.place(x=x_left+250+30, y=y)
-      label3 = tk.Label(main_frame, text="Sex: ", font=font, bg="white")
-      label3.place(x=x_left+345, y=y)
-      value3 = tk.Label(main_frame, text=val("gender"), font=font, bg="white")
-      value3.place(x=x_left+350+30, y=y)
-      label4 = tk.Label(main_frame, text="Religion: ", font=font, bg="white")
-      label4.place(x=x_left+450, y=y)
-      value4 = tk.Label(main_frame, text=val("religion"), font=font, bg="white")
-      value4.place(x=x_left+450+80, y=y)
-      draw_dotted_line_below_widget(value1, value1.winfo_x()+90, x_left+250-INNER_MARGIN)
-      draw_dotted_line_below_widget(value2, value2.winfo_x(), x_left+240-INNER_MARGIN)
-      draw_dotted_line_below_widget(value3, value3.winfo_x(), x_left+350- INNER_MARGIN)
-      draw_dotted_line_below_widget(value4, value4.winfo_x(), value4.winfo_x() + value4.winfo_width() + 130)
-      y += field_height + value_gap + line_gap
-
-      # 4. Father's/Husband's Name
-      label1 = tk.Label(main_frame, text="Father’s / Husband’s Name: ", font=font, bg="white")
-      label1.place(x=x_left, y=y)
-      value1 = tk.Label(main_frame, text=val("father_name"), font=font, bg="white")
-      value1.place(x=x_left+200, y=y)
-      draw_dotted_line_below_widget(value1, value1.winfo_x()+220, value1.winfo_x() + value1.winfo_width() + 700)
-      y += field_height + value_gap + line_gap
-
-      # 5. Mother's Name
-      label1 = tk.Label(main_frame, text="Mother’s Name: ", font=font, bg="white")
-      label1.place(x=x_left, y=y)
-      value1 = tk.Label(main_frame, text=val("mother_name"), font=font, bg="white")
-      value1.place(x=x_left+120, y=y)
-      draw_dotted_line_below_widget(value1, value1.winfo_x()+140, value1.winfo_x() + value1.winfo_width() + 700)
-      y += field_height + value_gap + line_gap
-
-      # 6. Village/Mohalla, P.O.
-      label1 = tk.Label(main_frame, text="Village/Mohalla: ", font=font, bg="white")
-      label1.place(x=x_left, y=y)
-      value1 = tk.Label(main_frame, text=val("address"), font=font, bg="white")
-      value1.place(x=x_left+135, y=y)
-      label2 = tk.Label(main_frame, text="P.O.: ", font=font, bg="white")
-      label2.place(x=x_left+280, y=y)
-      value2 = tk.Label(main_frame, text=val("post_office"), font=font, bg="white")
-      value2.place(x=x_left+280+45, y=y)
-      draw_dotted_line_below_widget(value1, value1.winfo_x()+140, x_left+280- INNER_MARGIN)
-      draw_dotted_line_below_widget(value2, value2.winfo_x(), value2.winfo_x() + value2.winfo_width() + 300)
-      y += field_height + value_gap + line_gap
-
-      # 7. P.S., Distt.
-      label1 = tk.Label(main_frame, text="P.S.: ", font=font, bg="white")
-      label1.place(x=x_left, y=y)
-      value1 = tk.Label(main_frame, text=val("ps"), font=font, bg="white")
-      value1.place(x=x_left+50, y=y)
-      label2 = tk.Label(main_frame, text="Distt.: ", font=font, bg="white")
-      label2.place(x=x_left+200, y=y)
-      value2 = tk.Label(main_frame, text=val("town"), font=font, bg="white")
-      value2.place(x=x_left+200+45, y=y)
-      draw_dotted_line_below_widget(value1, value1.winfo_x()+80, x_left+200- INNER_MARGIN)
-      draw_dotted_line_below_widget(value2, value2.winfo_x(), value2.winfo_x() + value2.winfo_width() + 350)
-      y += field_height + value_gap + line_gap
-
-      # 8. Date & Time of Admission, Discharge
-      label1 = tk.Label(main_frame, text="Date & Time of Admission: ", font=font, bg="white")
-      label1.place(x=x_left, y=y)
-      value1 = tk.Label(main_frame, text=val("admission_date"), font=font, bg="white")
-      value1.place(x=x_left+200, y=y)
-      label2 = tk.Label(main_frame, text="Date & Time of Discharge: ", font=font, bg="white")
-      label2.place(x=mid, y=y)
-      value2 = tk.Label(main_frame, text=val("discharge_date"), font=font, bg="white")
-      value2.place(x=mid+190, y=y)
-      draw_dotted_line_below_widget(value1, value1.winfo_x()+230, mid-INNER_MARGIN)
-      draw_dotted_line_below_widget(value2, value2.winfo_x(), value2.winfo_x() + value2.winfo_width() + 20)
-      y += field_height + value_gap + line_gap
-
-      # 9. Result & Advice
-      label1 = tk.Label(main_frame, text="Result & Advice: ", font=font, bg="white")
-      label1.place(x=x_left, y=y)
-      value1 = tk.Label(main_frame, text=val("notes"), font=font, bg="white")
-      value1.place(x=x_left+120, y=y)
-      draw_dotted_line_below_widget(value1, value1.winfo_x()+150, value1.winfo_x() + value1.winfo_width() + 700)
-      y += field_height + value_gap + section_gap
-
-      diag_font = ("Helvetica", 11, "bold")
-      tk.Label(main_frame, text="Diagnosis (a) Provisional", font=diag_font, bg="white").place(x=x_left, y=y)
-      tk.Label(main_frame, text=val("diagnosis_provisional"), font=font, bg="white").place(x=x_left+180, y=y)
-      y += 18
-      tk.Label(main_frame, text="(b) Final", font=diag_font, bg="white").place(x=x_left+60, y=y)
-      tk.Label(main_frame, text=val("diagnosis_final"), font=font, bg="white").place(x=x_left+180, y=y)
-      y += 18
-      tk.Label(main_frame, text="(c) ICD X", font=diag_font, bg="white").place(x=x_left+60, y=y)
-      tk.Label(main_frame, text=val("diagnosis_icdx"), font=font, bg="white").place(x=x_left+180, y=y)
-      y += 30
-
-      # --- Clinical Notes Box: Only one rectangle, one horizontal line under headers ---
-      table_top = y
-      table_left = x_left
-      table_width = x_right - x_left - 4*INNER_MARGIN
-      table_height = 230
-
-      # Header positions (adjust as needed for alignment)
-      col_date = 0
-      col_notes = 130
-      col_advice = 420
-
-      table_canvas = tk.Canvas(main_frame, width=table_width, height=table_height, bg="white", highlightthickness=0)
-      table_canvas.place(x=table_left, y=table_top)
-
-      # Draw the single outer border
-      table_canvas.create_rectangle(0, 0, table_width, table_height, width=2)
-
-      # Draw the header line
-      table_canvas.create_line(0, 32, table_width, 32, width=2)
-
-      # Draw vertical column lines (from header line to bottom, not above)
-      table_canvas.create_line(col_notes, 0, col_notes, table_height, width=2)
-      table_canvas.create_line(col_advice, 0, col_advice, table_height, width=2)
-
-      # Draw headers
-      table_font = ("Helvetica", 12, "bold")
-      table_canvas.create_text(8, 16, text="Date", font=table_font, anchor="w")
-      table_canvas.create_text(col_notes+8, 16, text="Clinical Notes", font=table_font, anchor="w")
-      table_canvas.create_text(col_advice+8, 16, text="Advice", font=table_font, anchor="w")
+      layout = card_layout.ipd_bed_head_ticket(patient_data)
 
       def do_print():
         from dot_matrix_print_utils import print_ipd_bed_head_ticket
@@ -3022,12 +2879,8 @@ class PatientRegistrationApp:
         print_ipd_bed_head_ticket(print_data)
         messagebox.showinfo("Print", "Print job sent!")
 
-      btnf = tk.Frame(main_frame, bg="white")
-      btnf.place(relx=0.5, y=table_top+table_height+20, anchor="n")
-      tk.Button(btnf, text="Print", font=("Arial", 12, "bold"), command=do_print, width=14).pack()
+      self._show_card_preview("IPD Bed Head Ticket Print Preview", layout, do_print, wait=False)
 
-      preview.transient(self.master)
-      preview.wait_window(preview)
 
 class UserManagementWindow:
     def __init__(self, parent):
@@ -3054,7 +2907,7 @@ class UserManagementWindow:
         
         # User list with only essential columns
         columns = ("username", "password", "date_created", "role")
-        self.user_tree = ttk.Treeview(left_frame, columns=columns, show="headings", height=20)
+        self.user_tree = VirtualTreeview(left_frame, columns=columns, show="headings", height=20)
         
         # Configure column headings
         self.user_tree.heading("username", text="Username")
@@ -3135,30 +2988,27 @@ class UserManagementWindow:
     
     def refresh_user_list(self):
         # Clear existing items
-        for item in self.user_tree.get_children():
-            self.user_tree.delete(item)
+        self.user_tree.delete(*self.user_tree.get_children())
         
         # Get users from database
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor(dictionary=True)
-            try:
+        try:
+            with lease(dictionary=True) as cursor:
                 cursor.execute("SELECT username, plain_password, created_at, role FROM users")
                 users = cursor.fetchall()
-                
-                for user in users:
-                    # Format the date to show only date and time (no seconds)
-                    created_at = user['created_at'].strftime("%Y-%m-%d %H:%M") if user['created_at'] else ""
-                    
-                    self.user_tree.insert("", tk.END, values=(
-                        user['username'],
-                        user['plain_password'],
-                        created_at,
-                        user['role']
-                    ))
-            finally:
-                cursor.close()
-                conn.close()
+        except ConnectionUnavailableError as e:
+            logger.error(f"Could not load users: {e}")
+            return
+
+        for user in users:
+            # Format the date to show only date and time (no seconds)
+            created_at = user['created_at'].strftime("%Y-%m-%d %H:%M") if user['created_at'] else ""
+
+            self.user_tree.insert("", tk.END, values=(
+                user['username'],
+                user['plain_password'],
+                created_at,
+                user['role']
+            ))
     
     def on_user_select(self, event):
         selected_items = self.user_tree.selection()
@@ -3227,31 +3077,25 @@ class UserManagementWindow:
         selected_tabs = [tab for tab, var in self.tab_vars.items() if var.get()]
         
         # Update user in database
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            try:
-                import bcrypt
-                hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        try:
+            import bcrypt
+            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            with lease() as cursor:
                 cursor.execute("""
                     UPDATE users 
                     SET password_hash = %s, plain_password = %s, role = %s 
                     WHERE username = %s
                 """, (hashed_password, password, role, username))
-                conn.commit()
-                
-                # Update tab permissions
-                update_user_sections(username, selected_tabs)
-                
-                messagebox.showinfo("Success", "User updated successfully!")
-                self.refresh_user_list()
-                self.clear_form()
-            except Exception as e:
-                conn.rollback()
-                messagebox.showerror("Error", f"Failed to update user: {str(e)}")
-            finally:
-                cursor.close()
-                conn.close()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to update user: {str(e)}")
+            return
+
+        # Update tab permissions
+        update_user_sections(username, selected_tabs)
+
+        messagebox.showinfo("Success", "User updated successfully!")
+        self.refresh_user_list()
+        self.clear_form()
     
     def delete_user(self):
         selected_items = self.user_tree.selection()
@@ -3491,13 +3335,16 @@ class SupplyMedicineSection:
             messagebox.showerror("Error", "Failed to record supply. Check your database or inputs.")
 
     def refresh_table_from_db(self):
-        for item in self.table.get_children():
-            self.table.delete(item)
-        conn = get_db_connection()
-        if conn:
-            cursor = None
-            try:
-                cursor = conn.cursor()
+        started = time.perf_counter()
+        get_runner().submit(
+            self._load_rows, key=self.table,
+            on_done=lambda rows: _fill_table(self.table, rows, "supply records", started),
+        )
+
+    def _load_rows(self):
+        rows = []
+        try:
+            with lease(readonly=True) as cursor:
                 query = """
                     SELECT m.name, s.department, s.quantity, s.supply_date, s.purchase_id, p.expiry_date
                     FROM medicine_supplies s
@@ -3507,38 +3354,37 @@ class SupplyMedicineSection:
                     LIMIT 40
                 """
                 cursor.execute(query)
-                rows = cursor.fetchall()
-                today = datetime.date.today()
-                for rec in rows:
-                    name, department, quantity, date, batch_id, expiry = rec
-                    if expiry:
-                        exp_date = expiry if isinstance(expiry, datetime.date) else datetime.datetime.strptime(str(expiry), "%Y/%m/%d").date()
-                        days_left = (exp_date - today).days
-                        expiry_str = exp_date.strftime("%d/%m/%Y")
-                    else:
-                        days_left = "?"
-                        expiry_str = ""
-                    # Color settings
-                    if isinstance(days_left, int):
-                        if days_left < 0:
-                            tag = 'expired'
-                        elif days_left <= 15:
-                            tag = 'red'
-                        elif days_left <= 30:
-                            tag = 'blue'
-                        else:
-                            tag = 'black'
-                    else:
-                        tag = 'black'
-                    self.table.insert(
-                        "", "end",
-                        values=(name, department, quantity, date.strftime("%d/%m/%Y"), batch_id or "", expiry_str, days_left),
-                        tags=(tag,)
-                    )
-            finally:
-                if cursor:
-                    cursor.close()
-                conn.close()
+                records = cursor.fetchall()
+        except ConnectionUnavailableError as e:
+            logger.error(f"Could not load medicine supplies: {e}")
+            return rows
+        today = datetime.date.today()
+        for rec in records:
+            name, department, quantity, date, batch_id, expiry = rec
+            if expiry:
+                exp_date = expiry if isinstance(expiry, datetime.date) else datetime.datetime.strptime(str(expiry), "%Y/%m/%d").date()
+                days_left = (exp_date - today).days
+                expiry_str = exp_date.strftime("%d/%m/%Y")
+            else:
+                days_left = "?"
+                expiry_str = ""
+            # Color settings
+            if isinstance(days_left, int):
+                if days_left < 0:
+                    tag = 'expired'
+                elif days_left <= 15:
+                    tag = 'red'
+                elif days_left <= 30:
+                    tag = 'blue'
+                else:
+                    tag = 'black'
+            else:
+                tag = 'black'
+            rows.append((
+                (name, department, quantity, date.strftime("%d/%m/%Y"), batch_id or "", expiry_str, days_left),
+                tag
+            ))
+        return rows
     
     
 
@@ -3583,7 +3429,10 @@ class PurchaseMedicineSection:
         # --- Purchase Records Table ---
         ttk.Label(frame, text="Purchase Records", font=("Arial", 13, "bold")).pack(anchor="w", pady=(15, 5))
         columns = ("Medicine", "Supplier", "Quantity", "Date", "Expiry Date", "Batch Number")
-        self.table = ttk.Treeview(frame, columns=columns, show="headings", height=7)
+        self.table = VirtualTreeview(
+            frame, columns=columns, show="headings", height=7,
+            sort_keys={"Quantity": number_key, "Date": date_key, "Expiry Date": date_key},
+        )
         style = ttk.Style()
         style.configure("mystyle.Treeview.Heading", font=('Arial', 11, 'bold'))
         style.configure("mystyle.Treeview", font=('Arial', 11), rowheight=26)
@@ -3655,11 +3504,15 @@ class PurchaseMedicineSection:
 
     def refresh_table_from_db(self):
         # Fetch from DB, not self.records!
-        conn = get_db_connection()
-        if conn:
-            cursor = None
-            try:
-                cursor = conn.cursor()
+        started = time.perf_counter()
+        get_runner().submit(
+            self._load_rows, key=self.table,
+            on_done=lambda rows: _fill_table(self.table, rows, "purchase records", started),
+        )
+
+    def _load_rows(self):
+        try:
+            with lease(readonly=True) as cursor:
                 query = """
                     SELECT m.name, p.supplier, p.quantity, p.purchase_date, p.expiry_date, p.batch_number
                     FROM medicine_purchases p
@@ -3667,27 +3520,21 @@ class PurchaseMedicineSection:
                     ORDER BY p.purchase_date DESC
                 """
                 cursor.execute(query)
-                rows = cursor.fetchall()
-                # Clear table
-                for item in self.table.get_children():
-                    self.table.delete(item)
-                # Insert all rows
-                for rec in rows:
-                    self.table.insert(
-                        "", "end",
-                        values=(
-                            rec[0],
-                            rec[1],
-                            rec[2],
-                            rec[3].strftime("%d/%m/%Y") if rec[3] else "",
-                            rec[4].strftime("%d/%m/%Y") if rec[4] else "",
-                            rec[5] or ""
-                        )
-                    )
-            finally:
-                if cursor:
-                    cursor.close()
-                conn.close()
+                records = cursor.fetchall()
+        except ConnectionUnavailableError as e:
+            logger.error(f"Could not load medicine purchases: {e}")
+            return []
+        return [
+            ((
+                rec[0],
+                rec[1],
+                rec[2],
+                rec[3].strftime("%d/%m/%Y") if rec[3] else "",
+                rec[4].strftime("%d/%m/%Y") if rec[4] else "",
+                rec[5] or ""
+            ), None)
+            for rec in records
+        ]
 
 
 class ExpiryMedicineSection:
@@ -3729,16 +3576,18 @@ class ExpiryMedicineSection:
         self.refresh_table_from_db()
 
     def refresh_table_from_db(self):
-        for item in self.table.get_children():
-            self.table.delete(item)
+        filter_text = self.search_var.get().strip().lower()
+        started = time.perf_counter()
+        get_runner().submit(
+            self._load_rows, filter_text, key=self.table,
+            on_done=lambda rows: _fill_table(self.table, rows, "expiry table", started),
+        )
 
+    def _load_rows(self, filter_text):
+        rows = []
         today = datetime.datetime.now().date()
-        filter_text = self.search_var.get().strip().lower()
-        conn = get_db_connection()
-        if conn:
-            cursor = None
-            try:
-                cursor = conn.cursor()
+        try:
+            with lease(readonly=True) as cursor:
                 # Query for medicines with in-stock quantity >= 1 and expiry date
                 query = """
                     SELECT m.name, p.supplier, p.expiry_date, p.medicine_id,
@@ -3753,32 +3602,28 @@ class ExpiryMedicineSection:
                 """.format("AND LOWER(m.name) LIKE %s" if filter_text else "")
                 params = (f"%{filter_text}%",) if filter_text else ()
                 cursor.execute(query, params)
-                rows = cursor.fetchall()
-                for rec in rows:
-                    name, supplier, expiry, med_id, purchased, supplied = rec
-                    stock = (purchased or 0) - (supplied or 0)
-                    if stock >= 1 and expiry:
-                        exp_date = expiry if isinstance(expiry, datetime.date) else datetime.datetime.strptime(str(expiry), "%d/%m/%Y").date()
-                        days_left = (exp_date - today).days
-                        expiry_str = exp_date.strftime("%d/%m/%Y")
-                        # Color settings
-                        if days_left < 0:
-                            tag = 'expired'
-                        elif days_left <= 15:
-                            tag = 'red'
-                        elif days_left <= 30:
-                            tag = 'blue'
-                        else:
-                            tag = 'black'
-                        self.table.insert(
-                            "", "end",
-                            values=(name, supplier, expiry_str, days_left),
-                            tags=(tag,)
-                        )
-            finally:
-                if cursor:
-                    cursor.close()
-                conn.close()
+                records = cursor.fetchall()
+        except ConnectionUnavailableError as e:
+            logger.error(f"Could not load medicine expiry table: {e}")
+            return rows
+        for rec in records:
+            name, supplier, expiry, med_id, purchased, supplied = rec
+            stock = (purchased or 0) - (supplied or 0)
+            if stock >= 1 and expiry:
+                exp_date = expiry if isinstance(expiry, datetime.date) else datetime.datetime.strptime(str(expiry), "%d/%m/%Y").date()
+                days_left = (exp_date - today).days
+                expiry_str = exp_date.strftime("%d/%m/%Y")
+                # Color settings
+                if days_left < 0:
+                    tag = 'expired'
+                elif days_left <= 15:
+                    tag = 'red'
+                elif days_left <= 30:
+                    tag = 'blue'
+                else:
+                    tag = 'black'
+                rows.append(((name, supplier, expiry_str, days_left), tag))
+        return rows
 
 class StockMedicineSection:
     def __init__(self, parent):
@@ -3822,16 +3667,17 @@ class StockMedicineSection:
         self.refresh_table_from_db()
 
     def refresh_table_from_db(self):
-        # Clear table
-        for item in self.table.get_children():
-            self.table.delete(item)
-
         filter_text = self.search_var.get().strip().lower()
-        conn = get_db_connection()
-        if conn:
-            cursor = None
-            try:
-                cursor = conn.cursor()
+        started = time.perf_counter()
+        get_runner().submit(
+            self._load_rows, filter_text, key=self.table,
+            on_done=lambda rows: _fill_table(self.table, rows, "stock table", started),
+        )
+
+    def _load_rows(self, filter_text):
+        rows = []
+        try:
+            with lease(prepared=True, readonly=True) as cursor:
                 # Get all medicines or filter by search
                 if filter_text:
                     cursor.execute("SELECT id, name FROM medicines WHERE LOWER(name) LIKE %s ORDER BY name ASC", (f"%{filter_text}%",))
@@ -3853,15 +3699,10 @@ class StockMedicineSection:
                         tag = 'orange'
                     else:
                         tag = 'black'
-                    self.table.insert(
-                        "", "end",
-                        values=(name, purchased, supplied, stock),
-                        tags=(tag,)
-                    )
-            finally:
-                if cursor:
-                    cursor.close()
-                conn.close()
+                    rows.append(((name, purchased, supplied, stock), tag))
+        except ConnectionUnavailableError as e:
+            logger.error(f"Could not load medicine stock: {e}")
+        return rows
 
 class ReportingFrame(ttk.Frame):
     from database import get_all_users, save_cash_in_hand
@@ -3943,7 +3784,10 @@ class ReportingFrame(ttk.Frame):
         ttk.Button(action_frame, text="Print", command=self.print_report, width=12).pack(side="left", padx=8)
 
         columns = ("Date", "Username", "Department", "OPD", "IPD", "EPD", "Total", "Cash in Hand", "Used Cash in Hand", "Paid OPD Count")
-        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=16)
+        self.tree = VirtualTreeview(
+            self, columns=columns, show="headings", height=16,
+            sort_keys={"Date": date_key, **{col: number_key for col in columns[3:]}},
+        )
         for col in columns:
           self.tree.heading(col, text=col, anchor="center")
           self.tree.column(col, width=120 if col not in ["Department", "Used Cash in Hand", "Paid OPD Count"] else 180, anchor="center")
@@ -3972,17 +3816,16 @@ class ReportingFrame(ttk.Frame):
       from_date_db = to_yyyy_mm_dd(from_date)
       to_date_db = to_yyyy_mm_dd(to_date)
 
-      for item in self.tree.get_children():
-        self.tree.delete(item)
+      self.tree.delete(*self.tree.get_children())
 
-      conn = get_db_connection()
-      if not conn:
-        messagebox.showerror("Database Error", "Could not connect to database.")
-        return
-
-      try:
-        cursor = conn.cursor(dictionary=True)
+      get_runner().submit(
+          self._query_report, from_date_db, to_date_db, user_filter, dept_filter,
+          key=self.tree, on_done=self._show_report, on_error=self._on_report_error,
+      )
 
+    def _query_report(self, from_date_db, to_date_db, user_filter, dept_filter):
+      rows = []
+      with lease(dictionary=True, readonly=True) as cursor:
         # OPD
         where_opd = ["registration_date BETWEEN %s AND %s"]
         params_opd = [from_date_db, to_date_db]
@@ -3995,7 +3838,11 @@ class ReportingFrame(ttk.Frame):
         cursor.execute(f"""
             SELECT registration_date AS date, 
                    created_by AS username,
-                   medical_department AS department, COUNT(*) AS cnt
+                   medical_department AS department, COUNT(*) AS cnt,
+                   SUM(CASE WHEN payment_status = 'Paid' AND registration_fee >= 5.00
+                       THEN 1 ELSE 0 END) AS paid_cnt,
+                   COALESCE(SUM(CASE WHEN payment_status = 'Paid' AND registration_fee >= 5.00
+                       THEN registration_fee END), 0) AS paid_total
             FROM OPD_Patients
             WHERE {' AND '.join(where_opd)}
             GROUP BY registration_date, username, department
@@ -4040,8 +3887,22 @@ class ReportingFrame(ttk.Frame):
         """, params_epd)
         epd_rows = cursor.fetchall()
 
+        # Cash in hand for every user and day in the range, in one query
+        where_cash = ["date BETWEEN %s AND %s"]
+        params_cash = [from_date_db, to_date_db]
+        if user_filter != "All":
+            where_cash.append("username = %s")
+            params_cash.append(user_filter)
+        cursor.execute(f"""
+            SELECT username, date, cash_in_hand
+            FROM user_cash_log
+            WHERE {' AND '.join(where_cash)}
+        """, params_cash)
+        cash_log = {(row['username'], str(row['date'])): row['cash_in_hand'] for row in cursor.fetchall()}
+
         # Aggregate, handling None
         report = {}
+        paid = {}
         for row in opd_rows:
             key = (
                 str(row['date']) if row['date'] is not None else 'Unknown',
@@ -4051,6 +3912,7 @@ class ReportingFrame(ttk.Frame):
             if key not in report:
                 report[key] = {'OPD': 0, 'IPD': 0, 'EPD': 0}
             report[key]['OPD'] += row['cnt']
+            paid[key] = (row['paid_total'] or 0, row['paid_cnt'] or 0)
         for row in ipd_rows:
             key = (
                 str(row['date']) if row['date'] is not None else 'Unknown',
@@ -4078,33 +3940,29 @@ class ReportingFrame(ttk.Frame):
          total = counts['OPD'] + counts['IPD'] + counts['EPD']
          row = [ut.to_ddmmyyyy(date), user, dept, counts['OPD'], counts['IPD'], counts['EPD'], total]
 
-         date_db = ut.convert_to_db_date_format(date)
-         cash_in_hand = get_cash_in_hand(user, date_db)
+         cash_in_hand = None if user == "admin" else cash_log.get((user, date))
          row.append(cash_in_hand if cash_in_hand is not None else "")
 
          # --- Used Cash / Paid OPD ---
-         used_cash = 0.0
-         paid_opd_count = 0
-         conn2 = get_db_connection()
-         if conn2:
-           cur2 = conn2.cursor()
-           cur2.execute("""
-            SELECT COUNT(*), COALESCE(SUM(registration_fee),0)
-            FROM OPD_Patients
-            WHERE registration_date = %s AND created_by = %s AND medical_department = %s
-                AND payment_status = 'Paid' AND registration_fee >= 5.00
-            """, (date, user, dept))
-           paid_opd_count, used_cash = cur2.fetchone()
-           cur2.close()
-           conn2.close()
+         used_cash, paid_opd_count = paid.get((date, user, dept), (0, 0))
          row.append(used_cash)
          row.append(paid_opd_count)
 
-         self.tree.insert("", "end", values=tuple(row))
-        if not report:
-            self.tree.insert("", "end", values=("No data found", "", "", "", "", "", ""))
-      finally:
-        conn.close()
+         rows.append(tuple(row))
+      return rows
+
+    def _show_report(self, rows):
+      self.tree.delete(*self.tree.get_children())
+      for row in rows:
+        self.tree.insert("", "end", values=row)
+      if not rows:
+        self.tree.insert("", "end", values=("No data found", "", "", "", "", "", ""))
+
+    def _on_report_error(self, error):
+      if isinstance(error, ConnectionUnavailableError):
+        messagebox.showerror("Database Error", "Could not connect to database.")
+      else:
+        messagebox.showerror("Report Error", f"Could not load report: {error}")
 
     
 
@@ -4124,75 +3982,89 @@ class ReportingFrame(ttk.Frame):
   
       import tkinter.filedialog as fd
       from tkinter import messagebox
-      import os
-      import csv
 
       filetypes = [("CSV or MDB files", "*.csv *.mdb"), ("All files", "*.*")]
       file_path = fd.askopenfilename(title="Select import file", filetypes=filetypes)
       if not file_path:
         return
+      if not file_path.lower().endswith((".csv", ".mdb")):
+        messagebox.showerror("Invalid File", "Please select a CSV or MDB file.")
+        return
+
+      self.show_progress_dialog()
+      get_runner().submit(
+          self._import_file, file_path, patient_type,
+          on_done=self._on_import_done,
+          on_error=lambda error: self._on_import_error(error, file_path),
+      )
 
-      imported = 0
-      errors = 0
+    def _import_file(self, file_path, patient_type):
+      # Runs on a worker thread; results and errors are reported on the Tk thread.
+      import csv
+      import database
+
+      rows = []
       error_msgs = []
 
-      try:
-        if file_path.lower().endswith(".csv"):
-            with open(file_path, newline='', encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    result, err = self._import_patient_row(row, patient_type)
-                    if result:
-                        imported += 1
-                    else:
-                        errors += 1
-                        error_msgs.append(err)
-        elif file_path.lower().endswith(".mdb"):
-            try:
-                import pyodbc
-            except ImportError:
-                messagebox.showerror("Missing Dependency", "pyodbc is required for MDB import.")
-                return
-            conn_str = (
-                r"DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};"
-                f"DBQ={file_path};"
-            )
-            try:
-                mdb_conn = pyodbc.connect(conn_str)
-                cur = mdb_conn.cursor()
-                table_map = {"OPD": "OPD_Patients", "IPD": "IPD_Patients", "EPD": "EPD_Patients"}
-                cur.execute(f"SELECT * FROM {table_map[patient_type]}")
-                columns = [col[0] for col in cur.description]
-                for row_vals in cur.fetchall():
-                    row = dict(zip(columns, row_vals))
-                    result, err = self._import_patient_row(row, patient_type)
-                    if result:
-                        imported += 1
-                    else:
-                        errors += 1
-                        error_msgs.append(err)
-                cur.close()
-                mdb_conn.close()
-            except Exception as e:
-                messagebox.showerror("MDB Import Error", str(e))
-                return
+      def import_row(row):
+        args, err = self._clean_import_row(row, patient_type)
+        if args is None:
+            error_msgs.append(err)
         else:
-            messagebox.showerror("Invalid File", "Please select a CSV or MDB file.")
-            return
-      except Exception as e:
-        messagebox.showerror("Import Error", str(e))
-        return
+            rows.append(args)
 
+      if file_path.lower().endswith(".csv"):
+        with open(file_path, newline='', encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                import_row(row)
+      else:
+        import pyodbc
+        conn_str = (
+            r"DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};"
+            f"DBQ={file_path};"
+        )
+        mdb_conn = pyodbc.connect(conn_str)
+        try:
+            cur = mdb_conn.cursor()
+            table_map = {"OPD": "OPD_Patients", "IPD": "IPD_Patients", "EPD": "EPD_Patients"}
+            cur.execute(f"SELECT * FROM {table_map[patient_type]}")
+            columns = [col[0] for col in cur.description]
+            for row_vals in cur.fetchall():
+                import_row(dict(zip(columns, row_vals)))
+            cur.close()
+        finally:
+            mdb_conn.close()
+
+      add_bulk = {
+          "OPD": database.add_opd_patients_bulk,
+          "IPD": database.add_ipd_patients_bulk,
+          "EPD": database.add_epd_patients_bulk,
+      }[patient_type]
+      outcomes = add_bulk(rows) if rows else []
+      error_msgs.extend(err for _reg, err in outcomes if err)
+      imported = len(outcomes) - sum(1 for _reg, err in outcomes if err)
+      return imported, len(error_msgs), error_msgs
+
+    def _on_import_done(self, result):
+      self.close_progress_dialog()
+      imported, errors, error_msgs = result
       msg = f"Imported: {imported}\nErrors: {errors}"
       if errors:
         msg += f"\nFirst error: {error_msgs[0]}"
       messagebox.showinfo("Import Result", msg)
 
-    def start_import_in_background(self):
-        threading.Thread(target=self.import_data, daemon=True).start()
+    def _on_import_error(self, error, file_path):
+      self.close_progress_dialog()
+      if isinstance(error, ImportError):
+        messagebox.showerror("Missing Dependency", "pyodbc is required for MDB import.")
+      elif file_path.lower().endswith(".mdb"):
+        messagebox.showerror("MDB Import Error", str(error))
+      else:
+        messagebox.showerror("Import Error", str(error))
 
-    def _import_patient_row(self, row, patient_type):
-      import database
+    def _clean_import_row(self, row, patient_type):
+      # Returns (args for add_*_patient, "") or (None, error). Registration
+      # numbers and duplicates are handled by the bulk insert.
       import utils as ut
       import re
       import datetime
@@ -4279,16 +4151,7 @@ class ReportingFrame(ttk.Frame):
             args["registration_date"] = clean_date(args.get("registration_date"))
             if not args.get("created_by"):
                 args["created_by"] = self.current_user
-            if not args.get("registration_number"):
-                args["registration_number"] = database.get_next_registration_number("opd")
-            # Check for duplicate reg no
-            if args["registration_number"]:
-                existing = database.get_patient_by_reg_number(args["registration_number"])
-                if existing:
-                    return False, f"Duplicate registration_number {args['registration_number']}"
-            result = database.add_opd_patient(**args)
-            if result:
-                return True, ""
+            return args, ""
         elif patient_type == "IPD":
             fields = [
                 "registration_number", "first_name", "last_name", "father_name", "abha_number",
@@ -4319,23 +4182,7 @@ class ReportingFrame(ttk.Frame):
             args["notes"] = clean_nullable_str(args.get("notes"))
             if not args.get("created_by"):
                 args["created_by"] = self.current_user
-            if not args.get("registration_number"):
-                args["registration_number"] = database.get_next_registration_number("ipd")
-            # Check for duplicate reg no
-            if args["registration_number"]:
-                conn = database.get_db_connection()
-                if conn:
-                    try:
-                        cur = conn.cursor()
-                        cur.execute("SELECT COUNT(*) FROM IPD_Patients WHERE registration_number=%s", (args["registration_number"],))
-                        if cur.fetchone()[0] > 0:
-                            return False, f"Duplicate registration_number {args['registration_number']}"
-                    finally:
-                        cur.close()
-                        conn.close()
-            result = database.add_ipd_patient(**args)
-            if result:
-                return True, ""
+            return args, ""
         elif patient_type == "EPD":
             fields = [
                 "registration_number", "first_name", "last_name", "father_name", "abha_number",
@@ -4371,26 +4218,10 @@ class ReportingFrame(ttk.Frame):
             args["date"] = clean_date(args.get("date"))
             if not args.get("created_by"):
                 args["created_by"] = self.current_user
-            if not args.get("registration_number"):
-                args["registration_number"] = database.get_next_registration_number("epd")
-            # Check for duplicate reg no
-            if args["registration_number"]:
-                conn = database.get_db_connection()
-                if conn:
-                    try:
-                        cur = conn.cursor()
-                        cur.execute("SELECT COUNT(*) FROM EPD_Patients WHERE registration_number=%s", (args["registration_number"],))
-                        if cur.fetchone()[0] > 0:
-                            return False, f"Duplicate registration_number {args['registration_number']}"
-                    finally:
-                        cur.close()
-                        conn.close()
-            result = database.add_epd_patient(**args)
-            if result:
-                return True, ""
-        return False, f"Failed to add row (maybe duplicate or missing required fields): {row}"
+            return args, ""
+        return None, f"Unknown patient type {patient_type}"
       except Exception as e:
-        return False, str(e)
+        return None, str(e)
       
     def show_progress_dialog(self):
         self.progress_dialog = tk.Toplevel(self)
@@ -4422,14 +4253,7 @@ class ReportingFrame(ttk.Frame):
         messagebox.showerror("Invalid Type", "Please select OPD, IPD, or EPD.")
         return
 
-      self.show_progress_dialog()
-      threading.Thread(target=self._run_import_with_progress, args=(patient_type,), daemon=True).start()
-
-    def _run_import_with_progress(self, patient_type):
-      try:
-        self.import_data(patient_type)
-      finally:
-        self.after(0, self.close_progress_dialog)
+      self.import_data(patient_type)
 
     def print_report(self):
         print_win = tk.Toplevel(self)
@@ -4544,6 +4368,7 @@ class ReportingFrame(ttk.Frame):
 
 
 def main():
+    create_tables()
     root = tk.Tk()
     app = PatientRegistrationApp(root)
     root.protocol("WM_DELETE_WINDOW", app.close_app)
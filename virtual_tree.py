@@ -0,0 +1,418 @@
+import datetime
+import tkinter as tk
+from tkinter import ttk
+
+# A drop-in ttk.Treeview for long flat tables (patient results, reports,
+# purchase history, users). Rows live in plain Python lists and only the
+# rows that fit on screen exist as Tk items, so loading, clearing or
+# scrolling 50,000 rows costs about the same as 30. Materialised items use
+# the virtual row id as their iid, so identify_row(), tag colours and
+# bindings on the widget work as before.
+
+BINDTAG = "VirtualTreeview"
+WHEEL_UNITS = 3
+
+
+def _convert(value):
+    # ttk returns numeric strings as ints from item(iid); do the same.
+    try:
+        return int(str(value))
+    except ValueError:
+        return str(value)
+
+
+def _sort_key(value):
+    try:
+        return (0, float(value), "")
+    except (TypeError, ValueError):
+        return (1, 0.0, str(value).lower())
+
+
+def number_key(value):
+    """
+    sort_keys entry for numeric columns (ages, counts, amounts); blanks and
+    text sort after the numbers.
+    """
+    try:
+        return (0, float(str(value).replace(",", "")), "")
+    except ValueError:
+        return (1, 0.0, str(value).lower())
+
+
+def date_key(value):
+    """
+    sort_keys entry for dd/mm/yyyy date columns (yyyy-mm-dd also works);
+    blanks and text sort after the dates.
+    """
+    text = str(value).strip()
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return (0, datetime.datetime.strptime(text[:10], fmt).toordinal(), "")
+        except ValueError:
+            continue
+    return (1, 0, text.lower())
+
+
+def _items(items):
+    if len(items) == 1 and isinstance(items[0], (tuple, list)):
+        return tuple(items[0])
+    return items
+
+
+class VirtualTreeview(ttk.Treeview):
+    """
+    ttk.Treeview for flat tables ("headings" rows without children) that
+    materialises only the visible rows. insert/delete/get_children/item/
+    selection/focus/see/yview behave like the Treeview versions; clicking a
+    heading sorts by that column unless sortable=False. sort_keys maps
+    columns to a key function (number_key, date_key); other columns sort
+    numbers numerically and the rest as text.
+    """
+
+    def __init__(self, master=None, sortable=True, sort_keys=None, **kw):
+        self._yscrollcommand = kw.pop("yscrollcommand", None)
+        super().__init__(master, **kw)
+        self._sortable = sortable
+        self._sort_keys = dict(sort_keys or {})
+        self._ids = []
+        self._values = []
+        self._tags = []
+        self._pos = {}
+        self._next_id = 0
+        self._top = 0
+        self._shown = []
+        self._selected = set()
+        self._focus = ""
+        self._notified = ()
+        self._sorted = (None, False)
+        self._after = None
+        self._install_bindings()
+
+    def _install_bindings(self):
+        # Our tag runs before the instance bindings so duplicate
+        # <<TreeviewSelect>> events from re-rendering never reach them.
+        self.bindtags((BINDTAG,) + tuple(t for t in self.bindtags() if t != BINDTAG))
+        handlers = {
+            "<<TreeviewSelect>>": lambda w, e: w._on_select(),
+            "<Configure>": lambda w, e: w._schedule(),
+            "<Destroy>": lambda w, e: w._cancel_render(),
+            "<ButtonPress-1>": lambda w, e: w._on_click(e),
+            "<MouseWheel>": lambda w, e: w._wheel(-WHEEL_UNITS if e.delta > 0 else WHEEL_UNITS),
+            "<Button-4>": lambda w, e: w._wheel(-WHEEL_UNITS),
+            "<Button-5>": lambda w, e: w._wheel(WHEEL_UNITS),
+            "<Up>": lambda w, e: w._move_focus(-1),
+            "<Down>": lambda w, e: w._move_focus(1),
+            "<Prior>": lambda w, e: w._move_focus(-w._visible_rows()),
+            "<Next>": lambda w, e: w._move_focus(w._visible_rows()),
+            "<Home>": lambda w, e: w._move_focus(-len(w._ids)),
+            "<End>": lambda w, e: w._move_focus(len(w._ids)),
+        }
+        # Registered on the root window so the handlers outlive this widget.
+        root = self._root()
+        if root.bind_class(BINDTAG):
+            return
+        for sequence, handler in handlers.items():
+            root.bind_class(BINDTAG, sequence, lambda e, h=handler: VirtualTreeview._dispatch(e, h))
+
+    @staticmethod
+    def _dispatch(event, handler):
+        widget = event.widget
+        if not isinstance(widget, VirtualTreeview):
+            return None
+        return handler(widget, event)
+
+    # --- rows ---
+
+    def insert(self, parent, index, iid=None, **kw):
+        if iid is None:
+            iid = f"v{self._next_id}"
+            self._next_id += 1
+        elif self._index_of(iid) is not None:
+            raise tk.TclError(f'Item {iid} already exists')
+        values = tuple(kw.get("values") or ())
+        tags = kw.get("tags") or ()
+        tags = (tags,) if isinstance(tags, str) else tuple(tags)
+        if index == tk.END or int(index) >= len(self._ids):
+            if self._pos is not None:
+                self._pos[iid] = len(self._ids)
+            self._ids.append(iid)
+            self._values.append(values)
+            self._tags.append(tags)
+        else:
+            index = max(0, int(index))
+            self._ids.insert(index, iid)
+            self._values.insert(index, values)
+            self._tags.insert(index, tags)
+            self._pos = None
+        self._schedule()
+        return iid
+
+    def delete(self, *items):
+        items = set(_items(items))
+        if not items:
+            return
+        if len(items) >= len(self._ids) and all(i in items for i in self._ids):
+            self._ids, self._values, self._tags = [], [], []
+            self._pos = {}
+            self._top = 0
+        else:
+            keep = [i for i, iid in enumerate(self._ids) if iid not in items]
+            self._ids = [self._ids[i] for i in keep]
+            self._values = [self._values[i] for i in keep]
+            self._tags = [self._tags[i] for i in keep]
+            self._pos = None
+        self._selected -= items
+        if self._focus in items:
+            self._focus = ""
+        self._schedule()
+
+    def get_children(self, item=None):
+        return () if item else tuple(self._ids)
+
+    def exists(self, item):
+        return self._index_of(item) is not None
+
+    def index(self, item):
+        position = self._index_of(item)
+        if position is None:
+            raise tk.TclError(f'Item {item} not found')
+        return position
+
+    def item(self, item, option=None, **kw):
+        position = self.index(item)
+        if kw:
+            if "values" in kw:
+                self._values[position] = tuple(kw["values"] or ())
+            if "tags" in kw:
+                tags = kw["tags"] or ()
+                self._tags[position] = (tags,) if isinstance(tags, str) else tuple(tags)
+            if item in self._shown:
+                super().item(item, **kw)
+            return None
+        values, tags = self._values[position], self._tags[position]
+        if option is not None:
+            if option == "values":
+                return tuple(_convert(v) for v in values) or ""
+            if option == "tags":
+                return tags or ""
+            return 0 if option == "open" else ""
+        return {
+            "text": "", "image": "", "open": 0,
+            "values": [_convert(v) for v in values] or "",
+            "tags": list(tags) or "",
+        }
+
+    def _index_of(self, item):
+        if self._pos is None:
+            self._pos = {iid: i for i, iid in enumerate(self._ids)}
+        return self._pos.get(item)
+
+    # --- selection and focus ---
+
+    def _capture(self):
+        # Fold the clicks on materialised rows into the virtual state.
+        if not self._shown:
+            return
+        shown = set(self._shown)
+        real = {i for i in super().selection() if self._index_of(i) is not None}
+        self._selected = {i for i in self._selected if i not in shown} | real
+        focus = super().focus()
+        if focus and self._index_of(focus) is not None:
+            self._focus = focus
+
+    def selection(self):
+        self._capture()
+        return tuple(sorted(self._selected, key=self._index_of))
+
+    def selection_set(self, *items):
+        self._selected = {i for i in _items(items) if self._index_of(i) is not None}
+        self._apply_selection()
+
+    def selection_add(self, *items):
+        self._capture()
+        self._selected |= {i for i in _items(items) if self._index_of(i) is not None}
+        self._apply_selection()
+
+    def selection_remove(self, *items):
+        self._capture()
+        self._selected -= set(_items(items))
+        self._apply_selection()
+
+    def _apply_selection(self):
+        super().selection_set([i for i in self._shown if i in self._selected])
+        self.event_generate("<<TreeviewSelect>>")
+
+    def focus(self, item=None):
+        if item is None:
+            self._capture()
+            return self._focus if self._index_of(self._focus) is not None else ""
+        self._focus = item
+        if item in self._shown:
+            super().focus(item)
+        return None
+
+    def see(self, item):
+        position = self.index(item)
+        visible = self._visible_rows()
+        if position < self._top:
+            self._top = position
+        elif position >= self._top + visible:
+            self._top = position - visible + 1
+        else:
+            return
+        self._render()
+
+    def _on_select(self):
+        # Re-rendering re-selects rows in Tk; only pass on real changes.
+        selection = self.selection()
+        if selection == self._notified:
+            return "break"
+        self._notified = selection
+        return None
+
+    def _on_click(self, event):
+        if event.state & 0x0005:  # Shift or Control extends the selection
+            return
+        if self.identify_region(event.x, event.y) in ("cell", "tree"):
+            self._selected = {i for i in self._selected if i in self._shown}
+
+    def _move_focus(self, step):
+        if not self._ids:
+            return "break"
+        current = self._index_of(self.focus())
+        position = 0 if current is None else max(0, min(len(self._ids) - 1, current + step))
+        iid = self._ids[position]
+        self.see(iid)
+        self.focus(iid)
+        self.selection_set(iid)
+        return "break"
+
+    # --- sorting ---
+
+    def heading(self, column, option=None, **kw):
+        if self._sortable and "text" in kw and "command" not in kw:
+            kw["command"] = lambda: self.sort_by(column)
+        return super().heading(column, option, **kw)
+
+    def sort_by(self, column, reverse=None):
+        """
+        Sorts the rows by one column with its sort_keys function; by
+        default a second call on the same column reverses the order.
+        """
+        if reverse is None:
+            last_column, last_reverse = self._sorted
+            reverse = not last_reverse if last_column == column else False
+        self._sorted = (column, reverse)
+        self._capture()
+        col = list(self["columns"]).index(column)
+        sort_key = self._sort_keys.get(column, _sort_key)
+        order = sorted(
+            range(len(self._ids)),
+            key=lambda i: sort_key(self._values[i][col] if col < len(self._values[i]) else ""),
+            reverse=reverse,
+        )
+        self._ids = [self._ids[i] for i in order]
+        self._values = [self._values[i] for i in order]
+        self._tags = [self._tags[i] for i in order]
+        self._pos = None
+        self._render()
+
+    # --- scrolling ---
+
+    def configure(self, cnf=None, **kw):
+        if isinstance(cnf, dict):
+            kw = {**cnf, **kw}
+            cnf = None
+        if "yscrollcommand" in kw:
+            self._yscrollcommand = kw.pop("yscrollcommand")
+            self._notify_scroll()
+            if not kw:
+                return None
+        return super().configure(cnf, **kw)
+
+    config = configure
+
+    def yview(self, *args):
+        if not args:
+            return self._fractions()
+        visible = self._visible_rows()
+        if args[0] == "moveto":
+            self._top = int(float(args[1]) * len(self._ids) + 0.5)
+        elif args[0] == "scroll":
+            step = visible if str(args[2]).startswith("page") else 1
+            self._top += int(args[1]) * step
+        self._render()
+        return None
+
+    def _wheel(self, units):
+        # "break" keeps the Treeview class binding from also scrolling the
+        # materialised rows, which _render would then snap back.
+        self.yview("scroll", units, "units")
+        return "break"
+
+    def yview_moveto(self, fraction):
+        self.yview("moveto", fraction)
+
+    def yview_scroll(self, number, what):
+        self.yview("scroll", number, what)
+
+    def _fractions(self):
+        total = len(self._ids)
+        if not total:
+            return (0.0, 1.0)
+        return (self._top / total, min(total, self._top + len(self._shown)) / total)
+
+    def _notify_scroll(self):
+        command = self._yscrollcommand
+        if not command:
+            return
+        first, last = self._fractions()
+        if callable(command):
+            command(first, last)
+        else:
+            self.tk.call(*self.tk.splitlist(command), first, last)
+
+    # --- rendering ---
+
+    def _visible_rows(self):
+        height = self.winfo_height()
+        if height <= 1:
+            return max(1, int(self.cget("height")))
+        bbox = self.bbox(self._shown[0]) if self._shown else None
+        if bbox:
+            header, row_height = bbox[1], bbox[3]
+        else:
+            row_height = int(ttk.Style(self).lookup(self.cget("style") or "Treeview", "rowheight") or 20)
+            header = row_height
+        return max(1, (height - header) // max(1, row_height))
+
+    def _schedule(self):
+        if self._after is None:
+            self._after = self.after_idle(self._render)
+
+    def _cancel_render(self):
+        if self._after is not None:
+            self.after_cancel(self._after)
+            self._after = None
+
+    def _render(self):
+        self._cancel_render()
+        if not self.winfo_exists():
+            return
+        self._capture()
+        visible = self._visible_rows()
+        self._top = max(0, min(self._top, len(self._ids) - visible))
+        window = self._ids[self._top:self._top + visible]
+        if window or self._shown:
+            real = super().get_children()
+            if real:
+                super().delete(*real)
+            for offset, iid in enumerate(window):
+                position = self._top + offset
+                super().insert("", "end", iid=iid, values=self._values[position], tags=self._tags[position])
+            self._shown = window
+            super().selection_set([i for i in window if i in self._selected])
+            if self._focus in window:
+                super().focus(self._focus)
+            super().yview_moveto(0)
+        self._notify_scroll()